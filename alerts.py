@@ -0,0 +1,376 @@
+# alerts.py - alert rules on newly written risk scores, and alert delivery
+#
+# Usage:
+#   python alerts.py dispatch                  # deliver pending alerts once
+#   python alerts.py listen --port 8099        # local webhook receiver that logs alerts
+#
+# Every writer of RiskScores (scoring.submit_observations, calculate_risk_batch
+# and through it the scheduler and ingest.py) calls evaluate() in the same
+# transaction. Each new score is checked against the visit's AlertState row
+# (migrations/009_alerts.sql), never against RiskScores history:
+#   high_risk   the score reached SEPSIS_ALERT_HIGH_RISK while the previous one was below
+#   rising      the score is SEPSIS_ALERT_RISE above the lowest score of the
+#               last SEPSIS_ALERT_RISE_HOURS hours
+#   no_vitals   the visit's newest vitals are SEPSIS_ALERT_NO_VITALS_HOURS old
+# A rule fires at most once per SEPSIS_ALERT_COOLDOWN_HOURS per visit
+# (no_vitals: once per gap). Alerts are written to Alerts and handed to the
+# notifier after commit by dispatch(): the app for its own submissions and the
+# "Notify Physician" button, the scheduler for everything else and for retries.
+#
+# SEPSIS_ALERT_NOTIFIER selects the notifier: "log" (default), an http(s)://
+# webhook URL (JSON POST), smtp://host:port/?from=..&to=a@x,b@y, or
+# "module:attribute" naming a notifier object (anything with send(alert)) or a
+# factory returning one.
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import smtplib
+import urllib.request
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from psycopg2.extras import Json, execute_values
+
+from db import db_session
+from queries import HIGH_RISK_MIN
+from telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+AlertRules = namedtuple("AlertRules", "high_risk rise rise_hours no_vitals_hours cooldown_hours")
+
+RULES = AlertRules(
+    high_risk=float(os.environ.get("SEPSIS_ALERT_HIGH_RISK", HIGH_RISK_MIN)),
+    rise=float(os.environ.get("SEPSIS_ALERT_RISE", "0.2")),
+    rise_hours=float(os.environ.get("SEPSIS_ALERT_RISE_HOURS", "6")),
+    no_vitals_hours=float(os.environ.get("SEPSIS_ALERT_NO_VITALS_HOURS", "4")),
+    cooldown_hours=float(os.environ.get("SEPSIS_ALERT_COOLDOWN_HOURS", "4")),
+)
+NOTIFIER = os.environ.get("SEPSIS_ALERT_NOTIFIER", "log")
+# Seconds within which a repeated "Notify Physician" click for a visit is ignored
+MANUAL_COOLDOWN = 60
+DISPATCH_BATCH = 100
+MAX_ATTEMPTS = 5
+# Seconds a dispatcher holds the alerts it claimed; unsent ones are picked up
+# again after that if it died mid-batch (above batch size * notifier timeout)
+CLAIM_SECONDS = int(os.environ.get("SEPSIS_ALERT_CLAIM_SECONDS", "1200"))
+
+Alert = namedtuple("Alert", "alert_id visit_id rule score message created_at")
+
+# Ensure a state row per visit, lock it and return it with the visit's newest
+# vitals time, in one round trip. Parameters: (sorted visit_id list,)
+LOCK_STATE_SQL = """
+    WITH state AS (
+        INSERT INTO AlertState AS s (visit_id)
+        SELECT unnest(%s::int[])
+        ON CONFLICT (visit_id) DO UPDATE SET visit_id = s.visit_id
+        RETURNING s.visit_id, s.last_score, s.last_scored_at, s.window_at, s.window_score, s.last_alerts
+    )
+    SELECT state.*, f.vitals_at
+    FROM state LEFT JOIN VisitFeatures f ON f.visit_id = state.visit_id
+"""
+
+UPDATE_STATE_SQL = """
+    UPDATE AlertState AS s
+    SET last_score = v.last_score, last_scored_at = v.last_scored_at,
+        window_at = v.window_at, window_score = v.window_score, last_alerts = v.last_alerts
+    FROM (VALUES %s) AS v(visit_id, last_score, last_scored_at, window_at, window_score, last_alerts)
+    WHERE s.visit_id = v.visit_id
+"""
+UPDATE_STATE_TEMPLATE = "(%s, %s::real, %s::timestamp, %s::timestamp[], %s::real[], %s::jsonb)"
+
+INSERT_ALERTS_SQL = """
+    INSERT INTO Alerts (visit_id, rule, score, message, created_at) VALUES %s
+    RETURNING alert_id, visit_id, rule, score, message, created_at
+"""
+
+MANUAL_ALERT_SQL = """
+    INSERT INTO Alerts (visit_id, rule, score, message, raised_by, created_at)
+    SELECT %(visit_id)s, 'manual', %(score)s, %(message)s, %(raised_by)s, LOCALTIMESTAMP
+    WHERE NOT EXISTS (
+        SELECT 1 FROM Alerts
+        WHERE visit_id = %(visit_id)s AND rule = 'manual'
+          AND created_at > LOCALTIMESTAMP - %(cooldown)s * interval '1 second'
+    )
+    RETURNING alert_id
+"""
+
+# Claim the oldest undelivered alerts that no other dispatcher holds, for
+# claim_seconds, and return them with what a notification needs. Committed
+# before anything is sent, so no row lock or connection is held during delivery.
+CLAIM_ALERTS_SQL = """
+    UPDATE Alerts AS a
+    SET claimed_until = LOCALTIMESTAMP + %(claim_seconds)s * interval '1 second'
+    FROM (
+        SELECT alert_id FROM Alerts
+        WHERE delivered_at IS NULL AND attempts < %(max_attempts)s
+          AND (claimed_until IS NULL OR claimed_until < LOCALTIMESTAMP)
+          AND (%(visit_ids)s::int[] IS NULL OR visit_id = ANY(%(visit_ids)s::int[]))
+        ORDER BY created_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ) c, Visits vi
+    WHERE a.alert_id = c.alert_id AND vi.visit_id = a.visit_id
+    RETURNING a.alert_id, a.visit_id, vi.patient_id, vi.location, a.rule, a.score, a.message,
+              a.raised_by, a.created_at
+"""
+
+
+def evaluate_visit(state, scores, rules=RULES):
+    """
+    Apply the rules to one visit's new scores, [(score, generated_at)] in time
+    order, starting from state = (last_score, last_scored_at, window_at,
+    window_score, last_alerts, vitals_at) as stored in AlertState.
+
+    Returns (new state without vitals_at, [(rule, score, message, at)]).
+    Scores not newer than last_scored_at are ignored.
+    """
+    last_score, last_at, window_at, window_score, last_alerts, vitals_at = state
+    window = deque(zip(window_at or [], window_score or []))
+    alerted = {rule: datetime.fromisoformat(at) for rule, at in (last_alerts or {}).items()}
+    rise_span = timedelta(hours=rules.rise_hours)
+    cooldown = timedelta(hours=rules.cooldown_hours)
+    raised = []
+
+    for score, at in scores:
+        if last_at is not None and at <= last_at:
+            continue
+        fired = []
+        if score >= rules.high_risk and (last_score is None or last_score < rules.high_risk):
+            fired.append(("high_risk", f"Risk score {score:.0%} reached the high-risk band ({rules.high_risk:.0%})"))
+
+        # window holds (at, score) with increasing scores, so its head is the
+        # minimum of the rise window
+        while window and window[0][0] < at - rise_span:
+            window.popleft()
+        if window and score - window[0][1] >= rules.rise:
+            fired.append(("rising", f"Risk score rose from {window[0][1]:.0%} to {score:.0%} "
+                                    f"within {rules.rise_hours:g}h"))
+        while window and window[-1][1] >= score:
+            window.pop()
+        window.append((at, score))
+
+        if vitals_at is not None and at - vitals_at >= timedelta(hours=rules.no_vitals_hours):
+            if alerted.get("no_vitals", datetime.min) < vitals_at:
+                fired.append(("no_vitals", f"No vitals recorded for {(at - vitals_at).total_seconds() / 3600:.1f}h"))
+
+        for rule, message in fired:
+            previous = alerted.get(rule)
+            if rule != "no_vitals" and previous is not None and at - previous < cooldown:
+                continue
+            alerted[rule] = at
+            raised.append((rule, score, message, at))
+        last_score, last_at = score, at
+
+    new_state = (
+        last_score, last_at, [at for at, _ in window], [score for _, score in window],
+        {rule: at.isoformat() for rule, at in alerted.items()},
+    )
+    return new_state, raised
+
+
+@traced("alerts.evaluate")
+def evaluate(conn, scored, rules=RULES):
+    """
+    Run the rules on newly written scores, [(visit_id, score, generated_at)],
+    updating AlertState and inserting the resulting Alerts rows on conn
+    (committing is left to the caller). Returns the new alerts as Alert tuples.
+    """
+    by_visit = {}
+    for visit_id, score, generated_at in sorted(scored, key=lambda s: (s[0], s[2])):
+        by_visit.setdefault(visit_id, []).append((score, generated_at))
+    if not by_visit:
+        return []
+
+    with conn.cursor() as cur:
+        # Sorted ids lock state rows in a fixed order, so concurrent writers can't deadlock
+        cur.execute(LOCK_STATE_SQL, (sorted(by_visit),))
+        states = {row[0]: row[1:] for row in cur.fetchall()}
+
+        updates, new_alerts = [], []
+        for visit_id, scores in by_visit.items():
+            state, raised = evaluate_visit(states[visit_id], scores, rules)
+            if state[1] != states[visit_id][1]:
+                updates.append((visit_id, *state[:4], Json(state[4])))
+            new_alerts.extend((visit_id, *alert) for alert in raised)
+
+        if updates:
+            execute_values(cur, UPDATE_STATE_SQL, updates, template=UPDATE_STATE_TEMPLATE, page_size=1000)
+        if not new_alerts:
+            return []
+        rows = execute_values(cur, INSERT_ALERTS_SQL, new_alerts, page_size=1000, fetch=True)
+    return [Alert(*row) for row in rows]
+
+
+def raise_manual_alert(conn, visit_id, raised_by, score=None, message=None):
+    """
+    Record a clinician-raised alert for visit_id on conn. Returns the alert_id,
+    or None if the same visit was already escalated within MANUAL_COOLDOWN seconds.
+    """
+    message = message or f"{raised_by} requests a physician review"
+    with conn.cursor() as cur:
+        cur.execute(MANUAL_ALERT_SQL, {
+            "visit_id": visit_id, "score": score, "message": message,
+            "raised_by": raised_by, "cooldown": MANUAL_COOLDOWN,
+        })
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+# ------------------------------
+# Notifiers
+# ------------------------------
+class LogNotifier:
+    """
+    Writes alerts to the log; the default when no delivery channel is configured.
+    """
+
+    def send(self, alert):
+        logger.warning("ALERT %(rule)s patient %(patient_id)s (visit %(visit_id)s, %(location)s): %(message)s", alert)
+
+
+class WebhookNotifier:
+    """
+    POSTs each alert as JSON to url; any non-2xx response counts as a failure.
+    """
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(alert, default=str).encode(),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class SmtpNotifier:
+    """
+    Emails each alert to recipients through an SMTP server without authentication
+    (a hospital relay, or a local stand-in such as python -m aiosmtpd).
+    """
+
+    def __init__(self, host, port, sender, recipients, timeout=10.0):
+        self.host, self.port = host, port
+        self.sender, self.recipients = sender, recipients
+        self.timeout = timeout
+
+    def send(self, alert):
+        message = EmailMessage()
+        message["Subject"] = f"Sepsis DSS alert: {alert['rule']} - patient {alert['patient_id']}"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(f"{alert['message']}\n\nVisit {alert['visit_id']}, location {alert['location']}, "
+                            f"raised {alert['created_at']}")
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+def get_notifier(spec=NOTIFIER):
+    """
+    Notifier for a SEPSIS_ALERT_NOTIFIER value (see the module comment).
+    """
+    if spec == "log":
+        return LogNotifier()
+    if spec.startswith(("http://", "https://")):
+        return WebhookNotifier(spec)
+    if spec.startswith("smtp://"):
+        url = urlparse(spec)
+        query = parse_qs(url.query)
+        recipients = [r for value in query.get("to", []) for r in value.split(",") if r]
+        if not recipients:
+            raise ValueError("smtp notifier needs ?to=<address>")
+        sender = query.get("from", ["sepsis-dss@localhost"])[0]
+        return SmtpNotifier(url.hostname or "localhost", url.port or 25, sender, recipients)
+    module, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Unknown alert notifier {spec!r}")
+    notifier = getattr(importlib.import_module(module), attribute)
+    return notifier if hasattr(notifier, "send") else notifier()
+
+
+def dispatch(notifier=None, visit_ids=None, limit=DISPATCH_BATCH, max_attempts=MAX_ATTEMPTS):
+    """
+    Deliver up to limit undelivered alerts (only those of visit_ids, if given)
+    through notifier (default: SEPSIS_ALERT_NOTIFIER). The alerts are claimed
+    in one short transaction, sent with no transaction or connection held, and
+    marked in a second one. Failed deliveries are retried by later calls, up
+    to max_attempts times. Returns (delivered, failed).
+    """
+    notifier = notifier or get_notifier()
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute(CLAIM_ALERTS_SQL, {
+            "visit_ids": list(visit_ids) if visit_ids is not None else None,
+            "limit": limit, "max_attempts": max_attempts, "claim_seconds": CLAIM_SECONDS,
+        })
+        columns = [desc[0] for desc in cur.description]
+        alerts = sorted((dict(zip(columns, row)) for row in cur.fetchall()), key=lambda a: a["created_at"])
+    if not alerts:
+        return 0, 0
+
+    delivered, failed = [], []
+    for alert in alerts:
+        try:
+            notifier.send(alert)
+        except Exception as e:
+            logger.warning("Delivering alert %d failed: %s", alert["alert_id"], e)
+            failed.append((alert["alert_id"], f"{type(e).__name__}: {e}"[:500]))
+        else:
+            delivered.append(alert["alert_id"])
+
+    with db_session() as conn, conn.cursor() as cur:
+        if delivered:
+            cur.execute("""
+                UPDATE Alerts SET delivered_at = LOCALTIMESTAMP, attempts = attempts + 1, claimed_until = NULL
+                WHERE alert_id = ANY(%s)
+            """, (delivered,))
+        if failed:
+            execute_values(cur, """
+                UPDATE Alerts AS a SET attempts = a.attempts + 1, last_error = v.error, claimed_until = NULL
+                FROM (VALUES %s) AS v(alert_id, error)
+                WHERE a.alert_id = v.alert_id
+            """, failed)
+    return len(delivered), len(failed)
+
+
+class _WebhookReceiver(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        logger.info("Received alert: %s", body.decode(errors="replace"))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver sepsis alerts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dispatch_cmd = commands.add_parser("dispatch", help="deliver pending alerts once")
+    dispatch_cmd.add_argument("--limit", type=int, default=DISPATCH_BATCH)
+    listen = commands.add_parser("listen", help="log alerts POSTed to a local webhook")
+    listen.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "dispatch":
+        delivered, failed = dispatch(limit=args.limit)
+        logger.info("Delivered %d alerts, %d failed", delivered, failed)
+    elif args.command == "listen":
+        logger.info("Listening on http://localhost:%d/ (SEPSIS_ALERT_NOTIFIER=http://localhost:%d/)",
+                    args.port, args.port)
+        HTTPServer(("localhost", args.port), _WebhookReceiver).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
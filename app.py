@@ -1,95 +1,29 @@
 # app.py - Streamlit Sepsis DSS starter template
 
 import streamlit as st
-import psycopg2
 import hashlib
 from datetime import datetime
-import joblib
-import pandas as pd
-
-# Load ML model (with preprocessing pipeline included)
-model = joblib.load("ML_model_development/sepsis_model.pkl")
-
-def calculate_risk(visit_id):
-    """
-    Pull features for a given visit_id, preprocess, and predict sepsis risk probability.
-    """
-    # SQL to fetch latest vitals/labs and metadata
-    conn_calc = get_connection()
-    conn_calc = get_connection()
-    df = pd.read_sql_query(
-        """
-        WITH latest_vital AS (
-          SELECT *
-          FROM Vitals
-          WHERE visit_id = %s
-          ORDER BY timestamp DESC
-          LIMIT 1
-        ), latest_lab AS (
-          SELECT *
-          FROM Labs
-          WHERE visit_id = %s
-          ORDER BY timestamp DESC
-          LIMIT 1
-        )
-        SELECT
-          (EXTRACT(EPOCH FROM v.timestamp - vi.visit_date) / 3600)::int AS "HourOfObservation",
-          p.age AS "PatientAge",
-          vi.iculos AS "ICULengthOfStay",
-          p.gender AS "PatientGender",
-          vi.hosp_adm_time AS "TimeSinceHospitalAdmission",
-          v.hr AS "HeartRate",
-          v.map AS "MeanArterialPressure",
-          v.o2sat AS "OxygenSaturation",
-          v.resp AS "RespiratoryRate",
-          v.sbp AS "SystolicBloodPressure",
-          v.dbp AS "DiastolicBloodPressure",
-          v.temp AS "Temperature",
-          l.wbc AS "WhiteBloodCellCount",
-          l.creatinine AS "CreatinineLevel",
-          l.bilirubin_total AS "TotalBilirubin",
-          l.platelets AS "PlateletCount",
-          l.lactate AS "LactateLevel"
-        FROM Visits vi
-        JOIN Patients p ON vi.patient_id = p.patient_id
-        LEFT JOIN latest_vital v ON vi.visit_id = v.visit_id
-        LEFT JOIN latest_lab l ON vi.visit_id = l.visit_id
-        WHERE vi.visit_id = %s
-        """,
-        conn_calc,
-        params=(visit_id, visit_id, visit_id)
-    )
-    conn_calc.close()
-    # If no data returned, cannot calculate risk
-    if df.empty:
-        return None
-
-    # Ensure correct feature order
-    FEATURES = [
-        "HourOfObservation","PatientAge","ICULengthOfStay","PatientGender",
-        "TimeSinceHospitalAdmission","HeartRate","MeanArterialPressure","OxygenSaturation",
-        "RespiratoryRate","SystolicBloodPressure","DiastolicBloodPressure",
-        "Temperature","WhiteBloodCellCount","CreatinineLevel",
-        "TotalBilirubin","PlateletCount","LactateLevel"
-    ]
-    X = df[FEATURES]
-
-    # Predict probability
-    proba = model.predict_proba(X)[0,1]
-    #st.session_state.debug_X = X
-    return float(proba)
 
+from cache import cached, invalidate
+from db import db_session
+from live import REFRESH_INTERVAL, live_version
+from queries import (
+    DIAGNOSIS_LATEST_SQL,
+    FEATURES,
+    HIGH_RISK_MIN,
+    ICU_LENGTH_OF_STAY_SQL,
+    LATEST_SCORE_SQL,
+    LATEST_VISIT_SQL,
+    LOGIN_SQL,
+    LOW_RISK_MAX,
+    PATIENT_SQL,
+    RECENT_ALERTS_SQL,
+    VISIT_DETAILS_SQL,
+    VISIT_ON_DATE_SQL,
+    fetch_census,
+)
+from telemetry import begin_trace, end_trace, fragment_trace, set_page
 
-# ------------------------------
-# Config: DB Connection
-# ------------------------------
-def get_connection():
-    return psycopg2.connect(
-        host="localhost",
-        database="sepsis_dss",
-        user="sepsis_tool_admin",
-        password="sepsis"
-    )
 
 # ------------------------------
 # Helpers
@@ -99,15 +33,132 @@ def hash_password(password):
 
 def verify_login(username, password):
     password = password.strip()
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT password_hash, role FROM Users WHERE username = %s", (username,))
-    result = cur.fetchone()
-    conn.close()
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute(LOGIN_SQL, (username,))
+        result = cur.fetchone()
     if result and result[0] == hash_password(password):
         return True, result[1]
     return False, None
 
+# Cached lookups, shared across sessions; writes below invalidate the keys they touch
+def fetch_one(sql, params):
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()
+
+def get_patient(patient_id):
+    """(firstname, lastname, age, gender, status), or None if the patient does not exist."""
+    return cached("patient", patient_id, lambda: fetch_one(PATIENT_SQL, (patient_id,)))
+
+def get_latest_visit_id(patient_id):
+    row = cached("latest_visit", patient_id, lambda: fetch_one(LATEST_VISIT_SQL, (patient_id,)))
+    return row[0] if row else None
+
+def get_visit(visit_id):
+    """(visit_date, hosp_adm_time, location), or None."""
+    return cached("visit", visit_id, lambda: fetch_one(VISIT_DETAILS_SQL, (visit_id,)))
+
+def get_latest_diagnosis(visit_id):
+    """(sepsis, diagnosis_datetime) of the visit's latest diagnosis, or None."""
+    return cached("latest_diagnosis", visit_id, lambda: fetch_one(DIAGNOSIS_LATEST_SQL, (visit_id,)))
+
+def get_latest_score(visit_id):
+    """(score, contributions) of the visit's latest risk score, or None."""
+    return cached("latest_score", visit_id, lambda: fetch_one(LATEST_SCORE_SQL, (visit_id,)))
+
+def get_recent_alerts(visit_id):
+    """[(rule, message, created_at, delivered_at)] of the visit's alerts from the last day, newest first."""
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute(RECENT_ALERTS_SQL, (visit_id,))
+        return cur.fetchall()
+
+# Live views: rerun every REFRESH_INTERVAL seconds as fragments, but only query
+# again when live.py has seen a score/diagnosis/admission event for their topic
+LIVE_RUN_EVERY = REFRESH_INTERVAL or None
+
+def load_if_changed(state_key, topic, loader, args=()):
+    """Data cached in the session under state_key, reloaded when the topic's live version or args change."""
+    version = live_version(topic)
+    seen = st.session_state.get(state_key)
+    if seen is None or seen[:2] != (version, args):
+        # Version is read before loading, so an event during the load triggers another one
+        seen = (version, args, loader(*args))
+        st.session_state[state_key] = seen
+    return seen[2]
+
+FEATURE_LABELS = {
+    "HourOfObservation": "Hours since visit start", "PatientAge": "Age", "ICULengthOfStay": "ICU length of stay",
+    "PatientGender": "Gender", "TimeSinceHospitalAdmission": "Time since hospital admission",
+    "HeartRate": "Heart rate", "MeanArterialPressure": "MAP", "OxygenSaturation": "O2 saturation",
+    "RespiratoryRate": "Respiration rate", "SystolicBloodPressure": "Systolic BP",
+    "DiastolicBloodPressure": "Diastolic BP", "Temperature": "Temperature", "WhiteBloodCellCount": "WBC",
+    "CreatinineLevel": "Creatinine", "TotalBilirubin": "Total bilirubin", "PlateletCount": "Platelets",
+    "LactateLevel": "Lactate",
+}
+TOP_DRIVERS = 3
+
+def top_drivers(contributions, n=TOP_DRIVERS):
+    """[(feature label, log-odds contribution)] of the n features that moved the score most (bias excluded)."""
+    ranked = sorted(zip(FEATURES, contributions), key=lambda fc: abs(fc[1]), reverse=True)
+    return [(FEATURE_LABELS.get(f, f), c) for f, c in ranked[:n] if c]
+
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@fragment_trace("lookup")
+def risk_score_panel(visit_id):
+    latest = load_if_changed(
+        f"risk_score_{visit_id}", f"visit:{visit_id}", lambda: get_latest_score(visit_id)
+    )
+    if latest is not None:
+        latest_score, contributions = latest
+        st.metric("Current Risk Score", f"{latest_score:.2%}")
+        st.session_state.latest_risk_score = latest_score
+        # Stored with the score at scoring time; nothing is inferred here
+        drivers = top_drivers(contributions) if contributions else []
+        if drivers:
+            st.caption("Top drivers: " + ", ".join(
+                f"{label} {'↑' if c > 0 else '↓'} ({c:+.2f})" for label, c in drivers
+            ) + " · log-odds contribution to this score")
+    else:
+        st.info("No risk score found. Please enter vitals and labs.")
+    alerts = load_if_changed(f"alerts_{visit_id}", f"visit:{visit_id}", get_recent_alerts, (visit_id,))
+    for rule, message, created_at, delivered_at in alerts:
+        st.warning(f"{created_at:%b %d %H:%M} · {message}" + ("" if delivered_at else " (not delivered yet)"))
+
+TREND_DEFAULT = ["hr", "map", "lactate"]
+
+def load_trends(visit_id, series):
+    from trends import fetch_trends
+    with db_session() as conn, conn.cursor() as cur:
+        return fetch_trends(cur, visit_id, series)
+
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@fragment_trace("lookup")
+def trend_panel(visit_id):
+    import pandas as pd
+    from trends import TREND_SERIES
+
+    with st.expander("Trends", expanded=False):
+        picked = st.multiselect(
+            "Series", [s for s in TREND_SERIES if s != "score"], default=TREND_DEFAULT,
+            format_func=TREND_SERIES.get, key="trend_series",
+        )
+        # Downsampled in SQL and trends.lttb: a bounded number of points per series
+        trends = load_if_changed(
+            f"trends_{visit_id}", f"visit:{visit_id}", load_trends, (visit_id, ("score", *picked))
+        )
+        if not trends:
+            st.info("No observations recorded for this visit yet.")
+            return
+        for series in ("score", *picked):
+            if series in trends:
+                t, y = trends[series]
+                st.caption(TREND_SERIES[series])
+                st.line_chart(pd.DataFrame({TREND_SERIES[series]: y}, index=t), height=160)
+
+def load_census(sort, search, after):
+    with db_session() as conn, conn.cursor() as cur:
+        return fetch_census(cur, sort=sort, search=search, after=after)
+
 # ------------------------------
 # Login Form
 # ------------------------------
@@ -124,9 +175,18 @@ if "logged_in" not in st.session_state:
     st.session_state.show_entry_form = False
     st.session_state.patient_status = None
 
+# One telemetry trace per rerun, tagged with the page being rendered
+if not st.session_state.logged_in:
+    begin_trace("login", st.session_state)
+elif st.session_state.get("show_all_patients"):
+    begin_trace("census", st.session_state)
+else:
+    begin_trace("lookup", st.session_state)
+
 # Logout button (shows only when logged in)
 if st.session_state.logged_in:
     if st.sidebar.button("Logout"):
+        end_trace()
         st.session_state.clear()
         st.rerun()
 
@@ -170,92 +230,78 @@ if not st.session_state.logged_in:
 # ------------------------------
 # All Admitted Patients Page
 # ------------------------------
-if st.session_state.logged_in and st.session_state.get("show_all_patients"):
-    st.header("All Admitted Patients")
+CENSUS_SORT_LABELS = {"risk": "Risk score", "room": "Room", "name": "Name"}
+HISTOGRAM_LABELS = [f"{i / 10:.1f}-{(i + 1) / 10:.1f}" for i in range(10)]
+
+def reset_census_paging():
+    st.session_state.census_cursors = [None]
+
+def color_score(scores):
+    return ["color: green" if s < LOW_RISK_MAX else "color: orange" if s < HIGH_RISK_MIN else "color: red"
+            for s in scores]
+
+def color_sepsis(values):
+    return ["color: purple" if v == "Sepsis" else "" for v in values]
+
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@fragment_trace("census")
+def census_panel():
+    if "census_cursors" not in st.session_state:
+        reset_census_paging()
+    search_col, sort_col = st.columns([3, 1])
+    search = search_col.text_input("Search by name, room or patient ID", key="census_search",
+                                   on_change=reset_census_paging)
+    sort = sort_col.selectbox("Sort by", list(CENSUS_SORT_LABELS), format_func=CENSUS_SORT_LABELS.get,
+                              key="census_sort", on_change=reset_census_paging)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT ON (p.patient_id) p.patient_id, p.firstname, p.lastname, p.age, p.gender, r.score, v.location
-            FROM Patients p
-            JOIN Visits v ON p.patient_id = v.patient_id
-            JOIN RiskScores r ON v.visit_id = r.visit_id
-            WHERE p.status = 'admitted'
-            AND r.score IS NOT NULL
-            ORDER BY p.patient_id, r.generated_at DESC
-        """)
-        rows = cur.fetchall()
-        # Sort patients by descending risk score
-        rows = sorted(rows, key=lambda row: row[5], reverse=True)
-        # KPI summaries for risk categories
-        low_count = sum(1 for r in rows if r[5] < 0.20)
-        med_count = sum(1 for r in rows if 0.20 <= r[5] < 0.80)
-        high_count = sum(1 for r in rows if r[5] >= 0.80)
+        # One page of the census plus ward-wide KPI counts and histogram in one query,
+        # re-run only after a score, diagnosis or admission event or a paging/search change
+        after = st.session_state.census_cursors[-1]
+        page = load_if_changed("census_data", "census", load_census, (sort, search, after))
+        if not page.rows and after is not None:
+            # The ward shrank under a later page; start over
+            reset_census_paging()
+            st.rerun(scope="fragment")
+        counts = page.counts
         col1, col2, col3 = st.columns(3)
-        col1.metric("Low Risk (<20%)", low_count)
-        col2.metric("Medium Risk (20-80%)", med_count)
-        col3.metric("High Risk (>=80%)", high_count)
-        cur.close()
-        conn.close()
-
-        if rows:
-            # Build table of patients
+        col1.metric("Low Risk (<20%)", counts["low"])
+        col2.metric("Medium Risk (20-80%)", counts["medium"])
+        col3.metric("High Risk (>=80%)", counts["high"])
+
+        if page.rows:
             import pandas as pd
-            table_data = []
-            for row in rows:
-                pid, fn, ln, age, gender, score, location = row
-                # Check for sepsis diagnosis
-                conn_diag = get_connection()
-                cur_diag = conn_diag.cursor()
-                cur_diag.execute(
-                    "SELECT sepsis FROM Diagnosis WHERE visit_id = (SELECT visit_id FROM Visits WHERE patient_id = %s ORDER BY diagnosis_datetime DESC LIMIT 1)",
-                    (pid,)
-                )
-                diag_res = cur_diag.fetchone()
-                cur_diag.close()
-                conn_diag.close()
-                sepsis_label = 'Sepsis' if diag_res and diag_res[0] else ''
-                table_data.append({
-                    'Patient ID': pid,
-                    'Name': f"{fn} {ln}",
-                    'Room': location,
-                    'Age': age,
-                    'Gender': gender,
-                    'Risk Score': f"{score:.2%}",
-                    'Sepsis': sepsis_label
-                })
-            df_patients = pd.DataFrame(table_data)
-
-            # Apply color styling to Risk Score and Sepsis columns
-            def color_score_str(val):
-                num = float(val.strip('%'))/100
-                if num < 0.20:
-                    return 'color: green'
-                elif num < 0.80:
-                    return 'color: orange'
-                else:
-                    return 'color: red'
-
-            def color_sepsis(val):
-                return 'color: purple' if val == 'Sepsis' else ''
-
-            styled_df = df_patients.style.applymap(color_score_str, subset=['Risk Score']) \
-                                         .applymap(color_sepsis, subset=['Sepsis'])
-            # Set DataFrame index to ID and remove index column
-            df_patients_indexed = styled_df.data.copy()
-            df_patients_indexed.set_index('Patient ID', inplace=True)
-            st.dataframe(df_patients_indexed.style.applymap(color_score_str, subset=['Risk Score']).applymap(color_sepsis, subset=['Sepsis']))
-
-
-            # Histogram of risk scores with formatted bins
-            import numpy as np
-            scores = [row[5] for row in rows]
-            # Define 10 bins from 0 to 1
-            bins = np.linspace(0, 1, 11)
-            labels = [f"{bins[i]:.1f}-{bins[i+1]:.1f}" for i in range(len(bins)-1)]
-            categories = pd.cut(scores, bins=bins, labels=labels, include_lowest=True)
-            count_series = categories.value_counts().sort_index()
-            st.bar_chart(count_series)
+            # Only the visible page is turned into a frame and styled
+            df_patients = pd.DataFrame(
+                [{
+                    "Patient ID": pid,
+                    "Name": f"{fn} {ln}",
+                    "Room": location,
+                    "Age": age,
+                    "Gender": gender,
+                    "Risk Score": score,
+                    "Sepsis": "Sepsis" if sepsis else "",
+                } for pid, fn, ln, age, gender, score, location, sepsis in page.rows]
+            ).set_index("Patient ID")
+            st.dataframe(
+                df_patients.style.format({"Risk Score": "{:.2%}"})
+                .apply(color_score, subset=["Risk Score"])
+                .apply(color_sepsis, subset=["Sepsis"])
+            )
+
+            first = len(st.session_state.census_cursors) - 1
+            st.caption(f"Page {first + 1} · {len(page.rows)} of {page.matched} patients")
+            prev_col, next_col = st.columns(2)
+            if prev_col.button("Previous page", disabled=first == 0):
+                st.session_state.census_cursors.pop()
+                st.rerun(scope="fragment")
+            if next_col.button("Next page", disabled=page.next_after is None):
+                st.session_state.census_cursors.append(page.next_after)
+                st.rerun(scope="fragment")
+
+            # Ward-wide histogram of risk scores, bucketed in SQL
+            st.bar_chart(pd.Series(page.histogram, index=HISTOGRAM_LABELS))
+        elif search:
+            st.info("No admitted patients match your search.")
         else:
             st.info("No admitted patients with risk scores found.")
 
@@ -263,6 +309,11 @@ if st.session_state.logged_in and st.session_state.get("show_all_patients"):
         st.error(f"An error occurred: {e}")
 
 
+if st.session_state.logged_in and st.session_state.get("show_all_patients"):
+    st.header("All Admitted Patients")
+    census_panel()
+
+
 
 # ------------------------------
 # Main App Content
@@ -282,10 +333,8 @@ if st.session_state.logged_in:
         submitted = st.form_submit_button("Search", type="primary")
 
     if submitted:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT firstname, lastname, age, gender FROM Patients WHERE patient_id = %s", (patient_id,))
-        result = cur.fetchone()
+        # Name, age, gender and status in one (cached) lookup
+        result = get_patient(patient_id)
 
         st.session_state.last_patient_id = patient_id
         st.session_state.patient_exists = result is not None
@@ -299,38 +348,24 @@ if st.session_state.logged_in:
             st.session_state.gender = result[3]
             st.success(f"Patient {patient_id} ({result[0]} {result[1]}) found: Age {result[2]}, Gender {result[3]}")
 
-            # Fetch patient status
-            cur.execute("SELECT status FROM Patients WHERE patient_id = %s", (patient_id,))
-            status_result = cur.fetchone()
-            if status_result:
-                st.session_state.patient_status = status_result[0]
-                st.markdown(f"**Status:** `{st.session_state.patient_status}`")
+            # Patient status
+            st.session_state.patient_status = result[4]
+            st.markdown(f"**Status:** `{st.session_state.patient_status}`")
 
             # Show early sepsis diagnosis info if it exists
-            conn_check = get_connection()
-            cur_check = conn_check.cursor()
-            cur_check.execute("SELECT visit_id FROM Visits WHERE patient_id = %s ORDER BY visit_date DESC LIMIT 1", (patient_id,))
-            recent_visit = cur_check.fetchone()
-            if recent_visit:
-                st.session_state.current_visit_id = recent_visit[0]
-                cur_check.execute("SELECT sepsis, diagnosis_datetime FROM Diagnosis WHERE visit_id = %s ORDER BY diagnosis_datetime DESC LIMIT 1", (recent_visit[0],))
-                diag_result = cur_check.fetchone()
+            recent_visit_id = get_latest_visit_id(patient_id)
+            if recent_visit_id:
+                st.session_state.current_visit_id = recent_visit_id
+                diag_result = get_latest_diagnosis(recent_visit_id)
                 if diag_result and diag_result[0]:
                     st.markdown(f"<span style='color:orange'><b>Diagnosis: Sepsis</b> (Diagnosed at {diag_result[1].strftime('%Y-%m-%d %H:%M:%S')})</span>", unsafe_allow_html=True)
-            cur_check.close()
-            conn_check.close()
             # Check if there's already a visit today
-            cur.execute("SELECT visit_id FROM Visits WHERE patient_id = %s AND visit_date = %s",
-                        (patient_id, datetime.now()))
-            visit_result = cur.fetchone()
+            visit_result = fetch_one(VISIT_ON_DATE_SQL, (patient_id, datetime.now()))
             if visit_result:
                 st.session_state.current_visit_id = visit_result[0]
         else:
             st.warning("Patient not found. Please enter details to add a new patient.")
 
-        cur.close()
-        conn.close()
-
     if st.session_state.patient_exists is False and st.session_state.last_patient_id:
         with st.form("new_patient_form", clear_on_submit=False):
             new_firstname = st.text_input("First Name", key="new_firstname")
@@ -344,19 +379,16 @@ if st.session_state.logged_in:
 
         if add_patient:
             try:
-                conn = get_connection()
-                cur = conn.cursor()
+                with db_session() as conn, conn.cursor() as cur:
+                    cur.execute("INSERT INTO Patients (patient_id, firstname, lastname, age, gender, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                                (st.session_state.last_patient_id, new_firstname, new_lastname, new_age, new_gender, datetime.now()))
 
-                cur.execute("INSERT INTO Patients (patient_id, firstname, lastname, age, gender, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
-                            (st.session_state.last_patient_id, new_firstname, new_lastname, new_age, new_gender, datetime.now()))
-
-                cur.execute("INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos, location) VALUES (%s, %s, %s, %s, %s, %s) RETURNING visit_id",
-                            (st.session_state.last_patient_id, st.session_state.username, visit_date, hosp_adm_time, 0, location))
-                st.session_state.current_visit_id = cur.fetchone()[0]
+                    cur.execute("INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos, location) VALUES (%s, %s, %s, %s, %s, %s) RETURNING visit_id",
+                                (st.session_state.last_patient_id, st.session_state.username, visit_date, hosp_adm_time, 0, location))
+                    st.session_state.current_visit_id = cur.fetchone()[0]
+                invalidate("patient", st.session_state.last_patient_id)
+                invalidate("latest_visit", st.session_state.last_patient_id)
 
-                conn.commit()
-                cur.close()
-                conn.close()
                 st.success("New patient created. Please enter vitals and labs.")
                 st.session_state.patient_exists = True
                 st.session_state.show_entry_form = True
@@ -377,13 +409,7 @@ if st.session_state.logged_in:
         
         # Edit Visit Details (all users)
         if st.button("Edit Visit Details", key="edit_visit_button"):
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT visit_date, hosp_adm_time, location FROM Visits WHERE visit_id = %s", 
-                    (st.session_state.current_visit_id,))
-            visit_info = cur.fetchone()
-            cur.close()
-            conn.close()
+            visit_info = get_visit(st.session_state.current_visit_id)
             if visit_info:
                 st.session_state.edit_visit_date = visit_info[0]
                 st.session_state.edit_hosp_adm_time = visit_info[1]
@@ -396,48 +422,41 @@ if st.session_state.logged_in:
         else:
             st.header("Sepsis Risk Dashboard")
 
-        # Compute dynamic ICU Length of Stay in days
-        conn_ilos = get_connection()
-        cur_ilos = conn_ilos.cursor()
-        cur_ilos.execute("SELECT visit_date FROM Visits WHERE visit_id = %s", (st.session_state.current_visit_id,))
-        ilos_row = cur_ilos.fetchone()
-        cur_ilos.close()
-        conn_ilos.close()
-        if ilos_row and ilos_row[0]:
-            # calculate in days
-            from datetime import time
-            visit_datetime = datetime.combine(ilos_row[0], time.min)
-            dynamic_iculos = (datetime.now() - visit_datetime).total_seconds() / 86400
-            st.write(f"ICU Length of Stay: {dynamic_iculos:.2f} days")
-            # Update ICULOS in the database
-            conn_upd = get_connection()
-            cur_upd = conn_upd.cursor()
-            cur_upd.execute("UPDATE Visits SET iculos = %s WHERE visit_id = %s", (dynamic_iculos, st.session_state.current_visit_id))
-            conn_upd.commit()
-            cur_upd.close()
-            conn_upd.close()
-
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT visit_id FROM Visits WHERE patient_id = %s ORDER BY visit_date DESC LIMIT 1", (st.session_state.last_patient_id,))
-        visit_result = cur.fetchone()
-        if visit_result:
-            st.session_state.current_visit_id = visit_result[0]
-
-        cur.execute("SELECT score FROM RiskScores WHERE visit_id = %s ORDER BY generated_at DESC LIMIT 1", (st.session_state.current_visit_id,))
-        score_result = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        if score_result:
-            st.metric("Current Risk Score", f"{score_result[0]:.2%}")
-            st.session_state.latest_risk_score = score_result[0]
-        else:
-            st.info("No risk score found. Please enter vitals and labs.")
+        # ICU Length of Stay in days, derived in SQL at read time (no write on render)
+        ilos_row = fetch_one(ICU_LENGTH_OF_STAY_SQL, (st.session_state.current_visit_id,))
+        if ilos_row and ilos_row[0] is not None:
+            st.write(f"ICU Length of Stay: {ilos_row[0]:.2f} days")
+
+        latest_visit_id = get_latest_visit_id(st.session_state.last_patient_id)
+        if latest_visit_id:
+            st.session_state.current_visit_id = latest_visit_id
+
+        risk_score_panel(st.session_state.current_visit_id)
+        trend_panel(st.session_state.current_visit_id)
 
         if st.session_state.role == "nurse":
-            st.button("Notify Physician")
-        st.caption("Since this is a prototype, we have not integrated with your organization's internal messaging system. Please notify the physician outside of this app.")
+            if st.button("Notify Physician"):
+                from alerts import dispatch, raise_manual_alert
+                visit_id = st.session_state.current_visit_id
+                try:
+                    with db_session() as conn:
+                        alert_id = raise_manual_alert(
+                            conn, visit_id, st.session_state.username,
+                            score=(get_latest_score(visit_id) or (None,))[0],
+                        )
+                    if alert_id is None:
+                        st.info("The physician was already notified about this patient in the last minute.")
+                    else:
+                        st.session_state.pop(f"alerts_{visit_id}", None)
+                        delivered, _ = dispatch(visit_ids=[visit_id])
+                        if delivered:
+                            st.success("Physician notified.")
+                        else:
+                            st.warning("Alert recorded, but delivery failed; it will be retried.")
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+        st.caption("High-risk, rising-score and overdue-vitals alerts are raised automatically and sent "
+                   "through the configured notification channel together with Notify Physician requests.")
 
         if st.session_state.patient_status == 'admitted' and st.session_state.current_visit_id:
             if st.button("Update Labs and Vitals"):
@@ -449,14 +468,12 @@ if st.session_state.logged_in:
         if st.session_state.patient_status == 'admitted':
             if st.button("Discharge Patient"):
                 try:
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("UPDATE Patients SET status = 'discharged' WHERE patient_id = %s", (st.session_state.last_patient_id,))
-                    # Clear location on discharge
-                    cur.execute("UPDATE Visits SET location = NULL WHERE visit_id = %s", (st.session_state.current_visit_id,))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                    with db_session() as conn, conn.cursor() as cur:
+                        cur.execute("UPDATE Patients SET status = 'discharged' WHERE patient_id = %s", (st.session_state.last_patient_id,))
+                        # Clear location on discharge
+                        cur.execute("UPDATE Visits SET location = NULL WHERE visit_id = %s", (st.session_state.current_visit_id,))
+                    invalidate("patient", st.session_state.last_patient_id)
+                    invalidate("visit", st.session_state.current_visit_id)
                     st.success("Patient discharged.")
                     st.rerun()
                 except Exception as e:
@@ -464,15 +481,13 @@ if st.session_state.logged_in:
         elif st.session_state.patient_status == 'discharged':
             if st.button("Admit Patient"):
                 try:
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("UPDATE Patients SET status = 'admitted' WHERE patient_id = %s", (st.session_state.last_patient_id,))
-                    cur.execute("INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos) VALUES (%s, %s, %s, %s, %s) RETURNING visit_id",
-                                (st.session_state.last_patient_id, st.session_state.username, datetime.now(), 0, 0))
-                    st.session_state.current_visit_id = cur.fetchone()[0]
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                    with db_session() as conn, conn.cursor() as cur:
+                        cur.execute("UPDATE Patients SET status = 'admitted' WHERE patient_id = %s", (st.session_state.last_patient_id,))
+                        cur.execute("INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos) VALUES (%s, %s, %s, %s, %s) RETURNING visit_id",
+                                    (st.session_state.last_patient_id, st.session_state.username, datetime.now(), 0, 0))
+                        st.session_state.current_visit_id = cur.fetchone()[0]
+                    invalidate("patient", st.session_state.last_patient_id)
+                    invalidate("latest_visit", st.session_state.last_patient_id)
                     st.success("Patient readmitted. New visit created.")
                     st.rerun()
                 except Exception as e:
@@ -482,23 +497,15 @@ if st.session_state.logged_in:
 
     # Physician-only actions — only if a patient is selected and visit_id exists
     if st.session_state.role == "physician" and st.session_state.patient_exists and st.session_state.current_visit_id:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT sepsis FROM Diagnosis WHERE visit_id = %s ORDER BY diagnosis_datetime DESC LIMIT 1", (st.session_state.current_visit_id,))
-        diag_result = cur.fetchone()
-        cur.close()
-        conn.close()
+        diag_result = get_latest_diagnosis(st.session_state.current_visit_id)
 
         if not diag_result or not diag_result[0]:
             if st.button("Diagnose with Sepsis"):
                 try:
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("INSERT INTO Diagnosis (visit_id, sepsis, diagnosed_by, diagnosis_datetime) VALUES (%s, %s, %s, %s)",
-                                (st.session_state.current_visit_id, True, st.session_state.username, datetime.now()))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                    with db_session() as conn, conn.cursor() as cur:
+                        cur.execute("INSERT INTO Diagnosis (visit_id, sepsis, diagnosed_by, diagnosis_datetime) VALUES (%s, %s, %s, %s)",
+                                    (st.session_state.current_visit_id, True, st.session_state.username, datetime.now()))
+                    invalidate("latest_diagnosis", st.session_state.current_visit_id)
                     st.success("Diagnosis recorded: Sepsis")
                     st.rerun()
                 except Exception as e:
@@ -506,12 +513,9 @@ if st.session_state.logged_in:
         elif diag_result[0]:
             if st.button("Remove Sepsis Diagnosis"):
                 try:
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("DELETE FROM Diagnosis WHERE visit_id = %s AND sepsis = TRUE", (st.session_state.current_visit_id,))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                    with db_session() as conn, conn.cursor() as cur:
+                        cur.execute("DELETE FROM Diagnosis WHERE visit_id = %s AND sepsis = TRUE", (st.session_state.current_visit_id,))
+                    invalidate("latest_diagnosis", st.session_state.current_visit_id)
                     st.warning("Sepsis diagnosis removed.")
                     st.rerun()
                 except Exception as e:
@@ -529,15 +533,12 @@ if st.session_state.get("show_edit_form"):
     
     if save:
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE Patients SET firstname=%s, lastname=%s, age=%s, gender=%s WHERE patient_id = %s",
-                (ef, el, ea, eg, st.session_state.last_patient_id)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+            with db_session() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE Patients SET firstname=%s, lastname=%s, age=%s, gender=%s WHERE patient_id = %s",
+                    (ef, el, ea, eg, st.session_state.last_patient_id)
+                )
+            invalidate("patient", st.session_state.last_patient_id)
             # Update session
             st.session_state.firstname = ef
             st.session_state.lastname = el
@@ -563,22 +564,15 @@ if st.session_state.get("show_edit_visit_form"):
     
     if submit_visit:
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            # Update visit details
-            cur.execute(
-                "UPDATE Visits SET visit_date=%s, hosp_adm_time=%s, location=%s WHERE visit_id=%s",
-                (new_visit_date, new_hosp_adm_time, new_location, st.session_state.current_visit_id)
-            )
-            # Update dynamic ICU Length of Stay
-            dynamic_iculos = (datetime.now() - datetime.combine(new_visit_date, datetime.min.time())).total_seconds() / 86400
-            cur.execute(
-                "UPDATE Visits SET iculos=%s WHERE visit_id=%s",
-                (dynamic_iculos, st.session_state.current_visit_id)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+            with db_session() as conn, conn.cursor() as cur:
+                # Update visit details (ICU length of stay is derived from visit_date at read time)
+                cur.execute(
+                    "UPDATE Visits SET visit_date=%s, hosp_adm_time=%s, location=%s WHERE visit_id=%s",
+                    (new_visit_date, new_hosp_adm_time, new_location, st.session_state.current_visit_id)
+                )
+            # visit_date decides which visit is the latest
+            invalidate("latest_visit", st.session_state.last_patient_id)
+            invalidate("visit", st.session_state.current_visit_id)
             st.session_state.show_edit_visit_form = False
             st.success("Visit details updated successfully.")
             st.rerun()
@@ -613,29 +607,29 @@ if st.session_state.get("show_entry_form"):
             submit_vitals_labs = st.form_submit_button("Submit Vitals and Labs")
 
         if submit_vitals_labs:
+            set_page("submit")
+            # Imported here so pages that never score don't load pandas or the model libraries
+            from scoring import submit_observations
             try:
-                conn = get_connection()
-                cur = conn.cursor()
-                timestamp = datetime.now()
-
-                cur.execute("INSERT INTO Vitals (visit_id, entered_by, temp, hr, sbp, dbp, map, resp, o2sat, timestamp) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                            (st.session_state.current_visit_id, st.session_state.username, temp, hr, sbp, dbp, map_, resp, o2sat, timestamp))
-
-                cur.execute("INSERT INTO Labs (visit_id, entered_by, wbc, creatinine, bilirubin_total, bilirubin_direct, platelets, lactate, timestamp) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                            (st.session_state.current_visit_id, st.session_state.username, wbc, creatinine, bilirubin_total, bilirubin_direct, platelets, lactate, timestamp))
-
-                                    # Compute sepsis risk via ML model
-                risk_score = calculate_risk(st.session_state.current_visit_id)
-                if risk_score is None:
-                    st.error("Cannot calculate risk: please ensure both vitals and labs are submitted.")
-                else:
-                    cur.execute(
-                        "INSERT INTO RiskScores (visit_id, score, generated_at) VALUES (%s, %s, %s)",
-                        (st.session_state.current_visit_id, risk_score, timestamp)
+                # Patient and visit attributes come from the lookup cache; the model scores the
+                # submitted values directly and Vitals, Labs and RiskScores go out in one statement
+                patient = get_patient(st.session_state.last_patient_id)
+                visit = get_visit(st.session_state.current_visit_id)
+                vitals = {"temp": temp, "hr": hr, "sbp": sbp, "dbp": dbp, "map": map_, "resp": resp, "o2sat": o2sat}
+                labs = {"wbc": wbc, "creatinine": creatinine, "bilirubin_total": bilirubin_total,
+                        "bilirubin_direct": bilirubin_direct, "platelets": platelets, "lactate": lactate}
+                with db_session() as conn:
+                    risk_score = submit_observations(
+                        conn, st.session_state.current_visit_id, st.session_state.username, vitals, labs,
+                        patient=(patient[2], patient[3]), visit=(visit[0], visit[1]),
                     )
-                    conn.commit()
-                cur.close()
-                conn.close()
+                invalidate("latest_score", st.session_state.current_visit_id)
+                # Don't wait for the score event to show our own write
+                st.session_state.pop(f"risk_score_{st.session_state.current_visit_id}", None)
+                st.session_state.pop(f"alerts_{st.session_state.current_visit_id}", None)
+                # Alerts raised by this score go out now, not on the scheduler's next pass
+                from alerts import dispatch
+                dispatch(visit_ids=[st.session_state.current_visit_id])
 
                 st.success("Vitals, labs, and risk score submitted successfully.")
                 st.session_state.latest_risk_score = risk_score
@@ -645,7 +639,4 @@ if st.session_state.get("show_entry_form"):
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
-# uncomment line 79 to see this
-if "debug_X" in st.session_state:
-    st.subheader("DEBUG: Model Input to Predict")
-    st.dataframe(st.session_state.debug_X)
+end_trace()
@@ -0,0 +1,366 @@
+# backtest.py - offline evaluation of the sepsis model over historical data
+#
+# Usage:
+#   python backtest.py csv ML_model_development/df_balanced.csv
+#   python backtest.py parquet ML_model_development/df_balanced.parquet
+#   python backtest.py db --since 2024-01-01 --until 2025-01-01 --workers 16
+#   python backtest.py csv history.csv --output report.json --per-id lead_times.csv
+#
+# Feature rows are streamed in chunks of --chunk-size, either from a CSV laid
+# out like df_balanced.csv (model features, SepsisIndicator, UniqueID), from
+# its typed Parquet conversion (feature_store.py; only the needed columns are
+# read), or rebuilt from Vitals/Labs the way VisitFeatures does (latest value of each
+# measurement carried forward, one row per observation time). Chunks are
+# scored across a pool of --workers processes, each holding its own copy of
+# the model, and reduced to fixed-size partial statistics, so memory does not
+# grow with the amount of history and throughput scales with cores.
+#
+# Reported: AUROC, Brier score and a calibration table, alert rates,
+# sensitivity and PPV at the dashboard cut-points (queries.LOW_RISK_MAX and
+# HIGH_RISK_MIN), and per patient (UniqueID / visit) how many hours before
+# sepsis onset the first alert fired.
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fast_inference import NativeModel
+from feature_store import CSV_PATH, DATASET_PATH, iter_frames
+from model_registry import MODEL_PATH, get_model
+from queries import HIGH_RISK_MIN, LOW_RISK_MAX
+from scoring import FEATURES, LABS_FEATURES, VITALS_FEATURES
+
+logger = logging.getLogger(__name__)
+
+CUTS = {"medium": LOW_RISK_MAX, "high": HIGH_RISK_MIN}
+# Score histogram resolution used for AUROC
+AUROC_BINS = 1000
+CALIBRATION_BINS = 10
+CHUNK_SIZE = 50000
+# PhysioNet convention: rows are labelled septic from 6 hours before onset
+LABEL_HORIZON_HOURS = 6
+
+# Vitals and Labs rows at the same time form one observation; Diagnosis gives the onset
+HISTORY_SQL = f"""
+    SELECT o.visit_id, o.ts, v.visit_date, v.hosp_adm_time, p.age, p.gender, d.onset,
+           {', '.join(VITALS_FEATURES)}, {', '.join(LABS_FEATURES)}
+    FROM (
+        SELECT coalesce(vi.visit_id, la.visit_id) AS visit_id, coalesce(vi.timestamp, la.timestamp) AS ts,
+               {', '.join('vi.' + c for c in VITALS_FEATURES)}, {', '.join('la.' + c for c in LABS_FEATURES)}
+        FROM (SELECT * FROM Vitals WHERE timestamp >= %(since)s AND timestamp < %(until)s) vi
+        FULL JOIN (SELECT * FROM Labs WHERE timestamp >= %(since)s AND timestamp < %(until)s) la
+          ON la.visit_id = vi.visit_id AND la.timestamp = vi.timestamp
+    ) o
+    JOIN Visits v ON v.visit_id = o.visit_id
+    JOIN Patients p ON p.patient_id = v.patient_id
+    LEFT JOIN (
+        SELECT visit_id, min(diagnosis_datetime) AS onset FROM Diagnosis WHERE sepsis GROUP BY visit_id
+    ) d ON d.visit_id = o.visit_id
+    ORDER BY o.visit_id, o.ts
+"""
+
+
+# ------------------------------
+# Sources: DataFrames of FEATURES plus label, group, hour and onset (hours, NaN if none)
+# ------------------------------
+def file_chunks(path, chunk_size=CHUNK_SIZE):
+    for chunk in iter_frames(path, FEATURES + ["SepsisIndicator", "UniqueID"], chunk_size):
+        frame = chunk[FEATURES].copy()
+        frame["label"] = chunk["SepsisIndicator"].astype(np.int8)
+        frame["group"] = chunk["UniqueID"]
+        frame["hour"] = chunk["HourOfObservation"].astype(float)
+        # Onset is the first hour labelled septic; merged across chunks by taking the minimum
+        frame["onset"] = np.where(frame["label"] == 1, frame["hour"], np.nan)
+        yield frame
+
+
+def history_features(raw, label_horizon=LABEL_HORIZON_HOURS):
+    """
+    Model features for rows of HISTORY_SQL whose measurements are already carried forward.
+    """
+    hours_since_visit = (raw["ts"] - raw["visit_date"]).dt.total_seconds() / 3600
+    frame = pd.DataFrame({
+        "HourOfObservation": hours_since_visit.round(),
+        "PatientAge": raw["age"],
+        "ICULengthOfStay": (raw["ts"] - raw["visit_date"].dt.normalize()).dt.total_seconds() / 86400,
+        "PatientGender": raw["gender"],
+        "TimeSinceHospitalAdmission": raw["hosp_adm_time"],
+    })
+    for column, name in {**VITALS_FEATURES, **LABS_FEATURES}.items():
+        frame[name] = raw[column].astype(float)
+    frame = frame[FEATURES]
+    onset = (raw["onset"] - raw["visit_date"]).dt.total_seconds() / 3600
+    frame["label"] = (onset.notna() & (hours_since_visit >= onset - label_horizon)).astype(np.int8)
+    frame["group"] = raw["visit_id"]
+    frame["hour"] = hours_since_visit
+    frame["onset"] = onset
+    return frame
+
+
+def db_chunks(since, until, chunk_size=CHUNK_SIZE, label_horizon=LABEL_HORIZON_HOURS):
+    """
+    Observation rows from Vitals/Labs in [since, until), read through a
+    server-side cursor; measurements are carried forward within each visit,
+    across chunk boundaries too.
+    """
+    from db import db_session
+
+    measurements = list(VITALS_FEATURES) + list(LABS_FEATURES)
+    with db_session() as conn:
+        with conn.cursor(name="backtest_history") as cur:
+            cur.itersize = chunk_size
+            cur.execute(HISTORY_SQL, {"since": since, "until": until})
+            columns = None
+            carry = None
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = columns or [desc[0] for desc in cur.description]
+                raw = pd.DataFrame(rows, columns=columns)
+                if carry is not None:
+                    raw = pd.concat([carry, raw], ignore_index=True)
+                raw[measurements] = raw.groupby("visit_id")[measurements].ffill()
+                if carry is not None:
+                    raw = raw.iloc[1:].reset_index(drop=True)
+                carry = raw.iloc[[-1]].copy()
+                raw = raw.assign(**{c: pd.to_datetime(raw[c]) for c in ("ts", "visit_date", "onset")})
+                yield history_features(raw, label_horizon)
+
+
+# ------------------------------
+# Partial statistics (computed per chunk in the workers, merged in the parent)
+# ------------------------------
+class BacktestStats:
+    def __init__(self):
+        self.rows = 0
+        self.histogram = np.zeros((2, AUROC_BINS), dtype=np.int64)
+        self.calibration = np.zeros((CALIBRATION_BINS, 3))  # rows, sum of scores, positives
+        self.brier = 0.0
+        # {cut: [flagged, flagged and positive]}
+        self.flagged = {name: np.zeros(2, dtype=np.int64) for name in CUTS}
+        # {group: [onset hour, first hour over each cut...]}, inf when never
+        self.groups = {}
+
+    @classmethod
+    def from_chunk(cls, frame, scores):
+        stats = cls()
+        labels = frame["label"].to_numpy()
+        stats.rows = len(labels)
+        bins = np.minimum((scores * AUROC_BINS).astype(int), AUROC_BINS - 1)
+        for label in (0, 1):
+            stats.histogram[label] = np.bincount(bins[labels == label], minlength=AUROC_BINS)
+        calibration_bins = np.minimum((scores * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+        stats.calibration[:, 0] = np.bincount(calibration_bins, minlength=CALIBRATION_BINS)
+        stats.calibration[:, 1] = np.bincount(calibration_bins, weights=scores, minlength=CALIBRATION_BINS)
+        stats.calibration[:, 2] = np.bincount(calibration_bins, weights=labels, minlength=CALIBRATION_BINS)
+        stats.brier = float(np.sum((scores - labels) ** 2))
+
+        per_group = pd.DataFrame({"group": frame["group"].to_numpy(), "onset": frame["onset"].fillna(np.inf).to_numpy()})
+        hours = frame["hour"].to_numpy()
+        for name, cut in CUTS.items():
+            over = scores >= cut
+            stats.flagged[name] = np.array([over.sum(), (over & (labels == 1)).sum()])
+            per_group[name] = np.where(over, hours, np.inf)
+        reduced = per_group.groupby("group").min()
+        stats.groups = dict(zip(reduced.index.tolist(), reduced.to_numpy()))
+        return stats
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.histogram += other.histogram
+        self.calibration += other.calibration
+        self.brier += other.brier
+        for name in CUTS:
+            self.flagged[name] += other.flagged[name]
+        for group, values in other.groups.items():
+            current = self.groups.get(group)
+            self.groups[group] = values if current is None else np.minimum(current, values)
+        return self
+
+    def auroc(self):
+        """
+        Mann-Whitney AUROC over the binned scores (ties within a bin count half).
+        """
+        negatives, positives = self.histogram
+        n_neg, n_pos = negatives.sum(), positives.sum()
+        if not n_neg or not n_pos:
+            return None
+        below = np.cumsum(negatives) - negatives
+        return float(np.sum(positives * (below + 0.5 * negatives)) / (n_neg * n_pos))
+
+    def lead_times(self):
+        """
+        {group: (onset hour, {cut: hours from first alert to onset, None if never alerted})} for septic groups.
+        """
+        names = list(CUTS)
+        result = {}
+        for group, values in self.groups.items():
+            onset = values[0]
+            if math.isinf(onset):
+                continue
+            result[group] = (float(onset), {
+                name: None if math.isinf(values[1 + i]) else float(onset - values[1 + i])
+                for i, name in enumerate(names)
+            })
+        return result
+
+    def report(self):
+        positives = int(self.histogram[1].sum())
+        calibration = [
+            {
+                "bin": f"{i / CALIBRATION_BINS:.1f}-{(i + 1) / CALIBRATION_BINS:.1f}",
+                "rows": int(rows),
+                "mean_score": round(sum_scores / rows, 4) if rows else None,
+                "observed_rate": round(sum_positive / rows, 4) if rows else None,
+            }
+            for i, (rows, sum_scores, sum_positive) in enumerate(self.calibration)
+        ]
+        ece = float(np.abs(self.calibration[:, 1] - self.calibration[:, 2]).sum() / self.rows) if self.rows else None
+
+        lead_times = self.lead_times()
+        septic_groups = len(lead_times)
+        non_septic = [values for values in self.groups.values() if math.isinf(values[0])]
+        alerts = {}
+        for i, (name, cut) in enumerate(CUTS.items()):
+            flagged, true_positive = (int(v) for v in self.flagged[name])
+            leads = [leads[name] for _, leads in lead_times.values() if leads[name] is not None]
+            early = [lead for lead in leads if lead >= 0]
+            alerts[name] = {
+                "threshold": cut,
+                "alert_rate": round(flagged / self.rows, 4) if self.rows else None,
+                "sensitivity": round(true_positive / positives, 4) if positives else None,
+                "ppv": round(true_positive / flagged, 4) if flagged else None,
+                "septic_patients_alerted_before_onset": round(len(early) / septic_groups, 4) if septic_groups else None,
+                "non_septic_patients_alerted": (
+                    round(sum(not math.isinf(v[1 + i]) for v in non_septic) / len(non_septic), 4)
+                    if non_septic else None
+                ),
+                "lead_time_hours": {
+                    "median": float(np.median(early)) if early else None,
+                    "p25": float(np.percentile(early, 25)) if early else None,
+                    "p75": float(np.percentile(early, 75)) if early else None,
+                },
+            }
+        return {
+            "rows": self.rows,
+            "positive_rows": positives,
+            "patients": len(self.groups),
+            "septic_patients": septic_groups,
+            "auroc": self.auroc(),
+            "brier": self.brier / self.rows if self.rows else None,
+            "expected_calibration_error": ece,
+            "calibration": calibration,
+            "alerts": alerts,
+        }
+
+
+# ------------------------------
+# Workers
+# ------------------------------
+_model = None
+
+
+def init_worker(model_path=MODEL_PATH):
+    """
+    Load the model once per worker; its own threading is turned off because
+    parallelism comes from the process pool.
+    """
+    global _model
+    _model = get_model(model_path)
+    if isinstance(_model, NativeModel):
+        _model.scorer.booster.set_param("nthread", 1)
+        return
+    estimator = _model.steps[-1][1] if hasattr(_model, "steps") else _model
+    try:
+        estimator.set_params(n_jobs=1)
+    except (AttributeError, ValueError):
+        pass
+
+
+def score_chunk(frame):
+    scores = _model.predict_proba(frame[FEATURES])[:, 1]
+    return BacktestStats.from_chunk(frame, scores)
+
+
+def run(chunks, workers=None, model_path=MODEL_PATH):
+    """
+    Score every chunk and return the merged BacktestStats. At most two chunks
+    per worker are in flight, so memory stays bounded however long chunks is.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = BacktestStats()
+    if workers == 1:
+        init_worker(model_path)
+        for frame in chunks:
+            stats.merge(score_chunk(frame))
+        return stats
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(model_path,)) as pool:
+        pending = deque()
+        for frame in chunks:
+            pending.append(pool.submit(score_chunk, frame))
+            if len(pending) >= 2 * workers:
+                stats.merge(pending.popleft().result())
+        while pending:
+            stats.merge(pending.popleft().result())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the sepsis model over historical feature rows")
+    parser.add_argument("source", choices=["csv", "parquet", "db"])
+    parser.add_argument("path", nargs="?",
+                        help="CSV or feature store dataset with model features, SepsisIndicator and UniqueID "
+                             f"(default: {CSV_PATH} / {DATASET_PATH})")
+    parser.add_argument("--since", help="first observation timestamp (db source)")
+    parser.add_argument("--until", help="end of the observation range, exclusive (db source)")
+    parser.add_argument("--label-horizon-hours", type=float, default=LABEL_HORIZON_HOURS,
+                        help="db source: rows this many hours before a sepsis diagnosis count as positive")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--per-id", help="write per-patient onset and lead times (CSV) here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.source in ("csv", "parquet"):
+        path = args.path or (CSV_PATH if args.source == "csv" else DATASET_PATH)
+        chunks = file_chunks(path, args.chunk_size)
+    else:
+        if not (args.since and args.until):
+            parser.error("the db source needs --since and --until")
+        chunks = db_chunks(args.since, args.until, args.chunk_size, args.label_horizon_hours)
+
+    start = time.perf_counter()
+    stats = run(chunks, args.workers, args.model)
+    elapsed = time.perf_counter() - start
+    report = stats.report()
+    report["elapsed_s"] = round(elapsed, 3)
+    report["rows_per_s"] = round(stats.rows / elapsed) if elapsed else None
+    logger.info("Scored %d rows with %d workers in %.1fs (%s rows/s)",
+                stats.rows, args.workers, elapsed, report["rows_per_s"])
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.per_id:
+        with open(args.per_id, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "onset_hour", *(f"lead_hours_{name}" for name in CUTS)])
+            for group, (onset, leads) in sorted(stats.lead_times().items()):
+                writer.writerow([group, onset, *(leads[name] for name in CUTS)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_alerts.py - alert rule evaluation throughput over a full census
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.bench_alerts --patients 20000 --passes 12
+#
+# Simulates --passes hourly batch rescoring passes over every admitted visit
+# (scores follow a random walk, so some visits cross the high-risk band or rise
+# quickly) and times alerts.evaluate per pass. The first pass creates the
+# AlertState rows; later ones show the steady-state cost the scheduler pays on
+# top of calculate_risk_batch.
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from alerts import evaluate
+from benchmarks.scratch_db import populate, scratch_schema
+from scoring import admitted_visit_ids
+
+SCHEMA = "bench_alerts"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert rule evaluation throughput")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--hours", type=int, default=4, help="Vitals/Labs/RiskScores rows per visit")
+    parser.add_argument("--passes", type=int, default=12, help="simulated hourly rescoring passes")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with scratch_schema(SCHEMA) as conn:
+        populate(conn, args.patients, hours=args.hours, discharged_ratio=0.0)
+        with conn.cursor() as cur:
+            visit_ids = admitted_visit_ids(cur)
+        scores = {visit_id: rng.uniform(0.0, 0.6) for visit_id in visit_ids}
+        start_at = datetime.now()
+
+        print(f"{'pass':>4} {'seconds':>9} {'visits/s':>10} {'alerts':>7}")
+        for i in range(args.passes):
+            for visit_id in visit_ids:
+                scores[visit_id] = min(max(scores[visit_id] + rng.gauss(0.0, 0.08), 0.0), 1.0)
+            generated_at = start_at + timedelta(hours=i)
+            start = time.perf_counter()
+            alerts = evaluate(conn, [(visit_id, score, generated_at) for visit_id, score in scores.items()])
+            conn.commit()
+            elapsed = time.perf_counter() - start
+            print(f"{i + 1:>4} {elapsed:>9.3f} {len(visit_ids) / elapsed:>10.0f} {len(alerts):>7}")
+
+
+if __name__ == "__main__":
+    main()
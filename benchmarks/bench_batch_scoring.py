@@ -0,0 +1,48 @@
+# benchmarks/bench_batch_scoring.py - per-visit vs. batch risk scoring throughput
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.bench_batch_scoring --patients 5000
+
+import argparse
+import time
+
+from benchmarks.scratch_db import populate, scratch_schema
+from model_registry import get_model
+from scoring import admitted_visit_ids, calculate_risk_batch
+
+SCHEMA = "bench_scoring"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-visit vs. batch scoring throughput")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--single-sample", type=int, default=200,
+                        help="visits to time through calculate_risk_batch one at a time")
+    args = parser.parse_args()
+
+    get_model()
+    with scratch_schema(SCHEMA) as conn:
+        populate(conn, args.patients, hours=args.hours, discharged_ratio=0.0)
+        with conn.cursor() as cur:
+            visit_ids = admitted_visit_ids(cur)
+
+        sample = visit_ids[:args.single_sample]
+        start = time.perf_counter()
+        for visit_id in sample:
+            calculate_risk_batch([visit_id], conn, write=False)
+        single = (time.perf_counter() - start) / max(len(sample), 1)
+
+        start = time.perf_counter()
+        scores = calculate_risk_batch(visit_ids, conn)
+        conn.commit()
+        batch = time.perf_counter() - start
+
+    print(f"one visit per call:   {single * 1000:.2f} ms/visit "
+          f"(~{single * len(visit_ids):.1f}s for {len(visit_ids)} visits)")
+    print(f"calculate_risk_batch: {batch:.3f}s for {len(scores)} visits "
+          f"({len(scores) / batch:.0f} visits/s, including the RiskScores insert)")
+
+
+if __name__ == "__main__":
+    main()
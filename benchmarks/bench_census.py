@@ -0,0 +1,86 @@
+# benchmarks/bench_census.py - All Admitted Patients page latency vs. patient count
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.bench_census --sizes 20,100,300,1000,2000
+#
+# Compares the original access pattern (one DISTINCT ON query, then one new
+# connection + diagnosis query per patient) with the first page of
+# queries.fetch_census(), which the page now renders.
+
+import argparse
+import statistics
+import time
+
+from benchmarks.scratch_db import connect, populate, scratch_schema
+from queries import fetch_census
+
+SCHEMA = "bench_census"
+
+
+def legacy_census(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT ON (p.patient_id) p.patient_id, p.firstname, p.lastname, p.age, p.gender, r.score, v.location
+            FROM Patients p
+            JOIN Visits v ON p.patient_id = v.patient_id
+            JOIN RiskScores r ON v.visit_id = r.visit_id
+            WHERE p.status = 'admitted'
+            AND r.score IS NOT NULL
+            ORDER BY p.patient_id, r.generated_at DESC
+        """)
+        rows = sorted(cur.fetchall(), key=lambda row: row[5], reverse=True)
+    for row in rows:
+        conn_diag = connect(SCHEMA)
+        cur_diag = conn_diag.cursor()
+        cur_diag.execute(
+            "SELECT sepsis FROM Diagnosis WHERE visit_id = (SELECT visit_id FROM Visits WHERE patient_id = %s ORDER BY diagnosis_datetime DESC LIMIT 1)",
+            (row[0],)
+        )
+        cur_diag.fetchone()
+        cur_diag.close()
+        conn_diag.close()
+    return rows
+
+
+def set_based_census(conn):
+    with conn.cursor() as cur:
+        page = fetch_census(cur)
+    conn.commit()
+    return page
+
+
+def measure(fn, conn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(conn)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="All Admitted Patients latency vs. patient count")
+    parser.add_argument("--sizes", default="20,100,300,1000,2000",
+                        help="comma-separated patient counts")
+    parser.add_argument("--hours", type=int, default=24, help="risk scores per visit")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--skip-legacy-above", type=int, default=2000,
+                        help="don't time the N+1 path for larger censuses")
+    args = parser.parse_args()
+
+    print(f"{'patients':>9} {'admitted':>9} {'legacy p50':>11} {'legacy p95':>11} {'set p50':>9} {'set p95':>9}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        with scratch_schema(SCHEMA) as conn:
+            populate(conn, n, hours=args.hours)
+            admitted = set_based_census(conn).matched
+            if n <= args.skip_legacy_above:
+                legacy = measure(legacy_census, conn, args.repeat)
+            else:
+                legacy = (float("nan"), float("nan"))
+            fast = measure(set_based_census, conn, args.repeat)
+        print(f"{n:>9} {admitted:>9} {legacy[0]:>9.1f}ms {legacy[1]:>9.1f}ms {fast[0]:>7.1f}ms {fast[1]:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
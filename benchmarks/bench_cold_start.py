@@ -0,0 +1,118 @@
+# benchmarks/bench_cold_start.py - app startup and first-score cost, pickle vs. native artifact
+#
+# Usage (from the repository root, after python export_model.py):
+#   python -m benchmarks.bench_cold_start --repeat 5
+#
+# Every measurement runs in a fresh interpreter, so import and load costs are
+# paid each time:
+#   login     render app.py's login page with Streamlit's AppTest (no database
+#             access happens before a login attempt)
+#   eager     the same after importing scoring and loading the pickle first,
+#             i.e. the cost when the model was loaded ahead of the login form
+#   score     import scoring and score one df_balanced.csv row, once with the
+#             pickle and once with the exported artifact (SEPSIS_MODEL_PATH)
+# Reported: wall time, resident set size and which heavy libraries ended up
+# imported. Exits non-zero if rendering the login page imported sklearn or
+# xgboost.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.scratch_db import REPO_ROOT
+from model_registry import PICKLE_PATH, default_model_path
+
+HEAVY = ("numpy", "pandas", "joblib", "sklearn", "xgboost")
+
+PRELUDE = """
+import json, sys, time
+start = time.perf_counter()
+"""
+
+REPORT = """
+from model_registry import _rss_bytes
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss": _rss_bytes(),
+    "imported": sorted({m.split(".")[0] for m in sys.modules} & set(%r)),
+}))
+""" % (HEAVY,)
+
+LOGIN = """
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120).run()
+assert not at.exception, at.exception
+"""
+
+EAGER = """
+from model_registry import get_model
+import scoring
+get_model()
+""" + LOGIN
+
+SCORE = """
+import csv
+with open("ML_model_development/df_balanced.csv") as f:
+    row = {k: float(v) for k, v in next(csv.DictReader(f)).items()}
+start = time.perf_counter()
+from scoring import predict_with_contributions
+predict_with_contributions([row])
+"""
+
+CASES = {
+    "login": (LOGIN, None),
+    "eager": (EAGER, PICKLE_PATH),
+    "score (pickle)": (SCORE, PICKLE_PATH),
+    "score (artifact)": (SCORE, "artifact"),
+}
+
+
+def measure(code, model_path, repeat):
+    env = dict(os.environ)
+    if model_path:
+        env["SEPSIS_MODEL_PATH"] = model_path
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PRELUDE + code + REPORT],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(r["seconds"] for r in results),
+        "rss": statistics.median(r["rss"] or 0 for r in results),
+        "imported": results[-1]["imported"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start cost of the login page and the first score")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    artifact = default_model_path()
+    if artifact == PICKLE_PATH:
+        print("No exported artifact (run python export_model.py); skipping the artifact case")
+
+    print(f"{'case':<18} {'time':>9} {'RSS':>9}  imported")
+    failed = False
+    for name, (code, model_path) in CASES.items():
+        if model_path == "artifact":
+            if artifact == PICKLE_PATH:
+                continue
+            model_path = artifact
+        result = measure(code, model_path, args.repeat)
+        print(f"{name:<18} {result['seconds'] * 1000:>7.0f}ms {result['rss'] / 2**20:>7.0f}MB  "
+              f"{', '.join(result['imported']) or '-'}")
+        if name == "login" and {"sklearn", "xgboost"} & set(result["imported"]):
+            failed = True
+    if failed:
+        print("The login page imported sklearn or xgboost")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_fast_inference.py - parity check and latency of the compiled scoring path
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_fast_inference --iterations 2000
+#
+# 1. Parity: scores every row of the training data (df_balanced.csv, or its
+#    feature_store.py conversion) with model.predict_proba and with
+#    fast_inference.CompiledScorer, plus the same rows with the app's string
+#    genders and with values knocked out (to exercise the imputers), and exits
+#    non-zero if any probability differs by more than --tolerance.
+# 2. Latency: p50/p99 of single-row scoring through the pipeline vs. the
+#    compiled path.
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fast_inference import CompiledScorer
+from feature_store import default_data_path, read_frame
+from model_registry import PICKLE_PATH, get_model
+from scoring import FEATURES
+
+DATA_PATH = default_data_path()
+
+
+def parity(model, scorer, X):
+    expected = model.predict_proba(X)[:, 1]
+    actual = scorer.predict_proba(X)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def percentiles(fn, rows, iterations):
+    timings = []
+    for i in range(iterations):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled scoring path: parity and latency")
+    parser.add_argument("--model", default=PICKLE_PATH, help="pickled pipeline")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    model = get_model(args.model)
+    scorer = CompiledScorer.from_pipeline(model, FEATURES)
+    X = read_frame(args.data, FEATURES)
+
+    # Variants the app actually produces: text genders from Patients.gender and
+    # missing vitals/labs when only one of the two was entered
+    X_text_gender = X.assign(PatientGender=X["PatientGender"].map({0: "female", 1: "male"}).fillna("other"))
+    rng = np.random.default_rng(0)
+    X_missing = X.astype(object).mask(rng.random(X.shape) < 0.2, None)
+
+    failed = False
+    for name, frame in [("df_balanced", X), ("text gender", X_text_gender), ("20% missing", X_missing)]:
+        diff = parity(model, scorer, frame)
+        ok = diff <= args.tolerance
+        failed |= not ok
+        print(f"parity {name:<12} rows={len(frame):>6} max|diff|={diff:.2e} {'ok' if ok else 'FAIL'}")
+
+    rows = X.to_numpy(dtype=object)
+    frames = [X.iloc[[i]] for i in range(min(len(X), 500))]
+    pipe_p50, pipe_p99 = percentiles(lambda df: model.predict_proba(df)[0, 1], frames, args.iterations)
+    fast_p50, fast_p99 = percentiles(scorer.score_one, rows, args.iterations)
+    print(f"pipeline predict_proba (1 row): p50={pipe_p50:8.1f}us p99={pipe_p99:8.1f}us")
+    print(f"CompiledScorer.score_one:       p50={fast_p50:8.1f}us p99={fast_p99:8.1f}us")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_feature_store.py - loading the training rows: CSV vs. the Parquet feature store
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_feature_store --repeat 5
+#   python -m benchmarks.bench_feature_store --csv big_history.csv --dataset big_history.parquet
+#
+# Converts --csv into --dataset first if it isn't there (in a temporary
+# directory unless --dataset is given), then times what train.py and
+# export_model.py do: read the model features into one DataFrame (CSV parsed
+# with pandas' inferred dtypes vs. the typed dataset with only FEATURES
+# decoded), and what backtest.py does: stream them in chunks. Reported: median
+# wall time and the DataFrame's memory.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from feature_store import CSV_PATH, convert, is_dataset, iter_frames, read_frame
+from queries import FEATURES
+
+
+def timed(fn, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def stream(path, chunk_size):
+    rows = 0
+    for frame in iter_frames(path, FEATURES, chunk_size):
+        rows += len(frame)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV vs. Parquet feature store load time and memory")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--dataset", help="converted dataset (default: convert --csv into a temporary directory)")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = args.dataset or os.path.join(tmp, "dataset")
+        if not is_dataset(dataset):
+            seconds, manifest = timed(lambda: convert(args.csv, dataset), 1)
+            print(f"converted {manifest['rows']} rows into {len(manifest['partitions'])} partitions in {seconds:.2f}s")
+
+        print(f"{'case':<22} {'time':>9} {'memory':>9}")
+        for name, path in (("csv", args.csv), ("parquet", dataset)):
+            seconds, frame = timed(lambda: read_frame(path, FEATURES), args.repeat)
+            memory = frame.memory_usage(deep=True).sum()
+            print(f"{name + ' read_frame':<22} {seconds * 1000:>7.0f}ms {memory / 2**20:>7.1f}MB")
+            seconds, rows = timed(lambda: stream(path, args.chunk_size), args.repeat)
+            print(f"{name + ' iter_frames':<22} {seconds * 1000:>7.0f}ms {'':>9}  ({rows} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# benchmarks/check_query_plans.py - query-plan regression check for the app's read queries
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.check_query_plans --patients 20000 --hours 100
+#
+# Loads a synthetic dataset (patients * hours rows in each of Vitals, Labs and
+# RiskScores; 2M rows with the defaults) into a scratch schema built from
+# setup.sql and its migrations, then runs EXPLAIN on every query in queries.py.
+# Exits non-zero if any of them falls back to a sequential scan on a table that
+# grows with patient history, so a dropped or mismatched index fails CI.
+#
+# Vitals, Labs and RiskScores also get --history-months of older (empty)
+# partitions; the latest-row and trend queries are run with EXPLAIN ANALYZE and fail if
+# they touch any partition that ended before the visits began, i.e. if
+# partition pruning was lost.
+
+import argparse
+import json
+import sys
+from datetime import datetime
+
+import queries
+from benchmarks.scratch_db import populate, scratch_schema
+from partitions import list_partitions, partitioned_tables
+
+SCHEMA = "plan_check"
+
+# Tiny lookup tables where the planner is right to prefer a sequential scan
+SEQ_SCAN_ALLOWED = {"users"}
+
+# Per-visit queries that must prune partitions older than the visit
+PRUNED_CASES = {"latest_score", "stale_visits", "trend"}
+
+
+def plan_cases(cur):
+    """
+    (name, sql, params) for every query in queries.py, with parameters taken
+    from a real admitted patient in the scratch data.
+    """
+    cur.execute("""
+        SELECT p.patient_id, v.visit_id
+        FROM Patients p JOIN Visits v ON v.patient_id = p.patient_id
+        WHERE p.status = 'admitted'
+        ORDER BY p.patient_id
+        LIMIT 1
+    """)
+    patient_id, visit_id = cur.fetchone()
+    return [
+        ("login", queries.LOGIN_SQL, ("nurse1",)),
+        ("patient", queries.PATIENT_SQL, (patient_id,)),
+        ("latest_visit", queries.LATEST_VISIT_SQL, (patient_id,)),
+        ("visit_on_date", queries.VISIT_ON_DATE_SQL, (patient_id, datetime.now())),
+        ("visit_details", queries.VISIT_DETAILS_SQL, (visit_id,)),
+        ("icu_length_of_stay", queries.ICU_LENGTH_OF_STAY_SQL, (visit_id,)),
+        ("latest_score", queries.LATEST_SCORE_SQL, (visit_id,)),
+        ("trend", queries.TREND_SQL, {"visit_id": visit_id, "series": ["score", "hr", "lactate"], "buckets": 800}),
+        ("recent_alerts", queries.RECENT_ALERTS_SQL, (visit_id,)),
+        ("latest_diagnosis", queries.DIAGNOSIS_LATEST_SQL, (visit_id,)),
+        ("features", queries.FEATURES_SQL, (visit_id,)),
+        ("admitted_visits", queries.ADMITTED_VISITS_SQL, None),
+        ("stale_visits", queries.STALE_VISITS_SQL, (3600,)),
+        ("batch_features", queries.BATCH_FEATURES_SQL, ([visit_id, visit_id + 1, visit_id + 2],)),
+        ("census", *queries.census_query()),
+        ("census_next_page", *queries.census_query("name", after=("Last1", "First1", patient_id))),
+        ("census_search", *queries.census_query("room", search="First12")),
+        ("census_room_search", *queries.census_query("room", search="R001")),
+    ]
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def empty_partitions(cur):
+    """
+    Partitions without rows, which the planner may reasonably seq-scan.
+    """
+    cur.execute("SELECT relname FROM pg_class WHERE relispartition AND reltuples <= 0")
+    return {row[0] for row in cur.fetchall()}
+
+
+def history_partitions(cur):
+    """
+    Partitions that end before the earliest Visits.observations_from in the
+    data, i.e. ones no latest-row query should ever have to read.
+    """
+    cur.execute("SELECT min(observations_from) FROM Visits")
+    floor = cur.fetchone()[0]
+    return {
+        partition
+        for table, _, _ in partitioned_tables(cur)
+        for partition, _, upper in list_partitions(cur, table)
+        if upper <= floor
+    }
+
+
+def check_plan(plan, seq_scan_allowed=SEQ_SCAN_ALLOWED):
+    """
+    Return a list of problems found in an EXPLAIN (FORMAT JSON) plan.
+    """
+    problems = []
+    nodes = list(walk(plan["Plan"]))
+    for node in nodes:
+        relation = node.get("Relation Name", "").lower()
+        if node["Node Type"] == "Seq Scan" and relation not in seq_scan_allowed:
+            problems.append(f"sequential scan on {relation}")
+    if not any("Index" in node["Node Type"] for node in nodes):
+        problems.append("no index scan in plan")
+    return problems
+
+
+def check_pruning(plan, history):
+    """
+    Return a list of problems found in an EXPLAIN (ANALYZE, FORMAT JSON) plan:
+    history partitions that were actually scanned.
+    """
+    scanned = {
+        node["Relation Name"].lower()
+        for node in walk(plan["Plan"])
+        if "Relation Name" in node and node.get("Actual Loops", 0) > 0
+    }
+    return [f"partition {name} not pruned" for name in sorted(scanned & history)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assert that the app's queries use indexes")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--hours", type=int, default=100, help="Vitals/Labs/RiskScores rows per visit")
+    parser.add_argument("--discharged-ratio", type=float, default=0.95,
+                        help="share of historical patients already discharged")
+    parser.add_argument("--history-months", type=int, default=12,
+                        help="empty partitions to create before the synthetic data")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    failures = 0
+    with scratch_schema(SCHEMA) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT create_time_partitions(table_name, LOCALTIMESTAMP - %s * interval '1 month', LOCALTIMESTAMP)
+                FROM TimePartitioning
+            """, (args.history_months,))
+        populate(conn, args.patients, hours=args.hours, discharged_ratio=args.discharged_ratio)
+        with conn.cursor() as cur:
+            seq_scan_allowed = SEQ_SCAN_ALLOWED | empty_partitions(cur)
+            history = history_partitions(cur)
+            for name, sql, params in plan_cases(cur):
+                analyze = name in PRUNED_CASES
+                cur.execute(("EXPLAIN (ANALYZE, FORMAT JSON) " if analyze else "EXPLAIN (FORMAT JSON) ") + sql, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                plan = plan[0]
+                problems = check_plan(plan, seq_scan_allowed)
+                if analyze:
+                    problems += check_pruning(plan, history)
+                status = "FAIL" if problems else "ok"
+                print(f"{status:>4}  {name:<18} cost={plan['Plan']['Total Cost']:.1f}"
+                      + (f"  ({'; '.join(problems)})" if problems else ""))
+                if args.verbose or problems:
+                    print(json.dumps(plan["Plan"], indent=2))
+                failures += bool(problems)
+        conn.rollback()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
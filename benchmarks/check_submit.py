@@ -0,0 +1,98 @@
+# benchmarks/check_submit.py - end-to-end check of the "Submit Vitals and Labs" write path
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.check_submit
+#
+# Runs scoring.submit_observations with the shipped model against a scratch
+# schema, the way app.py does on submit (form values as floats, patient and
+# visit attributes as the lookup cache returns them), then reads back what it
+# wrote. Exits non-zero if the call raises or if the Vitals, Labs or RiskScores
+# rows are missing or disagree with the returned score, so a broken submit path
+# fails CI instead of showing "An error occurred" on the ward.
+
+import math
+import sys
+import traceback
+from datetime import datetime
+
+from benchmarks.scratch_db import populate, scratch_schema
+from queries import FEATURES
+from scoring import LABS_COLUMNS, VITALS_COLUMNS, submit_observations
+
+SCHEMA = "submit_check"
+
+# Form values as st.number_input returns them (0.0 for untouched fields)
+VITALS = {"temp": 38.4, "hr": 118.0, "sbp": 92.0, "dbp": 55.0, "map": 67.0, "resp": 26.0, "o2sat": 91.0}
+LABS = {"wbc": 15.2, "creatinine": 1.8, "bilirubin_total": 1.4, "bilirubin_direct": 0.0,
+        "platelets": 140.0, "lactate": 3.1}
+
+
+def matches(rows, expected):
+    """rows is exactly one row equal to expected (up to REAL precision)."""
+    return len(rows) == 1 and all(math.isclose(a, b, rel_tol=1e-6) for a, b in zip(rows[0], expected))
+
+
+def check_rows(cur, visit_id, observed_at, score):
+    """
+    Return a list of problems with the rows submit_observations wrote.
+    """
+    problems = []
+    cur.execute(f"SELECT {', '.join(VITALS_COLUMNS)} FROM Vitals WHERE visit_id = %s AND timestamp = %s",
+                (visit_id, observed_at))
+    rows = cur.fetchall()
+    if not matches(rows, [VITALS[c] for c in VITALS_COLUMNS]):
+        problems.append(f"Vitals rows {rows}")
+    cur.execute(f"SELECT {', '.join(LABS_COLUMNS)} FROM Labs WHERE visit_id = %s AND timestamp = %s",
+                (visit_id, observed_at))
+    rows = cur.fetchall()
+    if not matches(rows, [LABS[c] for c in LABS_COLUMNS]):
+        problems.append(f"Labs rows {rows}")
+
+    cur.execute("SELECT score, contributions FROM RiskScores WHERE visit_id = %s AND generated_at = %s",
+                (visit_id, observed_at))
+    rows = cur.fetchall()
+    if len(rows) != 1:
+        return problems + [f"{len(rows)} RiskScores rows"]
+    stored, contributions = rows[0]
+    if not 0.0 <= score <= 1.0 or not math.isclose(stored, score, abs_tol=1e-6):
+        problems.append(f"stored score {stored} vs. returned {score}")
+    if contributions is None or len(contributions) != len(FEATURES) + 1:
+        problems.append(f"contributions {contributions!r}")
+    elif 0.0 < score < 1.0 and not math.isclose(sum(contributions), math.log(score / (1 - score)), abs_tol=1e-3):
+        problems.append(f"contributions sum to {sum(contributions):.4f}, not the score's log-odds")
+    return problems
+
+
+def main():
+    with scratch_schema(SCHEMA) as conn:
+        populate(conn, 10, hours=4, discharged_ratio=0.0)
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT v.visit_id, p.age, p.gender, v.visit_date, v.hosp_adm_time
+                FROM Visits v JOIN Patients p ON p.patient_id = v.patient_id
+                ORDER BY v.visit_id
+                LIMIT 1
+            """)
+            visit_id, age, gender, visit_date, hosp_adm_time = cur.fetchone()
+
+        observed_at = datetime.now().replace(microsecond=0)
+        try:
+            score = submit_observations(conn, visit_id, "nurse1", VITALS, LABS, patient=(age, gender),
+                                        visit=(visit_date, hosp_adm_time), observed_at=observed_at)
+            conn.commit()
+        except Exception:
+            traceback.print_exc()
+            print("FAIL  submit_observations raised")
+            sys.exit(1)
+
+        with conn.cursor() as cur:
+            problems = check_rows(cur, visit_id, observed_at, score)
+    for problem in problems:
+        print(f"FAIL  {problem}")
+    if not problems:
+        print(f"  ok  submit_observations scored visit {visit_id}: {score:.4f}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
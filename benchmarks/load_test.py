@@ -0,0 +1,314 @@
+# benchmarks/load_test.py - end-to-end load test of app.py with simulated clinicians
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.load_test --patients 2000 --sessions 16 --iterations 20 \
+#       --save-baseline benchmarks/baselines/load_test.json
+#   python -m benchmarks.load_test --patients 2000 --sessions 16 --iterations 20 \
+#       --baseline benchmarks/baselines/load_test.json       # exits 1 on regression
+#
+# A scratch schema is filled by benchmarks.workload, then --sessions threads
+# each drive their own Streamlit AppTest session through app.py, like one
+# browser tab each against a single server process (so the connection pool,
+# lookup cache and model registry are shared as in production). Nurses log in,
+# open the census, look up a random admitted patient and submit a set of vitals
+# and labs; physicians do the same without the submission.
+#
+# Latency is reported per user action (wall time of the AppTest rerun), per
+# page and per normalized SQL statement (from telemetry.py traces), as
+# p50/p95/p99 in milliseconds, along with overall actions per second. With
+# --baseline, any action or page whose p95 grew by more than --tolerance, or a
+# throughput drop of more than --tolerance, fails the run. Any session error
+# (an exception in app.py or a failed action) fails it too, with or without
+# --baseline, and such a run is never saved as a baseline.
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.scratch_db import REPO_ROOT, scratch_schema
+from benchmarks.workload import populate_workload
+from telemetry import add_sink, remove_sink
+
+SCHEMA = "bench_load"
+APP = os.path.join(REPO_ROOT, "app.py")
+PASSWORD = "sepsis"
+
+# Vitals/labs form labels in app.py and the workload columns that fill them
+FORM_FIELDS = {
+    "Temperature (°C)": "Temperature",
+    "Heart Rate (bpm)": "HeartRate",
+    "Systolic BP (mm Hg)": "SystolicBloodPressure",
+    "Diastolic BP (mm Hg)": "DiastolicBloodPressure",
+    "MAP (mm Hg)": "MeanArterialPressure",
+    "Respiration Rate (breaths/min)": "RespiratoryRate",
+    "Oxygen Saturation (%)": "OxygenSaturation",
+    "White Blood Cell Count": "WhiteBloodCellCount",
+    "Creatinine": "CreatinineLevel",
+    "Total Bilirubin": "TotalBilirubin",
+    "Platelets": "PlateletCount",
+    "Lactate": "LactateLevel",
+}
+
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\?(?:\s*,\s*\?)+"), "?, ..."),
+]
+
+
+def normalize_statement(text):
+    """
+    Statement text with literals replaced by ?, so executions group by query shape.
+    """
+    for pattern, replacement in LITERALS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def summarize(samples):
+    return {
+        name: {"count": len(values), **{k: round(v, 3) for k, v in percentiles(values).items()}}
+        for name, values in sorted(samples.items())
+    }
+
+
+class Collector:
+    """
+    Per-action timings from the sessions plus per-page/per-query timings from telemetry traces.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.actions = defaultdict(list)
+        self.pages = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.spans = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def action(self, name, seconds, error=None):
+        if not self.recording:
+            return
+        with self.lock:
+            self.actions[name].append(seconds * 1000)
+            if error:
+                self.errors[f"{name}: {error}"[:200]] += 1
+
+    def trace(self, entry):
+        if not self.recording:
+            return
+        with self.lock:
+            self.pages[entry["page"]].append(entry["duration_ms"])
+            for span in entry["spans"]:
+                if span["name"] == "db.query":
+                    self.queries[normalize_statement(span["statement"])].append(span["duration_ms"])
+                else:
+                    self.spans[span["name"]].append(span["duration_ms"])
+
+
+def widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    return None
+
+
+class Session:
+    """
+    One simulated clinician driving app.py through AppTest.
+    """
+
+    def __init__(self, role, collector, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.username = "nurse1" if role == "nurse" else "physician1"
+        self.role = role
+        self.collector = collector
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def step(self, name):
+        start = time.perf_counter()
+        error = None
+        try:
+            self.at.run()
+            if self.at.exception:
+                error = self.at.exception[0].message
+            elif self.at.error:
+                error = self.at.error[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.collector.action(name, time.perf_counter() - start, error)
+        return error is None
+
+    def click(self, label, name, sidebar=False):
+        button = widget(self.at.sidebar.button if sidebar else self.at.button, label)
+        if button is None:
+            self.collector.action(name, 0.0, f"no button {label!r}")
+            return False
+        button.click()
+        return self.step(name)
+
+    def login(self):
+        self.step("open")
+        widget(self.at.text_input, "Username").input(self.username)
+        widget(self.at.text_input, "Password").input(PASSWORD)
+        return self.click("Login", "login")
+
+    def visit(self, patient_id, observation, think_time):
+        self.click("All Admitted Patients", "census", sidebar=True)
+        time.sleep(think_time)
+        self.click("Patient Lookup", "lookup_page", sidebar=True)
+        widget(self.at.text_input, "Enter Patient ID").input(patient_id)
+        if not self.click("Search", "lookup"):
+            return
+        time.sleep(think_time)
+        if self.role != "nurse" or not self.click("Update Labs and Vitals", "entry_form"):
+            return
+        for label, column in FORM_FIELDS.items():
+            field = widget(self.at.number_input, label)
+            if field is not None:
+                field.set_value(round(float(observation[column]), 2))
+        self.click("Submit Vitals and Labs", "submit")
+        time.sleep(think_time)
+
+
+def run_session(index, patients, observations, collector, args):
+    rng = random.Random(args.seed + index)
+    role = "nurse" if index % 2 == 0 else "physician"
+    session = Session(role, collector, args.timeout)
+    if not session.login():
+        return
+    for _ in range(args.iterations):
+        patient = patients.iloc[rng.randrange(len(patients))]
+        observation = observations.iloc[rng.randrange(len(observations))]
+        session.visit(patient["patient_id"], observation, args.think_time)
+
+
+def compare(report, baseline, tolerance):
+    """
+    Regressions of report against baseline, as human-readable strings.
+    """
+    failures = []
+    for section in ("actions", "pages"):
+        for name, base in baseline.get(section, {}).items():
+            current = report[section].get(name)
+            if current is None:
+                failures.append(f"{section}/{name}: missing from this run")
+            elif current["p95"] > base["p95"] * (1 + tolerance):
+                failures.append(f"{section}/{name}: p95 {current['p95']:.1f}ms vs baseline {base['p95']:.1f}ms")
+    base_throughput = baseline.get("throughput_per_s")
+    if base_throughput and report["throughput_per_s"] < base_throughput * (1 - tolerance):
+        failures.append(f"throughput {report['throughput_per_s']:.1f}/s vs baseline {base_throughput:.1f}/s")
+    return failures
+
+
+def print_table(title, summary, limit=None):
+    print(f"\n{title}")
+    print(f"{'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  name")
+    rows = sorted(summary.items(), key=lambda item: -item[1]["p95"])
+    for name, s in rows[:limit]:
+        print(f"{s['count']:>7} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of app.py with simulated sessions")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated clinicians")
+    parser.add_argument("--iterations", type=int, default=10, help="census/lookup/submit rounds per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between actions")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds allowed per rerun")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--save-baseline", help="write the JSON report as the new baseline")
+    parser.add_argument("--baseline", help="fail if this run regressed against the baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative p95 growth / throughput drop vs. the baseline")
+    args = parser.parse_args()
+
+    collector = Collector()
+    add_sink(collector.trace)
+    try:
+        with scratch_schema(SCHEMA) as conn:
+            patients, observations = populate_workload(conn, args.patients, args.hours, seed=args.seed)
+            patients = patients[patients["status"] == "admitted"].reset_index(drop=True)
+            # The app's pool connects lazily with libpq, which picks up the scratch schema from here
+            os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA},public"
+
+            # One untimed round warms the pool, the cache and the model registry
+            run_session(0, patients, observations, collector, argparse.Namespace(**{**vars(args), "iterations": 1}))
+            collector.recording = True
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                futures = [
+                    pool.submit(run_session, i, patients, observations, collector, args)
+                    for i in range(args.sessions)
+                ]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - start
+            collector.recording = False
+    finally:
+        remove_sink(collector.trace)
+        os.environ.pop("PGOPTIONS", None)
+
+    total = sum(len(v) for v in collector.actions.values())
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "save_baseline", "baseline")},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(total / elapsed, 3),
+        "errors": dict(collector.errors),
+        "actions": summarize(collector.actions),
+        "pages": summarize(collector.pages),
+        "spans": summarize(collector.spans),
+        "queries": summarize(collector.queries),
+    }
+
+    print(f"{total} actions from {args.sessions} sessions in {elapsed:.1f}s "
+          f"({report['throughput_per_s']:.1f} actions/s, {sum(collector.errors.values())} errors)")
+    print_table("Per action", report["actions"])
+    print_table("Per page", report["pages"])
+    print_table("Spans", report["spans"])
+    print_table("Slowest queries (by p95)", report["queries"], limit=15)
+
+    if collector.errors:
+        print("\nSession errors:")
+        for error, count in sorted(collector.errors.items(), key=lambda item: -item[1]):
+            print(f"{count:>7}  {error}")
+    for path in (args.output, None if collector.errors else args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+    if collector.errors:
+        if args.save_baseline:
+            print(f"\nNot saving {args.save_baseline}: the run had errors")
+        sys.exit(1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.tolerance)
+        if failures:
+            print("\nPerformance regressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
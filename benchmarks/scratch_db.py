@@ -0,0 +1,125 @@
+# benchmarks/scratch_db.py - throwaway schemas with synthetic data for benchmarks
+#
+# Everything is created inside a dedicated schema of the configured database
+# (see db.DB_CONFIG), so benchmarks never touch the real tables and clean up
+# after themselves.
+
+import os
+import re
+from contextlib import contextmanager
+
+import psycopg2
+
+from db import DB_CONFIG
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETUP_SQL = os.path.join(REPO_ROOT, "setup.sql")
+
+
+def schema_sql(path=SETUP_SQL):
+    """
+    The part of setup.sql that runs inside the database (after \\connect), with
+    psql \\ir includes inlined and other meta-commands dropped.
+    """
+    with open(path) as f:
+        text = f.read()
+    text = text.split("\\connect", 1)[-1].split("\n", 1)[-1] if "\\connect" in text else text
+    out = []
+    for line in text.splitlines():
+        include = re.match(r"\s*\\ir?\s+(\S+)", line)
+        if include:
+            out.append(schema_sql(os.path.join(os.path.dirname(path), include.group(1))))
+        elif not line.lstrip().startswith("\\"):
+            out.append(line)
+    return "\n".join(out)
+
+
+def connect(schema, **overrides):
+    """
+    New connection whose search_path points at schema.
+    """
+    config = dict(DB_CONFIG, **overrides)
+    return psycopg2.connect(options=f"-c search_path={schema},public", **config)
+
+
+@contextmanager
+def scratch_schema(name="bench", keep=False):
+    """
+    Create schema name with the setup.sql tables and seed users, yield a
+    connection bound to it, and drop everything on exit (unless keep).
+    """
+    admin = psycopg2.connect(**DB_CONFIG)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        cur.execute(f"CREATE SCHEMA {name}")
+    conn = connect(name)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(schema_sql())
+        conn.commit()
+        yield conn
+    finally:
+        conn.close()
+        if not keep:
+            with admin.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        admin.close()
+
+
+def populate(conn, n_patients, hours=24, discharged_ratio=0.2, sepsis_ratio=0.1, seed=0.42):
+    """
+    Fill the scratch schema with n_patients, one visit each, and hourly
+    Vitals, Labs and RiskScores rows for every visit (n_patients * hours rows
+    per table). Random values are uniform; this is for plan and latency
+    measurements, not for modelling.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", (seed,))
+        # Partitions for the whole generated time range (see migrations/004_partitioning.sql)
+        cur.execute("""
+            SELECT create_time_partitions(table_name, LOCALTIMESTAMP - %s * interval '1 hour' - interval '2 days',
+                                          LOCALTIMESTAMP + interval '1 day')
+            FROM TimePartitioning
+        """, (hours,))
+        cur.execute("""
+            INSERT INTO Patients (patient_id, firstname, lastname, age, gender, created_at, status)
+            SELECT 'P' || lpad(g::text, 8, '0'), 'First' || g, 'Last' || g, 18 + g %% 75,
+                   (ARRAY['male','female','other'])[1 + g %% 3], now() - interval '60 days',
+                   CASE WHEN random() < %s THEN 'discharged' ELSE 'admitted' END
+            FROM generate_series(1, %s) g
+        """, (discharged_ratio, n_patients))
+        cur.execute("""
+            INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos, location)
+            SELECT patient_id, 'nurse1', now() - %s * interval '1 hour' - random() * interval '1 day',
+                   random() * 48, 0, 'R' || lpad(row_number() OVER (ORDER BY patient_id)::text, 4, '0')
+            FROM Patients
+        """, (hours,))
+        cur.execute("""
+            INSERT INTO Vitals (visit_id, entered_by, temp, hr, sbp, dbp, map, resp, o2sat, timestamp)
+            SELECT v.visit_id, 'nurse1', 36 + random() * 3, 60 + random() * 60, 90 + random() * 60,
+                   50 + random() * 40, 60 + random() * 40, 12 + random() * 16, 88 + random() * 12,
+                   v.visit_date + h * interval '1 hour'
+            FROM Visits v, generate_series(1, %s) h
+        """, (hours,))
+        cur.execute("""
+            INSERT INTO Labs (visit_id, entered_by, wbc, creatinine, bilirubin_total, bilirubin_direct,
+                              platelets, lactate, timestamp)
+            SELECT v.visit_id, 'nurse1', 4 + random() * 16, 0.5 + random() * 3, 0.2 + random() * 3,
+                   random(), 100 + random() * 300, 0.5 + random() * 4,
+                   v.visit_date + h * interval '1 hour'
+            FROM Visits v, generate_series(1, %s) h
+        """, (hours,))
+        cur.execute("""
+            INSERT INTO RiskScores (visit_id, score, generated_at)
+            SELECT v.visit_id, random(), v.visit_date + h * interval '1 hour'
+            FROM Visits v, generate_series(1, %s) h
+        """, (hours,))
+        cur.execute("""
+            INSERT INTO Diagnosis (visit_id, sepsis, diagnosed_by, diagnosis_datetime)
+            SELECT visit_id, TRUE, 'physician1', visit_date + interval '2 hours'
+            FROM Visits
+            WHERE random() < %s
+        """, (sepsis_ratio,))
+        cur.execute("ANALYZE")
+    conn.commit()
@@ -0,0 +1,200 @@
+# benchmarks/workload.py - realistic synthetic hospital workload
+#
+# Usage (from the repository root, with PostgreSQL configured as in README):
+#   python -m benchmarks.workload --patients 2000 --hours 48 --schema loadtest
+#   PGOPTIONS="-c search_path=loadtest,public" streamlit run app.py
+#
+# Unlike scratch_db.populate() (uniform noise, good enough for query plans),
+# values here follow the training data: every synthetic patient starts from a
+# row of ML_model_development/df_balanced.csv, sepsis or not in --sepsis-ratio,
+# and each hourly vitals/labs observation random-walks around that baseline
+# with steps of --volatility column standard deviations, clipped to the range
+# seen in the data. The RiskScores history is the model's score of those
+# observations, so census risk bands and alert rates look like a real ward.
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from benchmarks.scratch_db import REPO_ROOT, scratch_schema
+from ingest import copy_text
+from model_registry import get_model
+from scoring import FEATURES, LABS_FEATURES, VITALS_FEATURES
+
+logger = logging.getLogger(__name__)
+
+DF_BALANCED = os.path.join(REPO_ROOT, "ML_model_development", "df_balanced.csv")
+MEASUREMENTS = list(VITALS_FEATURES.values()) + list(LABS_FEATURES.values())
+# df_balanced.csv encodes PatientGender as 1 = male, 0 = female
+GENDERS = {1: "male", 0: "female"}
+
+
+def load_distributions(path=DF_BALANCED):
+    """
+    df_balanced.csv split into (sepsis rows, non-sepsis rows).
+    """
+    df = pd.read_csv(path)
+    return df[df["SepsisIndicator"] == 1], df[df["SepsisIndicator"] == 0]
+
+
+def generate(n_patients, hours=24, sepsis_ratio=0.1, discharged_ratio=0.2, volatility=0.05,
+             seed=42, now=None, source=DF_BALANCED):
+    """
+    Synthetic census as (patients, observations) DataFrames.
+
+    patients has one row per patient with its visit attributes; observations
+    has n_patients * hours rows of hourly measurements plus the model features
+    derived from them the way FEATURES_SQL does.
+    """
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now().replace(microsecond=0)
+    sepsis_rows, other_rows = load_distributions(source)
+    both = pd.concat([sepsis_rows, other_rows])
+    spread = both[MEASUREMENTS].std().to_numpy()
+    low, high = both[MEASUREMENTS].min().to_numpy(), both[MEASUREMENTS].max().to_numpy()
+
+    septic = rng.random(n_patients) < sepsis_ratio
+    baseline = pd.concat([
+        sepsis_rows.sample(int(septic.sum()), replace=True, random_state=rng),
+        other_rows.sample(int((~septic).sum()), replace=True, random_state=rng),
+    ]).reset_index(drop=True)
+    septic = np.sort(septic)[::-1]
+
+    ids = np.arange(1, n_patients + 1)
+    visit_dates = [
+        now - timedelta(hours=hours) - timedelta(seconds=int(s))
+        for s in rng.integers(0, 86400, n_patients)
+    ]
+    patients = pd.DataFrame({
+        "patient_id": [f"W{i:08d}" for i in ids],
+        "firstname": [f"First{i}" for i in ids],
+        "lastname": [f"Last{i}" for i in ids],
+        "age": baseline["PatientAge"].round().astype(int).clip(0, 120),
+        "gender": baseline["PatientGender"].map(GENDERS).fillna("other"),
+        "status": np.where(rng.random(n_patients) < discharged_ratio, "discharged", "admitted"),
+        "sepsis": septic,
+        "visit_date": visit_dates,
+        "hosp_adm_time": baseline["TimeSinceHospitalAdmission"].abs().to_numpy(),
+        "location": [f"R{i:04d}" for i in ids],
+    })
+
+    # (patient, hour, measurement) random walk around the baseline row
+    steps = rng.normal(0.0, volatility, (n_patients, hours, len(MEASUREMENTS))) * spread
+    values = baseline[MEASUREMENTS].to_numpy()[:, None, :] + np.cumsum(steps, axis=1)
+    values = np.clip(values, low, high)
+
+    hour = np.tile(np.arange(1, hours + 1), n_patients)
+    patient_index = np.repeat(np.arange(n_patients), hours)
+    observations = pd.DataFrame(values.reshape(-1, len(MEASUREMENTS)), columns=MEASUREMENTS)
+    observations["patient_index"] = patient_index
+    visit_date = pd.to_datetime(patients["visit_date"]).to_numpy()[patient_index]
+    observations["timestamp"] = visit_date + pd.to_timedelta(hour, unit="h")
+    midnight = pd.to_datetime(visit_date).normalize().to_numpy()
+    observations["HourOfObservation"] = hour
+    observations["PatientAge"] = patients["age"].to_numpy()[patient_index]
+    observations["ICULengthOfStay"] = (observations["timestamp"] - midnight).dt.total_seconds() / 86400
+    observations["PatientGender"] = patients["gender"].to_numpy()[patient_index]
+    observations["TimeSinceHospitalAdmission"] = patients["hosp_adm_time"].to_numpy()[patient_index]
+    return patients, observations
+
+
+def _copy(cur, table, columns, rows):
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", copy_text(rows))
+
+
+def populate_workload(conn, n_patients, hours=24, sepsis_ratio=0.1, discharged_ratio=0.2,
+                      volatility=0.05, seed=42, score=True, entered_by="nurse1", diagnosed_by="physician1"):
+    """
+    Write a generate() census into the schema conn points at: Patients, one
+    visit each, hourly Vitals and Labs, the model's hourly RiskScores (unless
+    score is False) and a sepsis Diagnosis for septic patients. Returns the
+    (patients, observations) frames with visit_id filled in.
+    """
+    patients, observations = generate(n_patients, hours, sepsis_ratio, discharged_ratio, volatility, seed)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT create_time_partitions(table_name, %s, LOCALTIMESTAMP + interval '1 day')
+            FROM TimePartitioning
+        """, (min(patients["visit_date"]) - timedelta(days=1),))
+        execute_values(cur, """
+            INSERT INTO Patients (patient_id, firstname, lastname, age, gender, created_at, status) VALUES %s
+        """, [
+            (p.patient_id, p.firstname, p.lastname, int(p.age), p.gender, p.visit_date, p.status)
+            for p in patients.itertuples()
+        ], page_size=1000)
+        visit_ids = execute_values(cur, """
+            INSERT INTO Visits (patient_id, created_by, visit_date, hosp_adm_time, iculos, location)
+            VALUES %s RETURNING patient_id, visit_id
+        """, [
+            (p.patient_id, entered_by, p.visit_date, float(p.hosp_adm_time), 0,
+             p.location if p.status == "admitted" else None)
+            for p in patients.itertuples()
+        ], page_size=1000, fetch=True)
+        patients["visit_id"] = patients["patient_id"].map(dict(visit_ids))
+        observations["visit_id"] = patients["visit_id"].to_numpy()[observations["patient_index"]]
+
+        timestamps = observations["timestamp"].dt.to_pydatetime()
+        vitals = observations[list(VITALS_FEATURES.values())].round(2).to_numpy().tolist()
+        labs = observations[list(LABS_FEATURES.values())].round(2).to_numpy().tolist()
+        visit_column = observations["visit_id"].tolist()
+        _copy(cur, "Vitals", ["visit_id", "entered_by", "timestamp", *VITALS_FEATURES],
+              [(v, entered_by, ts, *row) for v, ts, row in zip(visit_column, timestamps, vitals)])
+        _copy(cur, "Labs", ["visit_id", "entered_by", "timestamp", *LABS_FEATURES],
+              [(v, entered_by, ts, *row) for v, ts, row in zip(visit_column, timestamps, labs)])
+
+        if score:
+            start = time.perf_counter()
+            observations["score"] = get_model().predict_proba(observations[FEATURES])[:, 1]
+            logger.info("Scored %d observations in %.1fs", len(observations), time.perf_counter() - start)
+            _copy(cur, "RiskScores", ["visit_id", "score", "generated_at"],
+                  zip(visit_column, observations["score"].tolist(), timestamps))
+
+        # Septic patients are diagnosed somewhere in their stay
+        diagnosed = patients[patients["sepsis"]]
+        rng = np.random.default_rng(seed)
+        execute_values(cur, """
+            INSERT INTO Diagnosis (visit_id, sepsis, diagnosed_by, diagnosis_datetime) VALUES %s
+        """, [
+            (int(p.visit_id), True, diagnosed_by, p.visit_date + timedelta(hours=float(rng.uniform(1, hours))))
+            for p in diagnosed.itertuples()
+        ], page_size=1000)
+        cur.execute("UPDATE Visits SET iculos = icu_length_of_stay(visit_date)")
+        cur.execute("ANALYZE")
+    conn.commit()
+    return patients, observations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populate a schema with a realistic synthetic workload")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--hours", type=int, default=24, help="hourly observations per visit")
+    parser.add_argument("--sepsis-ratio", type=float, default=0.1)
+    parser.add_argument("--discharged-ratio", type=float, default=0.2)
+    parser.add_argument("--volatility", type=float, default=0.05,
+                        help="hourly random-walk step, in column standard deviations")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--schema", default="loadtest",
+                        help="schema to (re)create with setup.sql and fill")
+    parser.add_argument("--no-score", action="store_true", help="skip the RiskScores history")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    start = time.perf_counter()
+    with scratch_schema(args.schema, keep=True) as conn:
+        patients, observations = populate_workload(
+            conn, args.patients, args.hours, args.sepsis_ratio, args.discharged_ratio,
+            args.volatility, args.seed, score=not args.no_score,
+        )
+    logger.info("Loaded %d patients and %d observations into schema %s in %.1fs",
+                len(patients), len(observations), args.schema, time.perf_counter() - start)
+    print(f'PGOPTIONS="-c search_path={args.schema},public" streamlit run app.py')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# cache.py - process-wide TTL + LRU cache for read-heavy lookups
+#
+# Shared by every Streamlit session in the server process (modules are only
+# imported once). Each namespace has its own TTL; writes in app.py invalidate
+# the keys they affect, and the TTL bounds staleness for writes made by other
+# processes (e.g. scheduler.py).
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MAXSIZE = int(os.environ.get("SEPSIS_CACHE_MAXSIZE", "10000"))
+
+# Seconds an entry may be served before it is reloaded
+TTLS = {
+    "patient": 300,
+    "latest_visit": 120,
+    "visit": 300,
+    "latest_diagnosis": 60,
+    "latest_score": 30,
+}
+DEFAULT_TTL = 60
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after a per-namespace TTL.
+    None is a valid cached value (e.g. "patient not found").
+    """
+
+    def __init__(self, maxsize=MAXSIZE, ttls=None, default_ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        # Bumped by every invalidation; a load that raced with one is not stored
+        self._generation = 0
+
+    def _count(self, namespace, key):
+        counters = self._stats.setdefault(
+            namespace, {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+        )
+        counters[key] += 1
+
+    def get_or_load(self, namespace, key, loader):
+        """
+        Return the cached value for (namespace, key), calling loader() on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end((namespace, key))
+                    self._count(namespace, "hits")
+                    return value
+                del self._data[(namespace, key)]
+                self._count(namespace, "expired")
+            self._count(namespace, "misses")
+            generation = self._generation
+
+        # Load outside the lock so a slow query doesn't block other sessions
+        value = loader()
+        ttl = self.ttls.get(namespace, self.default_ttl)
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._data[(namespace, key)] = (time.monotonic() + ttl, value)
+            self._data.move_to_end((namespace, key))
+            while len(self._data) > self.maxsize:
+                (evicted_namespace, _), _ = self._data.popitem(last=False)
+                self._count(evicted_namespace, "evictions")
+        return value
+
+    def invalidate(self, namespace, key):
+        with self._lock:
+            self._generation += 1
+            if self._data.pop((namespace, key), None) is not None:
+                self._count(namespace, "invalidations")
+
+    def invalidate_namespace(self, namespace):
+        with self._lock:
+            self._generation += 1
+            keys = [k for k in self._data if k[0] == namespace]
+            for k in keys:
+                del self._data[k]
+            if keys:
+                self._count(namespace, "invalidations")
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        Per-namespace hit/miss/eviction counters plus the hit ratio, i.e. the
+        share of lookups that did not go to the database.
+        """
+        with self._lock:
+            result = {ns: dict(counters) for ns, counters in self._stats.items()}
+            size = len(self._data)
+        for counters in result.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return {"size": size, "maxsize": self.maxsize, "namespaces": result}
+
+
+cache = TTLCache()
+
+
+def cached(namespace, key, loader):
+    return cache.get_or_load(namespace, key, loader)
+
+
+def invalidate(namespace, key):
+    cache.invalidate(namespace, key)
+
+
+def cache_stats():
+    return cache.stats()
@@ -0,0 +1,183 @@
+# db.py - pooled PostgreSQL connections shared across Streamlit sessions
+#
+# The pool lives at module level, so it is created once per server process
+# and reused by every session and rerun instead of paying a TCP + auth
+# handshake for each query.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from telemetry import TracingCursor
+
+# ------------------------------
+# Config
+# ------------------------------
+DB_CONFIG = {
+    "host": os.environ.get("SEPSIS_DB_HOST", "localhost"),
+    "port": int(os.environ.get("SEPSIS_DB_PORT", "5432")),
+    "database": os.environ.get("SEPSIS_DB_NAME", "sepsis_dss"),
+    "user": os.environ.get("SEPSIS_DB_USER", "sepsis_tool_admin"),
+    "password": os.environ.get("SEPSIS_DB_PASSWORD", "sepsis"),
+}
+POOL_MIN = int(os.environ.get("SEPSIS_DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("SEPSIS_DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("SEPSIS_DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged with SELECT 1 before reuse
+HEALTH_CHECK_INTERVAL = float(os.environ.get("SEPSIS_DB_HEALTH_CHECK_INTERVAL", "30"))
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    pass
+
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool that blocks (up to a timeout) instead of raising when
+    exhausted, health-checks idle connections and counts checkouts and waits.
+    Its connections hand out telemetry.TracingCursor, so every statement is timed.
+    """
+
+    def __init__(self, minconn=POOL_MIN, maxconn=POOL_MAX, timeout=POOL_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL, **dsn):
+        self._pool = pg_pool.ThreadedConnectionPool(
+            minconn, maxconn, cursor_factory=TracingCursor, **(dsn or DB_CONFIG)
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "health_checks": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+            "in_use": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        self._count("health_checks")
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            self._count("health_check_failures")
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            start = time.monotonic()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            self._count("wait_seconds", time.monotonic() - start)
+            if not acquired:
+                self._count("timeouts")
+                raise PoolTimeout(f"No database connection available within {self.timeout}s")
+        try:
+            conn = self._pool.getconn()
+            for _ in range(self.maxconn):
+                if self._healthy(conn):
+                    break
+                self._discard(conn)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._count("checkouts")
+        self._count("in_use")
+        return conn
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._count("discarded")
+        self._pool.putconn(conn, close=True)
+
+    def putconn(self, conn, close=False):
+        try:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._count("in_use", -1)
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+@contextmanager
+def db_session():
+    """
+    Check out one pooled connection for the duration of a unit of work.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises; either way the connection goes back to the pool. Connections
+    that died mid-transaction are closed instead of being reused.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except BaseException as e:
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def pool_stats():
+    """
+    Snapshot of the pool counters (checkouts, waits, timeouts, health checks, ...).
+    """
+    pool = get_pool()
+    with pool._lock:
+        stats = dict(pool.stats)
+    stats["max_size"] = pool.maxconn
+    return stats
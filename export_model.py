@@ -0,0 +1,121 @@
+# export_model.py - turn the pickled pipeline into a native, versioned model artifact
+#
+# Usage:
+#   python export_model.py                                 # ML_model_development/sepsis_model.pkl
+#   python export_model.py other_model.pkl --no-activate   # export without switching to it
+#
+# Writes ML_model_development/artifacts/<version>/ (version: a hash of the
+# booster and preprocessing checksums) containing
+#   booster.ubj       the XGBoost booster in its native UBJSON format
+#   preprocess.json   imputer, scaler and one-hot parameters (see fast_inference.CompiledScorer)
+#   manifest.json     version, source pickle checksum, file checksums, library versions, parity
+# and points ARTIFACT_DIR/CURRENT at it, so model_registry loads the artifact
+# instead of the pickle: xgboost and NumPy only, no sklearn, no unpickling.
+# The export is refused if the artifact's scores on df_balanced.csv differ from
+# the pipeline's by more than --tolerance.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from fast_inference import CompiledScorer
+from feature_store import default_data_path, read_frame
+from model_registry import ARTIFACT_DIR, MANIFEST_FILE, PICKLE_PATH, _file_sha256
+from scoring import FEATURES
+
+logger = logging.getLogger(__name__)
+
+# The Parquet dataset once feature_store.py has converted df_balanced.csv
+DATA_PATH = default_data_path()
+FORMAT_VERSION = 1
+
+
+def artifact_version(checksums):
+    """
+    sepsis-<hash> for an artifact's {file name: sha256}. Pickles of the same
+    model differ from run to run, the booster and preprocessing files don't.
+    """
+    digest = hashlib.sha256(json.dumps(checksums, sort_keys=True).encode()).hexdigest()
+    return f"sepsis-{digest[:12]}"
+
+
+def export(pickle_path=PICKLE_PATH, artifact_dir=ARTIFACT_DIR, data_path=DATA_PATH,
+           tolerance=1e-6, activate=True, training=None):
+    """
+    Export pickle_path into <artifact_dir>/<version>/ and return its manifest.
+    The version is derived from the checksums of the exported files (see
+    artifact_version), so re-exporting the same model replaces its artifact
+    instead of adding another one, however the pickle was written. training,
+    if given, is recorded in the manifest as is (see train.py).
+    """
+    import sklearn
+    import xgboost
+
+    tmp_target = os.path.join(artifact_dir, f".export-{os.getpid()}.tmp")
+    shutil.rmtree(tmp_target, ignore_errors=True)
+
+    pipeline = joblib.load(pickle_path)
+    files = CompiledScorer.from_pipeline(pipeline, FEATURES).save(tmp_target)
+
+    # Score through what was written, not the in-memory scorer
+    X = read_frame(data_path, FEATURES)
+    exported = CompiledScorer.load(tmp_target)
+    max_diff = float(np.max(np.abs(pipeline.predict_proba(X)[:, 1] - exported.predict_proba(X))))
+    if max_diff > tolerance:
+        shutil.rmtree(tmp_target)
+        raise ValueError(f"Exported model differs from the pipeline by {max_diff:.2e} (> {tolerance:.0e})")
+
+    checksums = {name: _file_sha256(os.path.join(tmp_target, name)) for name in files}
+    version = artifact_version(checksums)
+    target = os.path.join(artifact_dir, version)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": {"path": pickle_path, "sha256": _file_sha256(pickle_path)},
+        "files": checksums,
+        "features": FEATURES,
+        "libraries": {"xgboost": xgboost.__version__, "scikit-learn": sklearn.__version__},
+        "parity": {"rows": len(X), "max_abs_diff": max_diff},
+    }
+    if training is not None:
+        manifest["training"] = training
+    with open(os.path.join(tmp_target, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_target, target)
+
+    if activate:
+        current = os.path.join(artifact_dir, "CURRENT")
+        with open(current + ".tmp", "w") as f:
+            f.write(version + "\n")
+        os.replace(current + ".tmp", current)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the pickled pipeline as a native model artifact")
+    parser.add_argument("pickle", nargs="?", default=PICKLE_PATH)
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--data", default=DATA_PATH, help="rows used for the parity check (CSV or feature store dataset)")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    parser.add_argument("--no-activate", action="store_true", help="don't update ARTIFACT_DIR/CURRENT")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    manifest = export(args.pickle, args.artifact_dir, args.data, args.tolerance, not args.no_activate)
+    logger.info("Exported %s to %s (max |diff| %.2e over %d rows)%s",
+                args.pickle, os.path.join(args.artifact_dir, manifest["version"]),
+                manifest["parity"]["max_abs_diff"], manifest["parity"]["rows"],
+                "" if args.no_activate else ", now the default model")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# fast_inference.py - low-latency scoring path that bypasses pandas and sklearn
+#
+# For a single visit, almost all of predict_proba's time goes into building a
+# DataFrame and walking the ColumnTransformer. CompiledScorer reads the fitted
+# preprocessing parameters out of the pipeline once (imputer medians, scaler
+# means/scales, one-hot categories) into flat NumPy arrays, and then feeds the
+# transformed vector straight to the XGBoost booster.
+#
+# Parity with the pipeline and latency are checked by
+# benchmarks/bench_fast_inference.py.
+#
+# The same parameters, saved next to the booster in XGBoost's native UBJSON
+# format (export_model.py), make up the model artifact that model_registry
+# loads without sklearn or unpickling: see CompiledScorer.save/load and
+# NativeModel.
+
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from model_registry import MANIFEST_FILE, MODEL_PATH, _file_sha256, get_model
+
+BOOSTER_FILE = "booster.ubj"
+PREPROCESS_FILE = "preprocess.json"
+
+
+def _plain(value):
+    """
+    NumPy scalars as the equivalent Python value, so they survive JSON.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class CompiledScorer:
+    """
+    Replays a fitted Pipeline([("preprocess", ColumnTransformer), ("classifier", XGBClassifier)])
+    on raw feature values.
+
+    The ColumnTransformer is expected to hold a numeric block (median
+    SimpleImputer + StandardScaler) and a categorical block (most_frequent
+    SimpleImputer + OneHotEncoder(handle_unknown="ignore")), as built in
+    ML_model_development/OnlySepModel_ToMakePickleFile.ipynb.
+    """
+
+    def __init__(self, features, num_index, medians, means, scales, cat_index, cat_fill,
+                 categories, booster, iteration_range=(0, 0)):
+        self.features = list(features)
+        self.num_index = np.asarray(num_index, dtype=np.intp)
+        self.medians = np.asarray(medians, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.cat_index = list(cat_index)
+        self.cat_fill = list(cat_fill)
+        self.categories = [list(c) for c in categories]
+        self.n_outputs = len(self.num_index) + sum(len(c) for c in self.categories)
+        self.booster = booster
+        self.iteration_range = tuple(iteration_range)
+        # Sums the booster's per-column contributions (one-hot columns included)
+        # back into one column per feature, with the bias last
+        owner = list(self.num_index) + [i for i, c in zip(self.cat_index, self.categories) for _ in c]
+        self.contribution_map = np.zeros((self.n_outputs + 1, len(self.features) + 1), dtype=np.float32)
+        self.contribution_map[np.arange(self.n_outputs), owner] = 1
+        self.contribution_map[-1, -1] = 1
+
+    @classmethod
+    def from_pipeline(cls, pipeline, features):
+        preprocess = pipeline.named_steps["preprocess"]
+        classifier = pipeline.named_steps["classifier"]
+        position = {name: i for i, name in enumerate(features)}
+
+        blocks = [(name, steps, cols) for name, steps, cols in preprocess.transformers_
+                  if name != "remainder" and steps != "drop"]
+        if [name for name, _, _ in blocks] != ["num", "cat"]:
+            raise ValueError(f"Unsupported ColumnTransformer layout: {[b[0] for b in blocks]}")
+        (_, num_steps, num_cols), (_, cat_steps, cat_cols) = blocks
+
+        imputer = num_steps.named_steps["imputer"]
+        scaler = num_steps.named_steps["scaler"]
+        if np.isnan(imputer.statistics_).any():
+            raise ValueError("Numeric imputer has all-missing columns; use the pipeline instead")
+        cat_imputer = cat_steps.named_steps["imputer"]
+        encoder = cat_steps.named_steps["encoder"]
+
+        try:
+            best_iteration = classifier.best_iteration
+        except AttributeError:
+            best_iteration = None
+        iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+        return cls(
+            features=features,
+            num_index=[position[c] for c in num_cols],
+            medians=imputer.statistics_,
+            means=scaler.mean_,
+            scales=scaler.scale_,
+            cat_index=[position[c] for c in cat_cols],
+            cat_fill=list(cat_imputer.statistics_),
+            categories=[list(c) for c in encoder.categories_],
+            booster=classifier.get_booster(),
+            iteration_range=iteration_range,
+        )
+
+    def _rows(self, X):
+        """
+        Accept a mapping of feature name -> value, a single sequence in
+        self.features order, or a 2D sequence/array of such rows (either kind).
+        """
+        if isinstance(X, dict):
+            return [[X.get(name) for name in self.features]]
+        if hasattr(X, "to_numpy"):
+            X = X[self.features].to_numpy(dtype=object)
+        X = list(X)
+        if X and isinstance(X[0], dict):
+            return [[row.get(name) for name in self.features] for row in X]
+        if X and not isinstance(X[0], (list, tuple, np.ndarray)):
+            return [X]
+        return X
+
+    @staticmethod
+    def _missing(value):
+        return value is None or (isinstance(value, float) and math.isnan(value))
+
+    def transform(self, X):
+        """
+        Preprocess raw rows into the booster's float32 input matrix.
+        """
+        rows = self._rows(X)
+        raw = np.array(
+            [[np.nan if self._missing(row[i]) else row[i] for i in self.num_index] for row in rows],
+            dtype=np.float64,
+        ).reshape(len(rows), len(self.num_index))
+        raw = np.where(np.isnan(raw), self.medians, raw)
+        out = np.empty((len(rows), self.n_outputs), dtype=np.float32)
+        out[:, :len(self.num_index)] = (raw - self.means) / self.scales
+
+        col = len(self.num_index)
+        for index, fill, categories in zip(self.cat_index, self.cat_fill, self.categories):
+            for r, row in enumerate(rows):
+                # SimpleImputer only treats NaN as missing in object columns; None
+                # falls through to the encoder as an unknown category, as in sklearn
+                value = row[index]
+                if isinstance(value, float) and math.isnan(value):
+                    value = fill
+                # handle_unknown="ignore": values outside the fitted categories encode as all zeros
+                out[r, col:col + len(categories)] = [value == c for c in categories]
+            col += len(categories)
+        return out
+
+    def predict_proba(self, X):
+        """
+        Probability of sepsis for each row (the pipeline's predict_proba(X)[:, 1]).
+        """
+        return self.booster.inplace_predict(
+            self.transform(X), iteration_range=self.iteration_range, validate_features=False
+        )
+
+    def score_one(self, values):
+        return float(self.predict_proba(values)[0])
+
+    def predict_with_contributions(self, X):
+        """
+        (probabilities, contributions) for each row from one TreeSHAP pass of the
+        booster (pred_contribs). contributions has one column per feature, in
+        self.features order, plus the bias, in log-odds; each row sums to the
+        logit of its probability.
+        """
+        import xgboost
+
+        matrix = xgboost.DMatrix(self.transform(X))
+        raw = self.booster.predict(
+            matrix, pred_contribs=True, iteration_range=self.iteration_range, validate_features=False
+        )
+        contributions = raw @ self.contribution_map
+        margin = contributions.sum(axis=1, dtype=np.float64)
+        return 1 / (1 + np.exp(-margin)), contributions
+
+    def save(self, directory):
+        """
+        Write the booster (UBJSON) and the preprocessing parameters (JSON) into
+        directory. Returns the names of the files written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.booster.save_model(os.path.join(directory, BOOSTER_FILE))
+        params = {
+            "features": self.features,
+            "num_index": self.num_index.tolist(),
+            "medians": self.medians.tolist(),
+            "means": self.means.tolist(),
+            "scales": self.scales.tolist(),
+            "cat_index": self.cat_index,
+            "cat_fill": [_plain(v) for v in self.cat_fill],
+            "categories": [[_plain(v) for v in c] for c in self.categories],
+            "iteration_range": list(self.iteration_range),
+        }
+        with open(os.path.join(directory, PREPROCESS_FILE), "w") as f:
+            json.dump(params, f, indent=2)
+        return [BOOSTER_FILE, PREPROCESS_FILE]
+
+    @classmethod
+    def load(cls, directory):
+        import xgboost
+
+        with open(os.path.join(directory, PREPROCESS_FILE)) as f:
+            params = json.load(f)
+        booster = xgboost.Booster(model_file=os.path.join(directory, BOOSTER_FILE))
+        return cls(booster=booster, **params)
+
+
+class NativeModel:
+    """
+    A loaded model artifact standing in for the pickled pipeline:
+    predict_proba returns the same (n_rows, 2) array.
+    """
+
+    def __init__(self, scorer, manifest):
+        self.scorer = scorer
+        self.manifest = manifest
+
+    def predict_proba(self, X):
+        proba = self.scorer.predict_proba(X).astype(np.float64)
+        return np.column_stack([1 - proba, proba])
+
+
+def load_artifact(directory):
+    """
+    NativeModel from an artifact directory written by export_model.py, after
+    checking its files against the manifest.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    for name, sha256 in manifest["files"].items():
+        if _file_sha256(os.path.join(directory, name)) != sha256:
+            raise ValueError(f"{name} in {directory} does not match its manifest checksum")
+    return NativeModel(CompiledScorer.load(directory), manifest)
+
+
+_lock = threading.Lock()
+_compiled = {}
+
+
+def get_scorer(features, path=MODEL_PATH):
+    """
+    CompiledScorer for the pipeline currently held by the model registry,
+    rebuilt whenever the registry hot-reloads the pickle. Raises ValueError
+    (again on every call, until the model changes) if the pipeline can't be
+    compiled.
+    """
+    model = get_model(path)
+    if isinstance(model, NativeModel):
+        return model.scorer
+    with _lock:
+        entry = _compiled.get(path)
+        if not entry or entry[0] is not model:
+            try:
+                entry = (model, CompiledScorer.from_pipeline(model, features))
+            except ValueError as e:
+                entry = (model, e)
+            _compiled[path] = entry
+    if isinstance(entry[1], ValueError):
+        raise entry[1]
+    return entry[1]
@@ -0,0 +1,228 @@
+# feature_store.py - typed, columnar storage of the model's training rows (Parquet)
+#
+# Usage:
+#   python feature_store.py convert ML_model_development/df_balanced.csv
+#   python feature_store.py convert history.csv --output history.parquet --ids-per-partition 5000
+#   python feature_store.py info ML_model_development/df_balanced.parquet
+#
+# A dataset is a directory of Parquet files, one subdirectory per range of
+# UniqueIDs (id_range=<first id>/part-<n>.parquet), plus _manifest.json
+# (schema, row counts and checksums). Columns are stored with explicit compact
+# types (SCHEMA: float32 measurements, int8 gender and label, int32 ids)
+# instead of the float64 that parsing the CSV infers, and conversion streams
+# the CSV, so neither step holds the whole dataset in memory.
+#
+# Readers (train.py, backtest.py, export_model.py) go through read_frame() and
+# iter_frames(), which take a CSV path or a dataset directory: dataset files are
+# memory-mapped, only the requested columns are decoded, and rows come back in
+# a stable order (partitions by first id, then file and row order).
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from model_registry import _file_sha256
+from queries import FEATURES
+
+logger = logging.getLogger(__name__)
+
+CSV_PATH = "ML_model_development/df_balanced.csv"
+DATASET_PATH = "ML_model_development/df_balanced.parquet"
+MANIFEST_FILE = "_manifest.json"
+TARGET = "SepsisIndicator"
+ID_COLUMN = "UniqueID"
+IDS_PER_PARTITION = 10000
+ROW_GROUP_SIZE = 128 * 1024
+BATCH_SIZE = 64 * 1024
+FORMAT_VERSION = 1
+
+SCHEMA = pa.schema(
+    [pa.field(ID_COLUMN, pa.int32())]
+    + [pa.field(name, pa.int8() if name == "PatientGender" else pa.float32()) for name in FEATURES]
+    + [pa.field(TARGET, pa.int8())]
+)
+
+PARTITION_DIR = re.compile(r"^id_range=(-?\d+)$")
+
+
+def default_data_path():
+    """
+    The converted dataset if there is one, else df_balanced.csv.
+    """
+    return DATASET_PATH if is_dataset(DATASET_PATH) else CSV_PATH
+
+
+def is_dataset(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def fingerprint(path):
+    """
+    Content hash of a CSV file or dataset (for a dataset, of its manifest,
+    which holds every file's checksum).
+    """
+    return _file_sha256(os.path.join(path, MANIFEST_FILE) if is_dataset(path) else path)
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def dataset_files(path):
+    """
+    Parquet files of a dataset in read order (partitions by first id, then file name).
+    """
+    partitions = sorted(
+        (int(match.group(1)), name)
+        for name in os.listdir(path)
+        for match in [PARTITION_DIR.match(name)] if match
+    )
+    return [
+        os.path.join(path, name, file)
+        for _, name in partitions
+        for file in sorted(os.listdir(os.path.join(path, name)))
+        if file.endswith(".parquet")
+    ]
+
+
+def columns_of(path):
+    if is_dataset(path):
+        return [field["name"] for field in load_manifest(path)["schema"]]
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _projection(path, columns):
+    """columns that the data at path has, in the requested order (all if None)."""
+    available = columns_of(path)
+    return available if columns is None else [c for c in columns if c in available]
+
+
+def iter_frames(path, columns=None, batch_size=BATCH_SIZE):
+    """
+    DataFrames of at most batch_size rows with the requested columns (those
+    the data has; all if None), from a CSV file or a dataset directory.
+    """
+    columns = _projection(path, columns)
+    if not is_dataset(path):
+        for frame in pd.read_csv(path, chunksize=batch_size, usecols=columns):
+            yield frame[columns]
+        return
+    for file in dataset_files(path):
+        parquet = pq.ParquetFile(file, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()[columns]
+
+
+def read_frame(path, columns=None):
+    """
+    The whole CSV file or dataset as one DataFrame with the requested columns
+    (those the data has; all if None), keeping the stored dtypes.
+    """
+    columns = _projection(path, columns)
+    if not is_dataset(path):
+        return pd.read_csv(path, usecols=columns)[columns]
+    tables = [pq.read_table(file, columns=columns, memory_map=True) for file in dataset_files(path)]
+    if not tables:
+        return SCHEMA.empty_table().select(columns).to_pandas()
+    return pa.concat_tables(tables).to_pandas()[columns]
+
+
+def convert(csv_path, output=DATASET_PATH, ids_per_partition=IDS_PER_PARTITION,
+            row_group_size=ROW_GROUP_SIZE, block_size=16 << 20):
+    """
+    Stream csv_path into a dataset at output and return its manifest. The CSV
+    needs UniqueID, every FEATURES column and SepsisIndicator; other columns
+    are dropped. The dataset is written next to output and moved into place
+    when complete.
+    """
+    tmp_output = output.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_output, ignore_errors=True)
+    os.makedirs(tmp_output)
+
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={field.name: field.type for field in SCHEMA},
+            include_columns=SCHEMA.names,
+        ),
+    )
+    writers, rows = {}, {}
+    try:
+        for batch in reader:
+            table = pa.Table.from_batches([batch]).select(SCHEMA.names).cast(SCHEMA)
+            ids = table.column(ID_COLUMN)
+            if ids.null_count:
+                raise ValueError(f"{csv_path}: rows without {ID_COLUMN}")
+            first_ids = ids.to_numpy() // ids_per_partition * ids_per_partition
+            for first in np.unique(first_ids).tolist():
+                part = table.filter(pa.array(first_ids == first))
+                writer = writers.get(first)
+                if writer is None:
+                    directory = os.path.join(tmp_output, f"id_range={first}")
+                    os.makedirs(directory)
+                    writer = pq.ParquetWriter(os.path.join(directory, "part-0.parquet"), SCHEMA,
+                                              compression="zstd")
+                    writers[first] = writer
+                writer.write_table(part, row_group_size=row_group_size)
+                rows[first] = rows.get(first, 0) + part.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    files = {
+        os.path.relpath(file, tmp_output): _file_sha256(file)
+        for first in sorted(writers)
+        for file in [os.path.join(tmp_output, f"id_range={first}", "part-0.parquet")]
+    }
+    manifest = {
+        "format": FORMAT_VERSION,
+        "source": {"path": csv_path, "sha256": _file_sha256(csv_path)},
+        "schema": [{"name": field.name, "type": str(field.type)} for field in SCHEMA],
+        "ids_per_partition": ids_per_partition,
+        "rows": sum(rows.values()),
+        "partitions": {str(first): rows[first] for first in sorted(rows)},
+        "files": files,
+    }
+    with open(os.path.join(tmp_output, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(tmp_output, output)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert training rows to a typed Parquet dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_cmd = commands.add_parser("convert", help="convert a CSV laid out like df_balanced.csv")
+    convert_cmd.add_argument("csv", nargs="?", default=CSV_PATH)
+    convert_cmd.add_argument("--output", default=DATASET_PATH)
+    convert_cmd.add_argument("--ids-per-partition", type=int, default=IDS_PER_PARTITION)
+    convert_cmd.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    info = commands.add_parser("info", help="show a dataset's manifest")
+    info.add_argument("path", nargs="?", default=DATASET_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "convert":
+        manifest = convert(args.csv, args.output, args.ids_per_partition, args.row_group_size)
+        size = sum(os.path.getsize(os.path.join(args.output, file)) for file in manifest["files"])
+        logger.info("Wrote %d rows in %d partitions to %s (%.1f MB, CSV %.1f MB)",
+                    manifest["rows"], len(manifest["partitions"]), args.output,
+                    size / 2**20, os.path.getsize(args.csv) / 2**20)
+    elif args.command == "info":
+        print(json.dumps(load_manifest(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# ingest.py - bulk loading of monitor/LIS observation feeds into Vitals and Labs
+#
+# Usage:
+#   python ingest.py vitals monitor_feed.csv
+#   python ingest.py labs lis_feed.ndjson --format ndjson
+#   tail -f feed.ndjson | python ingest.py vitals - --format ndjson --chunk-size 5000 --flush-interval 2
+#
+# Input rows carry visit_id, timestamp (ISO 8601) and any of the table's
+# measurement columns; entered_by defaults to --entered-by. Files are streamed
+# in chunks of --chunk-size rows, so memory stays bounded regardless of input
+# size; a chunk is also cut --flush-interval seconds after its first row
+# arrived, so a slow or endless stream is loaded as it comes. Each chunk is
+# validated against the setup.sql schema, COPY'd into a temporary staging table
+# and merged into the target table, skipping rows whose (visit_id, timestamp)
+# already exists, and the visits it touched are rescored in one batch once it
+# is committed (--no-score to skip).
+
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from datetime import datetime
+from queue import Empty, Queue
+
+from db import db_session
+from scoring import calculate_risk_batch
+
+logger = logging.getLogger(__name__)
+
+# Measurement columns per table, as defined in setup.sql (all REAL)
+TABLES = {
+    "vitals": ("Vitals", ["temp", "hr", "sbp", "dbp", "map", "resp", "o2sat"]),
+    "labs": ("Labs", ["wbc", "creatinine", "bilirubin_total", "bilirubin_direct", "platelets", "lactate"]),
+}
+
+# Limits of the column types in setup.sql: INTEGER visit_id, REAL measurements
+INTEGER_RANGE = (-2**31, 2**31 - 1)
+REAL_MAX = 3.4028234663852886e38
+# Smallest nonzero REAL; Postgres rejects smaller magnitudes as out of range
+REAL_MIN = 1.401298464324817e-45
+
+# Backslash escapes of COPY's text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+class ValidationError(ValueError):
+    pass
+
+
+_EOF = object()
+
+
+def read_rows(stream, fmt):
+    """
+    Input rows as dicts. Lines that can't be parsed come through as
+    ValidationError instances, so validate() counts them as invalid rows
+    instead of the whole run failing.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                yield next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield ValidationError(f"malformed CSV line {reader.line_num}: {e}")
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValidationError(f"malformed JSON: {e}")
+
+
+def chunks(rows, chunk_size, flush_interval=None):
+    """
+    Lists of at most chunk_size rows from rows, cut early once flush_interval
+    seconds (if given) have passed since the chunk's first row arrived. rows is
+    read on a background thread through a queue of chunk_size rows, so a
+    stream that stalls (tail -f) doesn't hold back rows already read and memory
+    stays bounded. Errors reading rows are raised after the rows before them.
+    """
+    queue = Queue(maxsize=chunk_size)
+
+    def produce():
+        try:
+            for row in rows:
+                queue.put((row, None))
+            queue.put((_EOF, None))
+        except Exception as e:
+            queue.put((_EOF, e))
+
+    threading.Thread(target=produce, name="ingest-reader", daemon=True).start()
+    chunk, deadline = [], None
+    while True:
+        try:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            row, error = queue.get(timeout=timeout)
+        except Empty:
+            yield chunk
+            chunk, deadline = [], None
+            continue
+        if row is _EOF:
+            if chunk:
+                yield chunk
+            if error is not None:
+                raise error
+            return
+        if not chunk and flush_interval is not None:
+            deadline = time.monotonic() + flush_interval
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk, deadline = [], None
+
+
+def validate(row, columns, default_entered_by):
+    """
+    Return the row as a tuple in staging-table column order, or raise
+    ValidationError for anything the COPY would reject. Timestamps with a UTC
+    offset are converted to local time, as the app stores (TIMESTAMP columns
+    would drop the offset).
+    """
+    if isinstance(row, ValidationError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValidationError(f"row is not an object: {row!r}")
+    try:
+        visit_id = int(row["visit_id"])
+    except (KeyError, TypeError, ValueError, OverflowError):
+        raise ValidationError(f"invalid or missing visit_id: {row.get('visit_id')!r}")
+    if not INTEGER_RANGE[0] <= visit_id <= INTEGER_RANGE[1]:
+        raise ValidationError(f"visit_id out of INTEGER range: {visit_id}")
+    try:
+        timestamp = datetime.fromisoformat(str(row["timestamp"]))
+    except (KeyError, ValueError):
+        raise ValidationError(f"invalid or missing timestamp: {row.get('timestamp')!r}")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    values = []
+    for column in columns:
+        value = row.get(column)
+        if value in (None, ""):
+            values.append(None)
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError(f"{column} is not a number: {value!r}")
+        if not math.isfinite(value):
+            raise ValidationError(f"{column} is not finite: {value!r}")
+        if abs(value) > REAL_MAX:
+            raise ValidationError(f"{column} out of REAL range: {value!r}")
+        values.append(0.0 if abs(value) < REAL_MIN else value)
+    if all(v is None for v in values):
+        raise ValidationError("row has no measurements")
+    entered_by = str(row.get("entered_by") or default_entered_by)
+    if "\x00" in entered_by:
+        raise ValidationError(f"entered_by contains a NUL character: {entered_by!r}")
+    return (visit_id, entered_by, timestamp, *values)
+
+
+def copy_text(rows):
+    """
+    Rows as COPY text format (tab-separated, \\N for NULL, text escaped).
+    """
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(
+            "\\N" if v is None
+            else v.isoformat() if isinstance(v, datetime)
+            else v.translate(COPY_ESCAPES) if isinstance(v, str)
+            else str(v)
+            for v in row
+        ))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+def load_chunk(conn, table, columns, rows):
+    """
+    COPY rows into a staging table and merge the new (visit_id, timestamp)
+    pairs into table. Rows for unknown visits or users, or dated before their
+    visit's observation window (Visits.observations_from, see
+    migrations/010_observation_window.sql), are dropped rather than failing
+    the whole chunk. Returns (inserted visit_ids, inserted row count, rows
+    for unknown visits or users, rows before the window).
+    """
+    staging_columns = ["visit_id", "entered_by", "timestamp", *columns]
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS ingest_staging_{table} ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(staging_columns)} FROM {table} WITH NO DATA
+        """)
+        cur.copy_expert(
+            f"COPY ingest_staging_{table} ({', '.join(staging_columns)}) FROM STDIN",
+            copy_text(rows),
+        )
+        column_list = ", ".join(staging_columns)
+        cur.execute(f"""
+            WITH staged AS (
+                SELECT {', '.join('s.' + c for c in staging_columns)},
+                       v.visit_id IS NOT NULL AND u.username IS NOT NULL AS known,
+                       s.timestamp < v.observations_from AS before_window
+                FROM ingest_staging_{table} s
+                LEFT JOIN Visits v ON v.visit_id = s.visit_id
+                LEFT JOIN Users u ON u.username = s.entered_by
+            ), inserted AS (
+                INSERT INTO {table} ({column_list})
+                SELECT DISTINCT ON (s.visit_id, s.timestamp) {', '.join('s.' + c for c in staging_columns)}
+                FROM staged s
+                WHERE s.known AND NOT s.before_window
+                  AND NOT EXISTS (
+                    SELECT 1 FROM {table} t
+                    WHERE t.visit_id = s.visit_id AND t.timestamp = s.timestamp
+                  )
+                ORDER BY s.visit_id, s.timestamp
+                RETURNING visit_id
+            )
+            SELECT (SELECT array_agg(DISTINCT visit_id) FROM inserted),
+                   (SELECT count(*) FROM inserted),
+                   count(*) FILTER (WHERE NOT known),
+                   count(*) FILTER (WHERE known AND before_window)
+            FROM staged
+        """)
+        visit_ids, inserted, unknown, before_window = cur.fetchone()
+    return set(visit_ids or ()), inserted, unknown, before_window
+
+
+def ingest(stream, kind, fmt="csv", chunk_size=10000, entered_by="nurse1", score=True, flush_interval=None):
+    """
+    Stream observations from stream into the table for kind ("vitals" or "labs"),
+    rescoring the visits each chunk touched after it is committed. Returns a
+    summary dict with row counts and rows/sec.
+    """
+    table, columns = TABLES[kind]
+    start = time.perf_counter()
+    summary = {"read": 0, "invalid": 0, "inserted": 0, "duplicates": 0, "unknown": 0, "before_visit": 0, "scored": 0}
+    score_seconds = 0.0
+    for chunk in chunks(read_rows(stream, fmt), chunk_size, flush_interval):
+        valid = []
+        for line_no, row in enumerate(chunk, start=summary["read"] + 1):
+            try:
+                valid.append(validate(row, columns, entered_by))
+            except ValidationError as e:
+                summary["invalid"] += 1
+                logger.warning("row %d rejected: %s", line_no, e)
+        summary["read"] += len(chunk)
+        if valid:
+            with db_session() as conn:
+                visit_ids, inserted, unknown, before_visit = load_chunk(conn, table, columns, valid)
+            summary["inserted"] += inserted
+            summary["unknown"] += unknown
+            summary["before_visit"] += before_visit
+            summary["duplicates"] += len(valid) - inserted - unknown - before_visit
+            if unknown or before_visit:
+                logger.warning("skipped %d rows for unknown visits or users and %d dated before their visit",
+                               unknown, before_visit)
+            if score and visit_ids:
+                score_start = time.perf_counter()
+                with db_session() as conn:
+                    summary["scored"] += len(calculate_risk_batch(sorted(visit_ids), conn))
+                score_seconds += time.perf_counter() - score_start
+        elapsed = time.perf_counter() - start
+        logger.info("%d rows read, %d inserted, %d visit rescores (%.0f rows/s)",
+                    summary["read"], summary["inserted"], summary["scored"], summary["read"] / elapsed)
+
+    summary["seconds"] = time.perf_counter() - start
+    load_seconds = summary["seconds"] - score_seconds
+    summary["rows_per_sec"] = summary["read"] / load_seconds if load_seconds else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load vitals or labs observations")
+    parser.add_argument("kind", choices=sorted(TABLES))
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None,
+                        help="input format (default: from the file extension, csv for stdin)")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--flush-interval", type=float, default=5.0,
+                        help="load a partial chunk once its first row is this many seconds old")
+    parser.add_argument("--entered-by", default="nurse1",
+                        help="Users.username recorded for rows without an entered_by field")
+    parser.add_argument("--no-score", action="store_true", help="don't rescore touched visits")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="")
+    try:
+        summary = ingest(stream, args.kind, fmt, args.chunk_size, args.entered_by, not args.no_score,
+                         args.flush_interval)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    logger.info(
+        "Done: %(read)d read, %(inserted)d inserted, %(duplicates)d duplicate, "
+        "%(unknown)d for unknown visits/users, %(before_visit)d dated before their visit, "
+        "%(invalid)d invalid, %(scored)d visit rescores in %(seconds).2fs "
+        "(%(rows_per_sec).0f rows/s loaded)",
+        summary,
+    )
+
+
+if __name__ == "__main__":
+    main()
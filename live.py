@@ -0,0 +1,158 @@
+# live.py - push-based refresh of dashboard views from Postgres notifications
+#
+# One listener thread per server process LISTENs on the sepsis_events channel
+# (see migrations/006_notifications.sql, 009_alerts.sql and
+# 011_notify_visit_changes.sql). Each event invalidates the affected
+# lookup-cache entries and bumps a version counter per topic ("census", "visit:<id>", "patient:<id>"). Views in app.py run as
+# st.fragment with a short run_every and only go back to the database when the
+# version of their topic has moved since they last rendered, so an idle wall
+# screen costs an in-memory comparison per tick instead of a query.
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+
+from cache import cache
+from db import DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "sepsis_events"
+# Seconds between fragment reruns checking for new events; 0 disables live updates
+REFRESH_INTERVAL = float(os.environ.get("SEPSIS_LIVE_REFRESH", "2"))
+# Seconds of silence after which the listener pings its connection
+HEARTBEAT = 30
+MAX_BACKOFF = 60
+
+
+class Listener:
+    """
+    Background LISTEN connection that turns notifications into per-topic
+    version counters. The "*" topic is bumped whenever events may have been
+    missed (startup, reconnect, oversized batches) and counts towards every
+    topic's version.
+    """
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="sepsis-listener", daemon=True)
+        self.stats = {"events": 0, "reconnects": 0, "connected": False}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def version(self, topic):
+        with self._lock:
+            return self._versions[topic] + self._versions["*"]
+
+    def _bump(self, topics):
+        with self._lock:
+            for topic in topics:
+                self._versions[topic] += 1
+
+    def handle(self, payload):
+        event = json.loads(payload)
+        kind = event.get("kind")
+        self.stats["events"] += 1
+        if kind in ("score", "diagnosis"):
+            namespace = "latest_score" if kind == "score" else "latest_diagnosis"
+            visit_ids = event.get("visit_ids")
+            if visit_ids is None:
+                cache.invalidate_namespace(namespace)
+                self._bump(["*"])
+                return
+            for visit_id in visit_ids:
+                cache.invalidate(namespace, visit_id)
+            self._bump(["census"] + [f"visit:{visit_id}" for visit_id in visit_ids])
+        elif kind == "alert":
+            visit_ids = event.get("visit_ids")
+            self._bump(["*"] if visit_ids is None else [f"visit:{visit_id}" for visit_id in visit_ids])
+        elif kind == "visit":
+            visit_ids, patient_ids = event.get("visit_ids"), event.get("patient_ids")
+            if visit_ids is None:
+                cache.invalidate_namespace("visit")
+                cache.invalidate_namespace("latest_visit")
+                self._bump(["*"])
+                return
+            for visit_id in visit_ids:
+                cache.invalidate("visit", visit_id)
+            for patient_id in patient_ids or []:
+                cache.invalidate("latest_visit", patient_id)
+            self._bump(["census"] + [f"visit:{visit_id}" for visit_id in visit_ids]
+                       + [f"patient:{patient_id}" for patient_id in patient_ids or []])
+        elif kind == "patient":
+            patient_ids = event.get("patient_ids") or []
+            for patient_id in patient_ids:
+                cache.invalidate("patient", patient_id)
+                cache.invalidate("latest_visit", patient_id)
+            self._bump(["census"] + [f"patient:{patient_id}" for patient_id in patient_ids])
+        else:
+            logger.warning("Ignoring unknown event %r", payload)
+
+    def _listen(self):
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+                # Anything written while we were not listening is unknown
+                cache.clear()
+                self._bump(["*"])
+                self.stats["connected"] = True
+                while True:
+                    if not select.select([conn], [], [], HEARTBEAT)[0]:
+                        cur.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.handle(notify.payload)
+                        except ValueError:
+                            logger.warning("Malformed event %r", notify.payload)
+        finally:
+            self.stats["connected"] = False
+            conn.close()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Event listener disconnected")
+            self.stats["reconnects"] += 1
+            # A connection that stayed up for a while resets the backoff
+            backoff = 1 if time.monotonic() - started > MAX_BACKOFF else min(backoff * 2, MAX_BACKOFF)
+            logger.info("Reconnecting event listener in %ds", backoff)
+            time.sleep(backoff)
+
+
+_lock = threading.Lock()
+_listener = None
+
+
+def get_listener():
+    """
+    The process-wide listener, started on first use.
+    """
+    global _listener
+    if _listener is None:
+        with _lock:
+            if _listener is None:
+                _listener = Listener().start()
+    return _listener
+
+
+def live_version(topic):
+    return get_listener().version(topic)
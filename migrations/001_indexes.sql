@@ -0,0 +1,27 @@
+-- migrations/001_indexes.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/001_indexes.sql
+--
+-- Indexes for the hot "latest row per visit" lookups in app.py. Every one of
+-- them filters by visit_id (or patient_id) and takes the newest row, so the
+-- composite keys are ordered the same way the queries are.
+-- On a large live database, run each statement as CREATE INDEX CONCURRENTLY.
+
+CREATE INDEX IF NOT EXISTS vitals_visit_timestamp_idx
+    ON Vitals (visit_id, timestamp DESC);
+
+CREATE INDEX IF NOT EXISTS labs_visit_timestamp_idx
+    ON Labs (visit_id, timestamp DESC);
+
+CREATE INDEX IF NOT EXISTS riskscores_visit_generated_idx
+    ON RiskScores (visit_id, generated_at DESC);
+
+CREATE INDEX IF NOT EXISTS diagnosis_visit_datetime_idx
+    ON Diagnosis (visit_id, diagnosis_datetime DESC);
+
+CREATE INDEX IF NOT EXISTS visits_patient_date_idx
+    ON Visits (patient_id, visit_date DESC);
+
+-- The census only ever looks at admitted patients, a small slice of all
+-- patients once discharged history accumulates
+CREATE INDEX IF NOT EXISTS patients_admitted_idx
+    ON Patients (patient_id) WHERE status = 'admitted';
@@ -0,0 +1,22 @@
+-- migrations/002_icu_length_of_stay.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/002_icu_length_of_stay.sql
+--
+-- ICU length of stay is derived at read time instead of being written back to
+-- Visits on every dashboard render. Visits.iculos is kept as a snapshot that
+-- only the batch scoring path refreshes.
+
+-- Days since midnight of the visit date, the same value the dashboard used to
+-- compute in Python
+CREATE OR REPLACE FUNCTION icu_length_of_stay(visit_date TIMESTAMP)
+RETURNS REAL
+LANGUAGE sql STABLE
+AS $$
+    SELECT (EXTRACT(EPOCH FROM LOCALTIMESTAMP - date_trunc('day', visit_date)) / 86400)::real
+$$;
+
+CREATE OR REPLACE VIEW VisitStay AS
+SELECT v.visit_id,
+       v.patient_id,
+       v.visit_date,
+       icu_length_of_stay(v.visit_date) AS iculos
+FROM Visits v;
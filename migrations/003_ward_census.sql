@@ -0,0 +1,110 @@
+-- migrations/003_ward_census.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/003_ward_census.sql
+--
+-- WardCensus holds the latest risk score of every visit together with its
+-- precomputed risk band and sepsis flag. Triggers on RiskScores and Diagnosis
+-- keep it current, so the census page reads one small row per visit instead
+-- of sorting the whole RiskScores history on every rerun.
+
+-- Same cut-points as the dashboard KPIs (queries.LOW_RISK_MAX / HIGH_RISK_MIN)
+CREATE OR REPLACE FUNCTION risk_band(score REAL)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE WHEN score < 0.20 THEN 'low'
+                WHEN score < 0.80 THEN 'medium'
+                ELSE 'high' END
+$$;
+
+CREATE OR REPLACE FUNCTION latest_sepsis_flag(p_visit_id INTEGER)
+RETURNS BOOLEAN
+LANGUAGE sql STABLE
+AS $$
+    SELECT COALESCE((
+        SELECT sepsis FROM Diagnosis
+        WHERE visit_id = p_visit_id
+        ORDER BY diagnosis_datetime DESC
+        LIMIT 1
+    ), FALSE)
+$$;
+
+CREATE TABLE IF NOT EXISTS WardCensus (
+    visit_id INTEGER PRIMARY KEY REFERENCES Visits(visit_id),
+    score REAL NOT NULL,
+    generated_at TIMESTAMP NOT NULL,
+    risk_band TEXT NOT NULL CHECK (risk_band IN ('low','medium','high')),
+    sepsis BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+-- Backfill from existing history
+INSERT INTO WardCensus (visit_id, score, generated_at, risk_band, sepsis)
+SELECT DISTINCT ON (r.visit_id) r.visit_id, r.score, r.generated_at, risk_band(r.score), latest_sepsis_flag(r.visit_id)
+FROM RiskScores r
+ORDER BY r.visit_id, r.generated_at DESC
+ON CONFLICT (visit_id) DO NOTHING;
+
+-- New scores: one upsert per statement, so a batch insert of thousands of
+-- scores costs a single set-based update
+CREATE OR REPLACE FUNCTION ward_census_scores_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO WardCensus AS wc (visit_id, score, generated_at, risk_band, sepsis)
+    SELECT DISTINCT ON (n.visit_id) n.visit_id, n.score, n.generated_at, risk_band(n.score), latest_sepsis_flag(n.visit_id)
+    FROM new_scores n
+    ORDER BY n.visit_id, n.generated_at DESC
+    ON CONFLICT (visit_id) DO UPDATE
+        SET score = EXCLUDED.score,
+            generated_at = EXCLUDED.generated_at,
+            risk_band = EXCLUDED.risk_band
+        WHERE wc.generated_at <= EXCLUDED.generated_at;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ward_census_scores_inserted ON RiskScores;
+CREATE TRIGGER ward_census_scores_inserted
+    AFTER INSERT ON RiskScores
+    REFERENCING NEW TABLE AS new_scores
+    FOR EACH STATEMENT EXECUTE FUNCTION ward_census_scores_inserted();
+
+-- Deleted scores (rare): fall back to the visit's next most recent score
+CREATE OR REPLACE FUNCTION ward_census_score_deleted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM WardCensus WHERE visit_id = OLD.visit_id;
+    INSERT INTO WardCensus (visit_id, score, generated_at, risk_band, sepsis)
+    SELECT r.visit_id, r.score, r.generated_at, risk_band(r.score), latest_sepsis_flag(r.visit_id)
+    FROM RiskScores r
+    WHERE r.visit_id = OLD.visit_id
+    ORDER BY r.generated_at DESC
+    LIMIT 1;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ward_census_score_deleted ON RiskScores;
+CREATE TRIGGER ward_census_score_deleted
+    AFTER DELETE ON RiskScores
+    FOR EACH ROW EXECUTE FUNCTION ward_census_score_deleted();
+
+-- Diagnoses recorded or removed: refresh the visit's sepsis flag
+CREATE OR REPLACE FUNCTION ward_census_diagnosis_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_visit_id INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.visit_id ELSE NEW.visit_id END;
+BEGIN
+    UPDATE WardCensus SET sepsis = latest_sepsis_flag(v_visit_id) WHERE visit_id = v_visit_id;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ward_census_diagnosis_changed ON Diagnosis;
+CREATE TRIGGER ward_census_diagnosis_changed
+    AFTER INSERT OR UPDATE OR DELETE ON Diagnosis
+    FOR EACH ROW EXECUTE FUNCTION ward_census_diagnosis_changed();
@@ -0,0 +1,192 @@
+-- migrations/004_partitioning.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/004_partitioning.sql
+--
+-- Vitals, Labs and RiskScores become range-partitioned by their timestamp
+-- (monthly by default, see TimePartitioning). Each partition carries its own
+-- small indexes, so index size and vacuum work track recent data only, and
+-- old partitions can be detached and archived as a whole (partitions.py).
+--
+-- The latest-row queries in queries.py bound the timestamp by
+-- observations_since(visit_date), which lets Postgres skip every partition
+-- older than the visit at execution time.
+--
+-- Converting an existing database rewrites the three tables once; run it in a
+-- maintenance window. Re-running the migration is a no-op.
+
+-- Partitioning settings per table; granularity is 'week' or 'month'. Changing
+-- it only affects partitions created afterwards (overlapping ranges are skipped).
+CREATE TABLE IF NOT EXISTS TimePartitioning (
+    table_name TEXT PRIMARY KEY,
+    column_name TEXT NOT NULL,
+    granularity TEXT NOT NULL DEFAULT 'month' CHECK (granularity IN ('week','month'))
+);
+
+INSERT INTO TimePartitioning (table_name, column_name) VALUES
+  ('vitals', 'timestamp'),
+  ('labs', 'timestamp'),
+  ('riskscores', 'generated_at')
+ON CONFLICT (table_name) DO NOTHING;
+
+-- Earliest timestamp an observation or score of a visit can have. A day of
+-- slack covers visit dates entered after the first readings were taken.
+CREATE OR REPLACE FUNCTION observations_since(visit_date TIMESTAMP)
+RETURNS TIMESTAMP
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT visit_date - interval '1 day'
+$$;
+
+-- Create the partitions of p_table covering [p_since, p_until), named
+-- <table>_pYYYYMMDD after their lower bound. Rows that fell into the default
+-- partition for a new range are moved into it. Returns the number created.
+CREATE OR REPLACE FUNCTION create_time_partitions(p_table TEXT, p_since TIMESTAMP, p_until TIMESTAMP)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    cfg TimePartitioning%ROWTYPE;
+    lo TIMESTAMP;
+    hi TIMESTAMP;
+    part TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT * INTO STRICT cfg FROM TimePartitioning WHERE table_name = lower(p_table);
+    -- Moving rows out of the default partition is not a real delete
+    PERFORM set_config('sepsis.partition_maintenance', 'on', true);
+    lo := date_trunc(cfg.granularity, p_since);
+    WHILE lo < p_until LOOP
+        hi := lo + ('1 ' || cfg.granularity)::interval;
+        part := format('%s_p%s', cfg.table_name, to_char(lo, 'YYYYMMDD'));
+        IF to_regclass(part) IS NULL THEN
+            BEGIN
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', part, cfg.table_name);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                    cfg.table_name || '_default', cfg.column_name, lo, cfg.column_name, hi, part
+                );
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               cfg.table_name, part, lo, hi);
+                created := created + 1;
+            EXCEPTION WHEN invalid_object_definition THEN
+                -- Overlaps a partition created with another granularity
+                RAISE NOTICE 'skipping %: overlaps an existing partition', part;
+            END;
+        END IF;
+        lo := hi;
+    END LOOP;
+    PERFORM set_config('sepsis.partition_maintenance', 'off', true);
+    RETURN created;
+END;
+$$;
+
+DO $$
+DECLARE
+    since TIMESTAMP;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'vitals'::regclass) = 'r' THEN
+        ALTER TABLE Vitals RENAME TO vitals_unpartitioned;
+        CREATE SEQUENCE vitals_id_seq AS INTEGER;
+        PERFORM setval('vitals_id_seq', COALESCE(max(vitals_id), 0) + 1, false) FROM vitals_unpartitioned;
+        CREATE TABLE Vitals (
+            vitals_id INTEGER NOT NULL DEFAULT nextval('vitals_id_seq'),
+            visit_id INTEGER NOT NULL REFERENCES Visits(visit_id),
+            entered_by TEXT NOT NULL REFERENCES Users(username),
+            temp REAL, hr REAL, sbp REAL, dbp REAL, map REAL,
+            resp REAL, o2sat REAL,
+            timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (vitals_id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        ALTER SEQUENCE vitals_id_seq OWNED BY Vitals.vitals_id;
+        CREATE TABLE vitals_default PARTITION OF Vitals DEFAULT;
+        SELECT least(min(timestamp), LOCALTIMESTAMP) INTO since FROM vitals_unpartitioned;
+        PERFORM create_time_partitions('vitals', since, LOCALTIMESTAMP + interval '3 months');
+        INSERT INTO Vitals (vitals_id, visit_id, entered_by, temp, hr, sbp, dbp, map, resp, o2sat, timestamp)
+        SELECT vitals_id, visit_id, entered_by, temp, hr, sbp, dbp, map, resp, o2sat, timestamp
+        FROM vitals_unpartitioned;
+        DROP TABLE vitals_unpartitioned;
+        CREATE INDEX vitals_visit_timestamp_idx ON Vitals (visit_id, timestamp DESC);
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = 'labs'::regclass) = 'r' THEN
+        ALTER TABLE Labs RENAME TO labs_unpartitioned;
+        CREATE SEQUENCE labs_id_seq AS INTEGER;
+        PERFORM setval('labs_id_seq', COALESCE(max(lab_id), 0) + 1, false) FROM labs_unpartitioned;
+        CREATE TABLE Labs (
+            lab_id INTEGER NOT NULL DEFAULT nextval('labs_id_seq'),
+            visit_id INTEGER NOT NULL REFERENCES Visits(visit_id),
+            entered_by TEXT NOT NULL REFERENCES Users(username),
+            wbc REAL, creatinine REAL,
+            bilirubin_total REAL, bilirubin_direct REAL,
+            platelets REAL, lactate REAL,
+            timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (lab_id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        ALTER SEQUENCE labs_id_seq OWNED BY Labs.lab_id;
+        CREATE TABLE labs_default PARTITION OF Labs DEFAULT;
+        SELECT least(min(timestamp), LOCALTIMESTAMP) INTO since FROM labs_unpartitioned;
+        PERFORM create_time_partitions('labs', since, LOCALTIMESTAMP + interval '3 months');
+        INSERT INTO Labs (lab_id, visit_id, entered_by, wbc, creatinine, bilirubin_total, bilirubin_direct,
+                          platelets, lactate, timestamp)
+        SELECT lab_id, visit_id, entered_by, wbc, creatinine, bilirubin_total, bilirubin_direct,
+               platelets, lactate, timestamp
+        FROM labs_unpartitioned;
+        DROP TABLE labs_unpartitioned;
+        CREATE INDEX labs_visit_timestamp_idx ON Labs (visit_id, timestamp DESC);
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = 'riskscores'::regclass) = 'r' THEN
+        -- Takes the ward census triggers with it; they are recreated below
+        ALTER TABLE RiskScores RENAME TO riskscores_unpartitioned;
+        CREATE SEQUENCE riskscores_id_seq AS INTEGER;
+        PERFORM setval('riskscores_id_seq', COALESCE(max(score_id), 0) + 1, false) FROM riskscores_unpartitioned;
+        CREATE TABLE RiskScores (
+            score_id INTEGER NOT NULL DEFAULT nextval('riskscores_id_seq'),
+            visit_id INTEGER NOT NULL REFERENCES Visits(visit_id),
+            score REAL NOT NULL,
+            generated_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (score_id, generated_at)
+        ) PARTITION BY RANGE (generated_at);
+        ALTER SEQUENCE riskscores_id_seq OWNED BY RiskScores.score_id;
+        CREATE TABLE riskscores_default PARTITION OF RiskScores DEFAULT;
+        SELECT least(min(generated_at), LOCALTIMESTAMP) INTO since FROM riskscores_unpartitioned;
+        PERFORM create_time_partitions('riskscores', since, LOCALTIMESTAMP + interval '3 months');
+        INSERT INTO RiskScores (score_id, visit_id, score, generated_at)
+        SELECT score_id, visit_id, score, generated_at
+        FROM riskscores_unpartitioned;
+        DROP TABLE riskscores_unpartitioned;
+        CREATE INDEX riskscores_visit_generated_idx ON RiskScores (visit_id, generated_at DESC);
+    END IF;
+END;
+$$;
+
+-- Same as in 003_ward_census.sql, except that rows moved between partitions
+-- by create_time_partitions() leave the census alone
+CREATE OR REPLACE FUNCTION ward_census_score_deleted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF current_setting('sepsis.partition_maintenance', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    DELETE FROM WardCensus WHERE visit_id = OLD.visit_id;
+    INSERT INTO WardCensus (visit_id, score, generated_at, risk_band, sepsis)
+    SELECT r.visit_id, r.score, r.generated_at, risk_band(r.score), latest_sepsis_flag(r.visit_id)
+    FROM RiskScores r
+    WHERE r.visit_id = OLD.visit_id
+    ORDER BY r.generated_at DESC
+    LIMIT 1;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ward_census_scores_inserted ON RiskScores;
+CREATE TRIGGER ward_census_scores_inserted
+    AFTER INSERT ON RiskScores
+    REFERENCING NEW TABLE AS new_scores
+    FOR EACH STATEMENT EXECUTE FUNCTION ward_census_scores_inserted();
+
+DROP TRIGGER IF EXISTS ward_census_score_deleted ON RiskScores;
+CREATE TRIGGER ward_census_score_deleted
+    AFTER DELETE ON RiskScores
+    FOR EACH ROW EXECUTE FUNCTION ward_census_score_deleted();
@@ -0,0 +1,198 @@
+-- migrations/005_visit_features.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/005_visit_features.sql
+--
+-- VisitFeatures is the current model input of every visit: the most recent
+-- non-NULL value of each vitals/labs feature (last observation carried
+-- forward) and when it was measured. Statement triggers on Vitals and Labs
+-- fold every insert into it, so scoring reads one row by primary key instead
+-- of sorting the visit's history, and a NULL in the newest row no longer hides
+-- an earlier measurement from the model.
+--
+-- vitals_at/labs_at are the newest Vitals/Labs row of the visit (vitals_at
+-- drives HourOfObservation); <column>_at is when that value was measured, so
+-- LOCALTIMESTAMP - <column>_at is its age. Rows arriving out of order only
+-- replace values that are older than themselves.
+
+CREATE TABLE IF NOT EXISTS VisitFeatures (
+    visit_id INTEGER PRIMARY KEY REFERENCES Visits(visit_id),
+    vitals_at TIMESTAMP,
+    temp REAL, temp_at TIMESTAMP,
+    hr REAL, hr_at TIMESTAMP,
+    sbp REAL, sbp_at TIMESTAMP,
+    dbp REAL, dbp_at TIMESTAMP,
+    map REAL, map_at TIMESTAMP,
+    resp REAL, resp_at TIMESTAMP,
+    o2sat REAL, o2sat_at TIMESTAMP,
+    labs_at TIMESTAMP,
+    wbc REAL, wbc_at TIMESTAMP,
+    creatinine REAL, creatinine_at TIMESTAMP,
+    bilirubin_total REAL, bilirubin_total_at TIMESTAMP,
+    platelets REAL, platelets_at TIMESTAMP,
+    lactate REAL, lactate_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION visit_features_vitals_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO VisitFeatures AS vf (visit_id, vitals_at, temp, temp_at, hr, hr_at, sbp, sbp_at, dbp, dbp_at, map, map_at, resp, resp_at, o2sat, o2sat_at, updated_at)
+    SELECT visit_id,
+           max(timestamp),
+           (array_agg(temp ORDER BY timestamp DESC) FILTER (WHERE temp IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE temp IS NOT NULL),
+           (array_agg(hr ORDER BY timestamp DESC) FILTER (WHERE hr IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE hr IS NOT NULL),
+           (array_agg(sbp ORDER BY timestamp DESC) FILTER (WHERE sbp IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE sbp IS NOT NULL),
+           (array_agg(dbp ORDER BY timestamp DESC) FILTER (WHERE dbp IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE dbp IS NOT NULL),
+           (array_agg(map ORDER BY timestamp DESC) FILTER (WHERE map IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE map IS NOT NULL),
+           (array_agg(resp ORDER BY timestamp DESC) FILTER (WHERE resp IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE resp IS NOT NULL),
+           (array_agg(o2sat ORDER BY timestamp DESC) FILTER (WHERE o2sat IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE o2sat IS NOT NULL),
+           LOCALTIMESTAMP
+    FROM new_vitals
+    GROUP BY visit_id
+    ON CONFLICT (visit_id) DO UPDATE
+        SET vitals_at = GREATEST(vf.vitals_at, EXCLUDED.vitals_at),
+            temp = CASE WHEN EXCLUDED.temp_at >= vf.temp_at OR vf.temp_at IS NULL THEN EXCLUDED.temp ELSE vf.temp END,
+            temp_at = GREATEST(vf.temp_at, EXCLUDED.temp_at),
+            hr = CASE WHEN EXCLUDED.hr_at >= vf.hr_at OR vf.hr_at IS NULL THEN EXCLUDED.hr ELSE vf.hr END,
+            hr_at = GREATEST(vf.hr_at, EXCLUDED.hr_at),
+            sbp = CASE WHEN EXCLUDED.sbp_at >= vf.sbp_at OR vf.sbp_at IS NULL THEN EXCLUDED.sbp ELSE vf.sbp END,
+            sbp_at = GREATEST(vf.sbp_at, EXCLUDED.sbp_at),
+            dbp = CASE WHEN EXCLUDED.dbp_at >= vf.dbp_at OR vf.dbp_at IS NULL THEN EXCLUDED.dbp ELSE vf.dbp END,
+            dbp_at = GREATEST(vf.dbp_at, EXCLUDED.dbp_at),
+            map = CASE WHEN EXCLUDED.map_at >= vf.map_at OR vf.map_at IS NULL THEN EXCLUDED.map ELSE vf.map END,
+            map_at = GREATEST(vf.map_at, EXCLUDED.map_at),
+            resp = CASE WHEN EXCLUDED.resp_at >= vf.resp_at OR vf.resp_at IS NULL THEN EXCLUDED.resp ELSE vf.resp END,
+            resp_at = GREATEST(vf.resp_at, EXCLUDED.resp_at),
+            o2sat = CASE WHEN EXCLUDED.o2sat_at >= vf.o2sat_at OR vf.o2sat_at IS NULL THEN EXCLUDED.o2sat ELSE vf.o2sat END,
+            o2sat_at = GREATEST(vf.o2sat_at, EXCLUDED.o2sat_at),
+            updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS visit_features_vitals_inserted ON Vitals;
+CREATE TRIGGER visit_features_vitals_inserted
+    AFTER INSERT ON Vitals
+    REFERENCING NEW TABLE AS new_vitals
+    FOR EACH STATEMENT EXECUTE FUNCTION visit_features_vitals_inserted();
+
+CREATE OR REPLACE FUNCTION visit_features_labs_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO VisitFeatures AS vf (visit_id, labs_at, wbc, wbc_at, creatinine, creatinine_at, bilirubin_total, bilirubin_total_at, platelets, platelets_at, lactate, lactate_at, updated_at)
+    SELECT visit_id,
+           max(timestamp),
+           (array_agg(wbc ORDER BY timestamp DESC) FILTER (WHERE wbc IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE wbc IS NOT NULL),
+           (array_agg(creatinine ORDER BY timestamp DESC) FILTER (WHERE creatinine IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE creatinine IS NOT NULL),
+           (array_agg(bilirubin_total ORDER BY timestamp DESC) FILTER (WHERE bilirubin_total IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE bilirubin_total IS NOT NULL),
+           (array_agg(platelets ORDER BY timestamp DESC) FILTER (WHERE platelets IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE platelets IS NOT NULL),
+           (array_agg(lactate ORDER BY timestamp DESC) FILTER (WHERE lactate IS NOT NULL))[1],
+           max(timestamp) FILTER (WHERE lactate IS NOT NULL),
+           LOCALTIMESTAMP
+    FROM new_labs
+    GROUP BY visit_id
+    ON CONFLICT (visit_id) DO UPDATE
+        SET labs_at = GREATEST(vf.labs_at, EXCLUDED.labs_at),
+            wbc = CASE WHEN EXCLUDED.wbc_at >= vf.wbc_at OR vf.wbc_at IS NULL THEN EXCLUDED.wbc ELSE vf.wbc END,
+            wbc_at = GREATEST(vf.wbc_at, EXCLUDED.wbc_at),
+            creatinine = CASE WHEN EXCLUDED.creatinine_at >= vf.creatinine_at OR vf.creatinine_at IS NULL THEN EXCLUDED.creatinine ELSE vf.creatinine END,
+            creatinine_at = GREATEST(vf.creatinine_at, EXCLUDED.creatinine_at),
+            bilirubin_total = CASE WHEN EXCLUDED.bilirubin_total_at >= vf.bilirubin_total_at OR vf.bilirubin_total_at IS NULL THEN EXCLUDED.bilirubin_total ELSE vf.bilirubin_total END,
+            bilirubin_total_at = GREATEST(vf.bilirubin_total_at, EXCLUDED.bilirubin_total_at),
+            platelets = CASE WHEN EXCLUDED.platelets_at >= vf.platelets_at OR vf.platelets_at IS NULL THEN EXCLUDED.platelets ELSE vf.platelets END,
+            platelets_at = GREATEST(vf.platelets_at, EXCLUDED.platelets_at),
+            lactate = CASE WHEN EXCLUDED.lactate_at >= vf.lactate_at OR vf.lactate_at IS NULL THEN EXCLUDED.lactate ELSE vf.lactate END,
+            lactate_at = GREATEST(vf.lactate_at, EXCLUDED.lactate_at),
+            updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS visit_features_labs_inserted ON Labs;
+CREATE TRIGGER visit_features_labs_inserted
+    AFTER INSERT ON Labs
+    REFERENCING NEW TABLE AS new_labs
+    FOR EACH STATEMENT EXECUTE FUNCTION visit_features_labs_inserted();
+
+-- Backfill from existing history (the same merge, over whole tables)
+INSERT INTO VisitFeatures AS vf (visit_id, vitals_at, temp, temp_at, hr, hr_at, sbp, sbp_at, dbp, dbp_at, map, map_at, resp, resp_at, o2sat, o2sat_at, updated_at)
+SELECT visit_id,
+       max(timestamp),
+       (array_agg(temp ORDER BY timestamp DESC) FILTER (WHERE temp IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE temp IS NOT NULL),
+       (array_agg(hr ORDER BY timestamp DESC) FILTER (WHERE hr IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE hr IS NOT NULL),
+       (array_agg(sbp ORDER BY timestamp DESC) FILTER (WHERE sbp IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE sbp IS NOT NULL),
+       (array_agg(dbp ORDER BY timestamp DESC) FILTER (WHERE dbp IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE dbp IS NOT NULL),
+       (array_agg(map ORDER BY timestamp DESC) FILTER (WHERE map IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE map IS NOT NULL),
+       (array_agg(resp ORDER BY timestamp DESC) FILTER (WHERE resp IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE resp IS NOT NULL),
+       (array_agg(o2sat ORDER BY timestamp DESC) FILTER (WHERE o2sat IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE o2sat IS NOT NULL),
+       LOCALTIMESTAMP
+FROM Vitals
+GROUP BY visit_id
+ON CONFLICT (visit_id) DO UPDATE
+    SET vitals_at = GREATEST(vf.vitals_at, EXCLUDED.vitals_at),
+        temp = CASE WHEN EXCLUDED.temp_at >= vf.temp_at OR vf.temp_at IS NULL THEN EXCLUDED.temp ELSE vf.temp END,
+        temp_at = GREATEST(vf.temp_at, EXCLUDED.temp_at),
+        hr = CASE WHEN EXCLUDED.hr_at >= vf.hr_at OR vf.hr_at IS NULL THEN EXCLUDED.hr ELSE vf.hr END,
+        hr_at = GREATEST(vf.hr_at, EXCLUDED.hr_at),
+        sbp = CASE WHEN EXCLUDED.sbp_at >= vf.sbp_at OR vf.sbp_at IS NULL THEN EXCLUDED.sbp ELSE vf.sbp END,
+        sbp_at = GREATEST(vf.sbp_at, EXCLUDED.sbp_at),
+        dbp = CASE WHEN EXCLUDED.dbp_at >= vf.dbp_at OR vf.dbp_at IS NULL THEN EXCLUDED.dbp ELSE vf.dbp END,
+        dbp_at = GREATEST(vf.dbp_at, EXCLUDED.dbp_at),
+        map = CASE WHEN EXCLUDED.map_at >= vf.map_at OR vf.map_at IS NULL THEN EXCLUDED.map ELSE vf.map END,
+        map_at = GREATEST(vf.map_at, EXCLUDED.map_at),
+        resp = CASE WHEN EXCLUDED.resp_at >= vf.resp_at OR vf.resp_at IS NULL THEN EXCLUDED.resp ELSE vf.resp END,
+        resp_at = GREATEST(vf.resp_at, EXCLUDED.resp_at),
+        o2sat = CASE WHEN EXCLUDED.o2sat_at >= vf.o2sat_at OR vf.o2sat_at IS NULL THEN EXCLUDED.o2sat ELSE vf.o2sat END,
+        o2sat_at = GREATEST(vf.o2sat_at, EXCLUDED.o2sat_at),
+        updated_at = EXCLUDED.updated_at;
+
+INSERT INTO VisitFeatures AS vf (visit_id, labs_at, wbc, wbc_at, creatinine, creatinine_at, bilirubin_total, bilirubin_total_at, platelets, platelets_at, lactate, lactate_at, updated_at)
+SELECT visit_id,
+       max(timestamp),
+       (array_agg(wbc ORDER BY timestamp DESC) FILTER (WHERE wbc IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE wbc IS NOT NULL),
+       (array_agg(creatinine ORDER BY timestamp DESC) FILTER (WHERE creatinine IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE creatinine IS NOT NULL),
+       (array_agg(bilirubin_total ORDER BY timestamp DESC) FILTER (WHERE bilirubin_total IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE bilirubin_total IS NOT NULL),
+       (array_agg(platelets ORDER BY timestamp DESC) FILTER (WHERE platelets IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE platelets IS NOT NULL),
+       (array_agg(lactate ORDER BY timestamp DESC) FILTER (WHERE lactate IS NOT NULL))[1],
+       max(timestamp) FILTER (WHERE lactate IS NOT NULL),
+       LOCALTIMESTAMP
+FROM Labs
+GROUP BY visit_id
+ON CONFLICT (visit_id) DO UPDATE
+    SET labs_at = GREATEST(vf.labs_at, EXCLUDED.labs_at),
+        wbc = CASE WHEN EXCLUDED.wbc_at >= vf.wbc_at OR vf.wbc_at IS NULL THEN EXCLUDED.wbc ELSE vf.wbc END,
+        wbc_at = GREATEST(vf.wbc_at, EXCLUDED.wbc_at),
+        creatinine = CASE WHEN EXCLUDED.creatinine_at >= vf.creatinine_at OR vf.creatinine_at IS NULL THEN EXCLUDED.creatinine ELSE vf.creatinine END,
+        creatinine_at = GREATEST(vf.creatinine_at, EXCLUDED.creatinine_at),
+        bilirubin_total = CASE WHEN EXCLUDED.bilirubin_total_at >= vf.bilirubin_total_at OR vf.bilirubin_total_at IS NULL THEN EXCLUDED.bilirubin_total ELSE vf.bilirubin_total END,
+        bilirubin_total_at = GREATEST(vf.bilirubin_total_at, EXCLUDED.bilirubin_total_at),
+        platelets = CASE WHEN EXCLUDED.platelets_at >= vf.platelets_at OR vf.platelets_at IS NULL THEN EXCLUDED.platelets ELSE vf.platelets END,
+        platelets_at = GREATEST(vf.platelets_at, EXCLUDED.platelets_at),
+        lactate = CASE WHEN EXCLUDED.lactate_at >= vf.lactate_at OR vf.lactate_at IS NULL THEN EXCLUDED.lactate ELSE vf.lactate END,
+        lactate_at = GREATEST(vf.lactate_at, EXCLUDED.lactate_at),
+        updated_at = EXCLUDED.updated_at;
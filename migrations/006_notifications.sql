@@ -0,0 +1,74 @@
+-- migrations/006_notifications.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/006_notifications.sql
+--
+-- Score, diagnosis and admission/discharge writes announce themselves on the
+-- sepsis_events channel, so the app (live.py) can refresh the affected views
+-- instead of waiting for a click or polling. Notifications are delivered on
+-- commit, and identical ones within a transaction are collapsed.
+--
+-- Payload: {"kind": "score"|"diagnosis", "visit_ids": [...]} or
+--          {"kind": "patient", "patient_ids": [...]}
+-- visit_ids is null when a statement touched more visits than fit in a
+-- notification (payloads are limited to 8000 bytes); listeners then treat
+-- every visit as changed.
+
+CREATE OR REPLACE FUNCTION notify_scores_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    SELECT array_agg(DISTINCT visit_id) INTO ids FROM new_scores;
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'score',
+        'visit_ids', CASE WHEN cardinality(ids) <= 500 THEN ids END
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_scores_inserted ON RiskScores;
+CREATE TRIGGER notify_scores_inserted
+    AFTER INSERT ON RiskScores
+    REFERENCING NEW TABLE AS new_scores
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_scores_inserted();
+
+CREATE OR REPLACE FUNCTION notify_diagnosis_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_visit_id INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.visit_id ELSE NEW.visit_id END;
+BEGIN
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'diagnosis',
+        'visit_ids', json_build_array(v_visit_id)
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_diagnosis_changed ON Diagnosis;
+CREATE TRIGGER notify_diagnosis_changed
+    AFTER INSERT OR UPDATE OR DELETE ON Diagnosis
+    FOR EACH ROW EXECUTE FUNCTION notify_diagnosis_changed();
+
+-- New patients and admissions/discharges change who is on the census
+CREATE OR REPLACE FUNCTION notify_patient_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'patient',
+        'patient_ids', json_build_array(NEW.patient_id)
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_patient_changed ON Patients;
+CREATE TRIGGER notify_patient_changed
+    AFTER INSERT OR UPDATE OF status ON Patients
+    FOR EACH ROW EXECUTE FUNCTION notify_patient_changed();
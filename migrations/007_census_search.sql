@@ -0,0 +1,23 @@
+-- migrations/007_census_search.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/007_census_search.sql
+--
+-- Trigram indexes behind the census search box (queries.CENSUS_SQL), which
+-- matches the typed text anywhere in the patient ID, the name or the room.
+-- pg_trgm ships with PostgreSQL; creating the extension needs a superuser or,
+-- on PostgreSQL 13+, a user with CREATE on the database.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Only admitted patients are ever searched
+CREATE INDEX IF NOT EXISTS patients_admitted_id_trgm_idx
+    ON Patients USING gin (patient_id gin_trgm_ops)
+    WHERE status = 'admitted';
+
+CREATE INDEX IF NOT EXISTS patients_admitted_name_trgm_idx
+    ON Patients USING gin ((coalesce(firstname, '') || ' ' || coalesce(lastname, '')) gin_trgm_ops)
+    WHERE status = 'admitted';
+
+-- Discharge clears the room, so occupied rooms are a small slice of all visits
+CREATE INDEX IF NOT EXISTS visits_location_trgm_idx
+    ON Visits USING gin (location gin_trgm_ops)
+    WHERE location IS NOT NULL;
@@ -0,0 +1,15 @@
+-- migrations/008_score_contributions.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/008_score_contributions.sql
+--
+-- Every risk score carries the model's TreeSHAP explanation, computed in the
+-- same booster call as the score (scoring.predict_with_contributions): one
+-- log-odds contribution per model feature, in queries.FEATURES order, followed
+-- by the bias term; the elements sum to the logit of the score. The lookup
+-- page reads it together with the score (LATEST_SCORE_SQL), so showing the
+-- top drivers costs no extra query and no inference.
+--
+-- Scores written before this migration, or by tools that don't explain,
+-- have NULL contributions. Adding a nullable column without a default does
+-- not rewrite the partitions.
+
+ALTER TABLE RiskScores ADD COLUMN IF NOT EXISTS contributions REAL[];
@@ -0,0 +1,69 @@
+-- migrations/009_alerts.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/009_alerts.sql
+--
+-- Alerts raised by alerts.py on newly written risk scores (high-risk band
+-- crossed, rapid rise, vitals overdue) and by the "Notify Physician" button.
+-- Each row is delivered once through the configured notifier; delivered_at is
+-- set on success, attempts/last_error record failures for the next dispatch.
+-- claimed_until marks rows a dispatcher is sending (outside any transaction),
+-- so others skip them until it records the outcome or the claim expires.
+--
+-- AlertState is the engine's per-visit memory, so a new score is compared
+-- with the previous one without reading RiskScores history:
+--   last_score/last_scored_at   the latest evaluated score
+--   window_at/window_score      scores within the rise window that can still
+--                               be its minimum (a monotonic queue, oldest first)
+--   last_alerts                 {"<rule>": "<ISO timestamp>"} of the last alert
+--                               per rule, for deduplication
+-- Rows are locked by the scoring transaction that updates them, so concurrent
+-- writers (app, scheduler, ingest) evaluate a visit's scores one at a time.
+
+CREATE TABLE IF NOT EXISTS AlertState (
+    visit_id INTEGER PRIMARY KEY REFERENCES Visits(visit_id),
+    last_score REAL,
+    last_scored_at TIMESTAMP,
+    window_at TIMESTAMP[] NOT NULL DEFAULT '{}',
+    window_score REAL[] NOT NULL DEFAULT '{}',
+    last_alerts JSONB NOT NULL DEFAULT '{}'
+);
+
+CREATE TABLE IF NOT EXISTS Alerts (
+    alert_id INTEGER PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+    visit_id INTEGER NOT NULL REFERENCES Visits(visit_id),
+    rule TEXT NOT NULL,
+    score REAL,
+    message TEXT NOT NULL,
+    raised_by TEXT REFERENCES Users(username),
+    created_at TIMESTAMP NOT NULL,
+    delivered_at TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_until TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS alerts_visit_created_idx ON Alerts (visit_id, created_at DESC);
+-- The dispatcher's work queue: undelivered alerts only
+CREATE INDEX IF NOT EXISTS alerts_undelivered_idx ON Alerts (created_at) WHERE delivered_at IS NULL;
+
+-- New alerts refresh the visit's views like a new score does (see live.py)
+CREATE OR REPLACE FUNCTION notify_alerts_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    SELECT array_agg(DISTINCT visit_id) INTO ids FROM new_alerts;
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'alert',
+        'visit_ids', CASE WHEN cardinality(ids) <= 500 THEN ids END
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_alerts_inserted ON Alerts;
+CREATE TRIGGER notify_alerts_inserted
+    AFTER INSERT ON Alerts
+    REFERENCING NEW TABLE AS new_alerts
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_alerts_inserted();
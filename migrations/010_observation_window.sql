@@ -0,0 +1,54 @@
+-- migrations/010_observation_window.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/010_observation_window.sql
+--
+-- The partition-pruning bound of every per-visit query on Vitals, Labs and
+-- RiskScores (see migrations/004_partitioning.sql) is stored on the visit as
+-- Visits.observations_from instead of being computed from visit_date, which
+-- clinicians can edit. A trigger keeps it at observations_since(visit_date)
+-- at most, and only ever moves it earlier: moving visit_date forward through
+-- "Edit Visit Details" can no longer hide scores and readings already stored,
+-- while moving it back widens the window as before.
+--
+-- The backfill reads every visit's first observation once; run it in a
+-- maintenance window. Re-running the migration is a no-op.
+
+ALTER TABLE Visits ADD COLUMN IF NOT EXISTS observations_from TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION visits_observation_window()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.observations_from := LEAST(
+        NEW.observations_from,
+        observations_since(NEW.visit_date),
+        CASE WHEN TG_OP = 'UPDATE' THEN OLD.observations_from END
+    );
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS visits_observation_window ON Visits;
+CREATE TRIGGER visits_observation_window
+    BEFORE INSERT OR UPDATE ON Visits
+    FOR EACH ROW EXECUTE FUNCTION visits_observation_window();
+
+-- Existing visits: the default window, widened to any earlier row already stored
+UPDATE Visits SET observations_from = observations_since(visit_date) WHERE observations_from IS NULL;
+
+UPDATE Visits v
+SET observations_from = first.first_at
+FROM (
+    SELECT visit_id, min(first_at) AS first_at
+    FROM (
+        SELECT visit_id, min(timestamp) AS first_at FROM Vitals GROUP BY visit_id
+        UNION ALL
+        SELECT visit_id, min(timestamp) FROM Labs GROUP BY visit_id
+        UNION ALL
+        SELECT visit_id, min(generated_at) FROM RiskScores GROUP BY visit_id
+    ) o
+    GROUP BY visit_id
+) first
+WHERE first.visit_id = v.visit_id AND first.first_at < v.observations_from;
+
+ALTER TABLE Visits ALTER COLUMN observations_from SET NOT NULL;
@@ -0,0 +1,65 @@
+-- migrations/011_notify_visit_changes.sql
+-- Usage: psql -U <your_pg_user> -d sepsis_dss -f migrations/011_notify_visit_changes.sql
+--
+-- Extends the sepsis_events notifications of migrations/006_notifications.sql
+-- to the other columns the live census and lookup page show: a room change
+-- or a new visit, and edits to a patient's name, age or gender. Before this,
+-- those only appeared after some other event triggered a rerun.
+--
+-- Payload: {"kind": "visit", "visit_ids": [...], "patient_ids": [...]}
+-- (both null when a statement inserted more visits than fit in a
+-- notification), and the existing {"kind": "patient", ...} for patient edits.
+
+CREATE OR REPLACE FUNCTION notify_visits_inserted()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    ids INTEGER[];
+    patients TEXT[];
+BEGIN
+    SELECT array_agg(DISTINCT visit_id), array_agg(DISTINCT patient_id) INTO ids, patients FROM new_visits;
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'visit',
+        'visit_ids', CASE WHEN cardinality(ids) <= 200 THEN ids END,
+        'patient_ids', CASE WHEN cardinality(ids) <= 200 THEN patients END
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_visits_inserted ON Visits;
+CREATE TRIGGER notify_visits_inserted
+    AFTER INSERT ON Visits
+    REFERENCING NEW TABLE AS new_visits
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_visits_inserted();
+
+-- Edits from "Edit Visit Details" and discharge (which clears the room); the
+-- batch scorer's iculos refresh does not fire this
+CREATE OR REPLACE FUNCTION notify_visit_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('sepsis_events', json_build_object(
+        'kind', 'visit',
+        'visit_ids', json_build_array(NEW.visit_id),
+        'patient_ids', json_build_array(NEW.patient_id)
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS notify_visit_changed ON Visits;
+CREATE TRIGGER notify_visit_changed
+    AFTER UPDATE OF location, visit_date, hosp_adm_time ON Visits
+    FOR EACH ROW
+    WHEN ((OLD.location, OLD.visit_date, OLD.hosp_adm_time)
+          IS DISTINCT FROM (NEW.location, NEW.visit_date, NEW.hosp_adm_time))
+    EXECUTE FUNCTION notify_visit_changed();
+
+-- Patient edits shown on the census and lookup page, besides admission status
+DROP TRIGGER IF EXISTS notify_patient_changed ON Patients;
+CREATE TRIGGER notify_patient_changed
+    AFTER INSERT OR UPDATE OF status, firstname, lastname, age, gender ON Patients
+    FOR EACH ROW EXECUTE FUNCTION notify_patient_changed();
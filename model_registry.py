@@ -0,0 +1,160 @@
+# model_registry.py - process-wide registry of loaded sepsis model pipelines
+#
+# Streamlit re-executes app.py on every widget interaction, but imported
+# modules stay in sys.modules for the life of the server process. Keeping the
+# loaded pipelines here means the pickle is deserialized once per process and
+# shared by every session and rerun.
+#
+# Models are loaded on the first get_model() call, not at import, and the
+# heavy libraries are only imported then: joblib (and through the pickle,
+# sklearn and xgboost) for a pickle, xgboost alone for an artifact directory
+# written by export_model.py. Once an artifact has been exported, it is the
+# default.
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+PICKLE_PATH = "ML_model_development/sepsis_model.pkl"
+ARTIFACT_DIR = "ML_model_development/artifacts"
+MANIFEST_FILE = "manifest.json"
+
+
+def default_model_path():
+    """
+    The artifact named in ARTIFACT_DIR/CURRENT if one was exported, else the pickle.
+    """
+    try:
+        with open(os.path.join(ARTIFACT_DIR, "CURRENT")) as f:
+            version = f.read().strip()
+    except OSError:
+        return PICKLE_PATH
+    return os.path.join(ARTIFACT_DIR, version) if version else PICKLE_PATH
+
+
+MODEL_PATH = os.environ.get("SEPSIS_MODEL_PATH") or default_model_path()
+
+_lock = threading.Lock()
+_entries = {}
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _rss_bytes():
+    """
+    Current resident set size of this process, or None if it cannot be read.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS), close enough as a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def _source_file(path):
+    """
+    The file whose stat and checksum identify the model: the manifest of an artifact directory, else path.
+    """
+    return os.path.join(path, MANIFEST_FILE) if os.path.isdir(path) else path
+
+
+def _load(path, stat, sha256):
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    with span("model.load", path=os.path.basename(path)):
+        if os.path.isdir(path):
+            from fast_inference import load_artifact
+            model = load_artifact(path)
+        else:
+            import joblib
+            model = joblib.load(path)
+    load_seconds = time.perf_counter() - start
+    rss_after = _rss_bytes()
+    memory_bytes = None
+    if rss_before is not None and rss_after is not None:
+        memory_bytes = max(rss_after - rss_before, 0)
+    entry = {
+        "model": model,
+        "path": path,
+        "sha256": sha256,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "load_seconds": load_seconds,
+        "memory_bytes": memory_bytes,
+        "loaded_at": time.time(),
+    }
+    logger.info(
+        "Loaded model %s (sha256 %s) in %.3fs, ~%s bytes resident",
+        path, sha256[:12], load_seconds, memory_bytes,
+    )
+    return entry
+
+
+def get_model(path=MODEL_PATH):
+    """
+    Return the fitted pipeline stored at path, loading it at most once per process.
+    For an exported artifact directory this is a fast_inference.NativeModel,
+    whose predict_proba matches the pipeline's.
+
+    Entries are keyed by absolute path and revalidated with a stat() call on every
+    lookup. If the file's (or artifact manifest's) mtime or size changed, its SHA-256
+    is compared with the loaded copy and the model is reloaded only when the content
+    actually differs, so swapping sepsis_model.pkl hot-reloads without restarting Streamlit.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(_source_file(path))
+    entry = _entries.get(path)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["model"]
+
+    with _lock:
+        # Another thread may have (re)loaded the file while we waited
+        entry = _entries.get(path)
+        stat = os.stat(_source_file(path))
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["model"]
+        sha256 = _file_sha256(_source_file(path))
+        if entry and entry["sha256"] == sha256:
+            # Touched but unchanged: keep the loaded model, remember the new stat
+            entry["mtime_ns"] = stat.st_mtime_ns
+            entry["size"] = stat.st_size
+            return entry["model"]
+        entry = _load(path, stat, sha256)
+        _entries[path] = entry
+        return entry["model"]
+
+
+def model_stats():
+    """
+    Load time and memory footprint of every model currently held by the registry.
+    """
+    return [
+        {k: v for k, v in entry.items() if k != "model"}
+        for entry in list(_entries.values())
+    ]
+
+
+def clear():
+    """
+    Drop all loaded models; the next get_model() call reloads from disk.
+    """
+    with _lock:
+        _entries.clear()
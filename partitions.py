@@ -0,0 +1,234 @@
+# partitions.py - partition maintenance for Vitals, Labs and RiskScores
+#
+# Usage:
+#   python partitions.py list
+#   python partitions.py maintain                  # pre-create the next --ahead partitions
+#   python partitions.py archive --horizon-days 365 --archive-dir archive/
+#   python partitions.py restore archive/vitals_p20240101.copy.gz
+#
+# The tables are range-partitioned by time (migrations/004_partitioning.sql).
+# scheduler.py runs "maintain" on every pass, so new rows never have to fall
+# back to the default partition. "archive" detaches partitions that ended more
+# than --horizon-days ago and hold no rows of a current admission, writes each
+# one to a gzip-compressed COPY file plus a JSON manifest, and drops it.
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+from db import db_session
+from queries import ADMITTED_VISITS_SQL
+
+logger = logging.getLogger(__name__)
+
+# Partitions to keep ready beyond the current one
+AHEAD = int(os.environ.get("SEPSIS_PARTITION_AHEAD", "3"))
+ARCHIVE_HORIZON_DAYS = float(os.environ.get("SEPSIS_ARCHIVE_HORIZON_DAYS", "365"))
+ARCHIVE_DIR = os.environ.get("SEPSIS_ARCHIVE_DIR", "archive")
+
+BOUNDS_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partitioned_tables(cur):
+    """
+    [(table, column, granularity)] from TimePartitioning.
+    """
+    cur.execute("SELECT table_name, column_name, granularity FROM TimePartitioning ORDER BY table_name")
+    return cur.fetchall()
+
+
+def list_partitions(cur, table):
+    """
+    [(partition, lower, upper)] of table ordered by lower bound; the default
+    partition is left out.
+    """
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    result = []
+    for name, bound in cur.fetchall():
+        match = BOUNDS_RE.search(bound)
+        if match:
+            lower, upper = (datetime.fromisoformat(v) for v in match.groups())
+            result.append((name, lower, upper))
+    return sorted(result, key=lambda p: p[1])
+
+
+def create_future_partitions(ahead=AHEAD):
+    """
+    Make sure every partitioned table has partitions from now through ahead
+    periods into the future. Returns {table: partitions created}.
+    """
+    created = {}
+    with db_session() as conn:
+        with conn.cursor() as cur:
+            for table, _, granularity in partitioned_tables(cur):
+                cur.execute(
+                    "SELECT create_time_partitions(%s, LOCALTIMESTAMP, "
+                    "LOCALTIMESTAMP + %s * ('1 ' || %s)::interval)",
+                    (table, ahead + 1, granularity),
+                )
+                created[table] = cur.fetchone()[0]
+    return created
+
+
+def table_columns(cur, table):
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def holds_admitted_visits(cur, partition):
+    """
+    True if partition has rows for the current visit of an admitted patient.
+    """
+    cur.execute(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM ({ADMITTED_VISITS_SQL}) a
+            WHERE EXISTS (SELECT 1 FROM {partition} t WHERE t.visit_id = a.visit_id)
+        )
+    """)
+    return cur.fetchone()[0]
+
+
+def archivable_partitions(cur, horizon_days=ARCHIVE_HORIZON_DAYS):
+    """
+    [(table, partition, lower, upper)] for partitions that ended more than
+    horizon_days ago and only hold rows of discharged (or superseded) visits.
+    """
+    cutoff = datetime.now() - timedelta(days=horizon_days)
+    result = []
+    for table, _, _ in partitioned_tables(cur):
+        for partition, lower, upper in list_partitions(cur, table):
+            if upper <= cutoff and not holds_admitted_visits(cur, partition):
+                result.append((table, partition, lower, upper))
+    return result
+
+
+def archive_partition(conn, table, partition, lower, upper, archive_dir=ARCHIVE_DIR):
+    """
+    Detach partition, write it to <archive_dir>/<partition>.copy.gz with a JSON
+    manifest next to it, and drop it, all in conn's transaction: if writing
+    the file fails, the rollback re-attaches the partition. Returns the manifest.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition}.copy.gz")
+    tmp_path = path + ".tmp"
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        cur.execute(f"SELECT count(*) FROM {partition}")
+        rows = cur.fetchone()[0]
+        columns = table_columns(cur, partition)
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY {partition} TO STDOUT", f)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+            digest = hashlib.sha256(f.read()).hexdigest()
+        os.replace(tmp_path, path)
+        manifest = {
+            "table": table,
+            "partition": partition,
+            "lower": lower.isoformat(),
+            "upper": upper.isoformat(),
+            "rows": rows,
+            "columns": columns,
+            "sha256": digest,
+            "archived_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(path[:-len(".copy.gz")] + ".json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        cur.execute(f"DROP TABLE {partition}")
+    return manifest
+
+
+def archive(horizon_days=ARCHIVE_HORIZON_DAYS, archive_dir=ARCHIVE_DIR, dry_run=False):
+    """
+    Archive every archivable partition, one transaction each. Returns the manifests.
+    """
+    with db_session() as conn:
+        with conn.cursor() as cur:
+            candidates = archivable_partitions(cur, horizon_days)
+    manifests = []
+    for table, partition, lower, upper in candidates:
+        if dry_run:
+            logger.info("Would archive %s (%s - %s)", partition, lower, upper)
+            continue
+        with db_session() as conn:
+            manifest = archive_partition(conn, table, partition, lower, upper, archive_dir)
+        logger.info("Archived %s: %d rows", partition, manifest["rows"])
+        manifests.append(manifest)
+    return manifests
+
+
+def restore(path):
+    """
+    Re-create and re-attach a partition from an archive written by archive_partition.
+    """
+    with open(path[:-len(".copy.gz")] + ".json") as f:
+        manifest = json.load(f)
+    with open(path, "rb") as f:
+        if hashlib.sha256(f.read()).hexdigest() != manifest["sha256"]:
+            raise ValueError(f"{path} does not match its manifest checksum")
+    table, partition = manifest["table"], manifest["partition"]
+    with db_session() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)")
+            # Archives only list the columns the table had then (older ones list none);
+            # columns added since are left NULL
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                first = f.readline()
+            columns = manifest.get("columns") or table_columns(cur, table)[:first.count("\t") + 1]
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                cur.copy_expert(f"COPY {partition} ({', '.join(columns)}) FROM STDIN", f)
+            cur.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)",
+                (manifest["lower"], manifest["upper"]),
+            )
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and archive time partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show partitions and their bounds")
+    maintain = commands.add_parser("maintain", help="pre-create future partitions")
+    maintain.add_argument("--ahead", type=int, default=AHEAD)
+    archive_cmd = commands.add_parser("archive", help="detach and archive old partitions")
+    archive_cmd.add_argument("--horizon-days", type=float, default=ARCHIVE_HORIZON_DAYS)
+    archive_cmd.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    archive_cmd.add_argument("--dry-run", action="store_true")
+    restore_cmd = commands.add_parser("restore", help="re-attach an archived partition")
+    restore_cmd.add_argument("path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "list":
+        with db_session() as conn:
+            with conn.cursor() as cur:
+                for table, column, granularity in partitioned_tables(cur):
+                    print(f"{table} (by {column}, {granularity})")
+                    for partition, lower, upper in list_partitions(cur, table):
+                        print(f"  {partition:<24} {lower} - {upper}")
+    elif args.command == "maintain":
+        logger.info("Created partitions: %s", create_future_partitions(args.ahead))
+    elif args.command == "archive":
+        manifests = archive(args.horizon_days, args.archive_dir, args.dry_run)
+        logger.info("Archived %d partitions", len(manifests))
+    else:
+        manifest = restore(args.path)
+        logger.info("Restored %s (%d rows)", manifest["partition"], manifest["rows"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# queries.py - read queries behind the dashboard pages (kept here so benchmarks and plan checks run the same SQL)
+
+from collections import namedtuple
+
+# Risk bands used by the census KPIs and colouring (mirrored by risk_band() in
+# migrations/003_ward_census.sql)
+LOW_RISK_MAX = 0.20
+HIGH_RISK_MIN = 0.80
+
+# Model input columns, in the order the pipeline was trained on (the column
+# aliases of FEATURES_SQL, and the order of RiskScores.contributions)
+FEATURES = [
+    "HourOfObservation","PatientAge","ICULengthOfStay","PatientGender",
+    "TimeSinceHospitalAdmission","HeartRate","MeanArterialPressure","OxygenSaturation",
+    "RespiratoryRate","SystolicBloodPressure","DiastolicBloodPressure",
+    "Temperature","WhiteBloodCellCount","CreatinineLevel",
+    "TotalBilirubin","PlateletCount","LactateLevel"
+]
+
+# ------------------------------
+# Patient Lookup
+# ------------------------------
+LOGIN_SQL = "SELECT password_hash, role FROM Users WHERE username = %s"
+
+PATIENT_SQL = "SELECT firstname, lastname, age, gender, status FROM Patients WHERE patient_id = %s"
+
+LATEST_VISIT_SQL = "SELECT visit_id FROM Visits WHERE patient_id = %s ORDER BY visit_date DESC LIMIT 1"
+
+VISIT_ON_DATE_SQL = "SELECT visit_id FROM Visits WHERE patient_id = %s AND visit_date = %s"
+
+VISIT_DETAILS_SQL = "SELECT visit_date, hosp_adm_time, location FROM Visits WHERE visit_id = %s"
+
+# Days in the ICU as of now (see migrations/002_icu_length_of_stay.sql)
+ICU_LENGTH_OF_STAY_SQL = "SELECT iculos FROM VisitStay WHERE visit_id = %s"
+
+# Vitals, Labs and RiskScores are partitioned by time (migrations/004_partitioning.sql).
+# Every latest-row lookup below bounds the timestamp by Visits.observations_from
+# (migrations/010_observation_window.sql) so partitions older than the visit are
+# pruned at execution time; keep that bound when adding queries on these tables.
+
+# Latest score of a visit with its per-feature contributions (NULL for scores
+# written before migrations/008_score_contributions.sql).
+LATEST_SCORE_SQL = """
+    SELECT r.score, r.contributions
+    FROM Visits vi
+    CROSS JOIN LATERAL (
+        SELECT score, contributions FROM RiskScores
+        WHERE visit_id = vi.visit_id AND generated_at >= vi.observations_from
+        ORDER BY generated_at DESC
+        LIMIT 1
+    ) r
+    WHERE vi.visit_id = %s
+"""
+
+# Trend of one visit: the average of each requested series (Vitals/Labs columns
+# by name, plus 'score' for RiskScores) per time bucket, with the visit's
+# observed time range cut into %(buckets)s equal buckets, so a long stay
+# returns at most buckets rows per series. Rows are (series, bucket start,
+# value) ordered by series and time. Parameters: visit_id, series (list of
+# names), buckets
+TREND_SQL = """
+    WITH vi AS (
+        SELECT visit_id, observations_from AS since
+        FROM Visits
+        WHERE visit_id = %(visit_id)s
+    ),
+    points AS (
+        SELECT s.series, v.timestamp AS ts, s.value
+        FROM vi
+        JOIN Vitals v ON v.visit_id = vi.visit_id AND v.timestamp >= vi.since
+        CROSS JOIN LATERAL (VALUES
+            ('temp', v.temp), ('hr', v.hr), ('sbp', v.sbp), ('dbp', v.dbp),
+            ('map', v.map), ('resp', v.resp), ('o2sat', v.o2sat)
+        ) s(series, value)
+        WHERE s.value IS NOT NULL AND s.series = ANY(%(series)s)
+        UNION ALL
+        SELECT s.series, l.timestamp, s.value
+        FROM vi
+        JOIN Labs l ON l.visit_id = vi.visit_id AND l.timestamp >= vi.since
+        CROSS JOIN LATERAL (VALUES
+            ('wbc', l.wbc), ('creatinine', l.creatinine), ('bilirubin_total', l.bilirubin_total),
+            ('platelets', l.platelets), ('lactate', l.lactate)
+        ) s(series, value)
+        WHERE s.value IS NOT NULL AND s.series = ANY(%(series)s)
+        UNION ALL
+        SELECT 'score', r.generated_at, r.score
+        FROM vi
+        JOIN RiskScores r ON r.visit_id = vi.visit_id AND r.generated_at >= vi.since
+        WHERE 'score' = ANY(%(series)s)
+    ),
+    span AS (
+        SELECT min(ts) AS first_at,
+               greatest((max(ts) - min(ts)) / %(buckets)s, interval '1 second') AS width
+        FROM points
+    )
+    SELECT p.series, date_bin(span.width, p.ts, span.first_at) AS bucket, avg(p.value)::float8
+    FROM points p, span
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+# The visit's alerts from the last day, newest first (see alerts.py)
+RECENT_ALERTS_SQL = """
+    SELECT rule, message, created_at, delivered_at
+    FROM Alerts
+    WHERE visit_id = %s AND created_at > LOCALTIMESTAMP - interval '1 day'
+    ORDER BY created_at DESC
+    LIMIT 5
+"""
+
+DIAGNOSIS_LATEST_SQL = "SELECT sepsis, diagnosis_datetime FROM Diagnosis WHERE visit_id = %s ORDER BY diagnosis_datetime DESC LIMIT 1"
+
+# Current model input for one visit, in model feature names: the latest value
+# of each vitals/labs feature carried forward from earlier rows when the
+# newest one is NULL (VisitFeatures, see migrations/005_visit_features.sql).
+# No row if the visit has no observations. Parameters: (visit_id,)
+FEATURES_SQL = """
+    SELECT
+      (EXTRACT(EPOCH FROM f.vitals_at - vi.visit_date) / 3600)::int AS "HourOfObservation",
+      p.age AS "PatientAge",
+      icu_length_of_stay(vi.visit_date) AS "ICULengthOfStay",
+      p.gender AS "PatientGender",
+      vi.hosp_adm_time AS "TimeSinceHospitalAdmission",
+      f.hr AS "HeartRate",
+      f.map AS "MeanArterialPressure",
+      f.o2sat AS "OxygenSaturation",
+      f.resp AS "RespiratoryRate",
+      f.sbp AS "SystolicBloodPressure",
+      f.dbp AS "DiastolicBloodPressure",
+      f.temp AS "Temperature",
+      f.wbc AS "WhiteBloodCellCount",
+      f.creatinine AS "CreatinineLevel",
+      f.bilirubin_total AS "TotalBilirubin",
+      f.platelets AS "PlateletCount",
+      f.lactate AS "LactateLevel"
+    FROM VisitFeatures f
+    JOIN Visits vi ON vi.visit_id = f.visit_id
+    JOIN Patients p ON vi.patient_id = p.patient_id
+    WHERE f.visit_id = %s
+"""
+
+# Latest visit of every admitted patient, i.e. the visits shown on the census
+ADMITTED_VISITS_SQL = """
+    SELECT lv.visit_id
+    FROM Patients p
+    CROSS JOIN LATERAL (
+        SELECT v.visit_id
+        FROM Visits v
+        WHERE v.patient_id = p.patient_id
+        ORDER BY v.visit_date DESC
+        LIMIT 1
+    ) lv
+    WHERE p.status = 'admitted'
+"""
+
+# Admitted visits with observations whose latest score is missing or out of
+# date: new vitals or labs arrived after it, or it is older than max_age
+# seconds (ICU length of stay keeps growing, so even an unchanged visit
+# drifts). Parameters: (max_age,)
+STALE_VISITS_SQL = """
+    SELECT lv.visit_id
+    FROM Patients p
+    CROSS JOIN LATERAL (
+        SELECT v.visit_id, v.observations_from
+        FROM Visits v
+        WHERE v.patient_id = p.patient_id
+        ORDER BY v.visit_date DESC
+        LIMIT 1
+    ) lv
+    LEFT JOIN LATERAL (
+        SELECT generated_at FROM RiskScores
+        WHERE visit_id = lv.visit_id AND generated_at >= lv.observations_from
+        ORDER BY generated_at DESC LIMIT 1
+    ) rs ON TRUE
+    JOIN VisitFeatures f ON f.visit_id = lv.visit_id
+    WHERE p.status = 'admitted'
+      AND (rs.generated_at IS NULL
+           OR f.vitals_at > rs.generated_at
+           OR f.labs_at > rs.generated_at
+           OR rs.generated_at < LOCALTIMESTAMP - %s * interval '1 second')
+"""
+
+# Same columns as FEATURES_SQL (plus visit_id) for many visits at once.
+# Visits without any vitals or labs are skipped. Parameters: (visit_id list,)
+BATCH_FEATURES_SQL = """
+    SELECT
+      vi.visit_id,
+      (EXTRACT(EPOCH FROM f.vitals_at - vi.visit_date) / 3600)::int AS "HourOfObservation",
+      p.age AS "PatientAge",
+      icu_length_of_stay(vi.visit_date) AS "ICULengthOfStay",
+      p.gender AS "PatientGender",
+      vi.hosp_adm_time AS "TimeSinceHospitalAdmission",
+      f.hr AS "HeartRate",
+      f.map AS "MeanArterialPressure",
+      f.o2sat AS "OxygenSaturation",
+      f.resp AS "RespiratoryRate",
+      f.sbp AS "SystolicBloodPressure",
+      f.dbp AS "DiastolicBloodPressure",
+      f.temp AS "Temperature",
+      f.wbc AS "WhiteBloodCellCount",
+      f.creatinine AS "CreatinineLevel",
+      f.bilirubin_total AS "TotalBilirubin",
+      f.platelets AS "PlateletCount",
+      f.lactate AS "LactateLevel"
+    FROM VisitFeatures f
+    JOIN Visits vi ON vi.visit_id = f.visit_id
+    JOIN Patients p ON vi.patient_id = p.patient_id
+    WHERE f.visit_id = ANY(%s)
+"""
+
+# ------------------------------
+# Vitals and Labs Entry
+# ------------------------------
+# Vitals, Labs and the resulting RiskScores row in one statement (one round
+# trip). Parameters are named; see scoring.submit_observations.
+SUBMIT_OBSERVATIONS_SQL = """
+    WITH vital AS (
+        INSERT INTO Vitals (visit_id, entered_by, temp, hr, sbp, dbp, map, resp, o2sat, timestamp)
+        VALUES (%(visit_id)s, %(entered_by)s, %(v_temp)s, %(v_hr)s, %(v_sbp)s, %(v_dbp)s,
+                %(v_map)s, %(v_resp)s, %(v_o2sat)s, %(ts)s)
+    ), lab AS (
+        INSERT INTO Labs (visit_id, entered_by, wbc, creatinine, bilirubin_total, bilirubin_direct,
+                          platelets, lactate, timestamp)
+        VALUES (%(visit_id)s, %(entered_by)s, %(l_wbc)s, %(l_creatinine)s, %(l_bilirubin_total)s,
+                %(l_bilirubin_direct)s, %(l_platelets)s, %(l_lactate)s, %(ts)s)
+    )
+    INSERT INTO RiskScores (visit_id, score, generated_at, contributions)
+    VALUES (%(visit_id)s, %(score)s, %(ts)s, %(contributions)s)
+"""
+
+# ------------------------------
+# All Admitted Patients
+# ------------------------------
+# Ward census: every admitted patient with the latest score across their
+# visits, that visit's room and sepsis flag. Reads WardCensus (one
+# trigger-maintained row per visit, see migrations/003_ward_census.sql), so the
+# cost does not grow with RiskScores.
+#
+# The table is served one page at a time: sorting and keyset paging happen in
+# SQL, and only page_size rows come back, together with the ward-wide KPI
+# counts, a 10-bucket score histogram and the number of rows matching the
+# search. Search uses the trigram indexes from migrations/007_census_search.sql.
+
+CENSUS_PAGE_SIZE = 50
+
+# Sort orders as all-ascending key lists (patient_id last, so keys are unique)
+CENSUS_SORTS = {
+    "risk": ("-c.score", "c.patient_id"),
+    "room": ("c.location IS NULL", "coalesce(c.location, '')", "c.patient_id"),
+    "name": ("coalesce(c.lastname, '')", "coalesce(c.firstname, '')", "c.patient_id"),
+}
+
+CENSUS_SQL = """
+    WITH census AS (
+        SELECT p.patient_id, p.firstname, p.lastname, p.age, p.gender,
+               w.score, w.location, w.sepsis, w.risk_band
+        FROM Patients p
+        CROSS JOIN LATERAL (
+            SELECT wc.score, wc.sepsis, wc.risk_band, v.location
+            FROM Visits v
+            JOIN WardCensus wc ON wc.visit_id = v.visit_id
+            WHERE v.patient_id = p.patient_id
+            ORDER BY wc.generated_at DESC
+            LIMIT 1
+        ) w
+        WHERE p.status = 'admitted'
+    ), summary AS (
+        SELECT count(*) FILTER (WHERE risk_band = 'low') AS low_count,
+               count(*) FILTER (WHERE risk_band = 'medium') AS med_count,
+               count(*) FILTER (WHERE risk_band = 'high') AS high_count,
+               ARRAY(
+                   SELECT count(h.patient_id)
+                   FROM generate_series(1, 10) AS b
+                   LEFT JOIN census h ON least(width_bucket(h.score, 0, 1, 10), 10) = b
+                   GROUP BY b
+                   ORDER BY b
+               ) AS histogram
+        FROM census
+    ), name_matches AS (
+        SELECT patient_id FROM Patients
+        WHERE status = 'admitted'
+          AND (patient_id ILIKE %(pattern)s
+               OR (coalesce(firstname, '') || ' ' || coalesce(lastname, '')) ILIKE %(pattern)s)
+    ), room_matches AS (
+        -- Candidates from the trigram index on any visit; matched keeps those
+        -- whose census row (the visit with the newest score) shows that room
+        SELECT patient_id FROM Visits WHERE location ILIKE %(pattern)s
+    ), matched AS (
+        SELECT * FROM census c
+        WHERE %(pattern)s IS NULL
+           OR c.patient_id IN (SELECT patient_id FROM name_matches)
+           OR (c.location ILIKE %(pattern)s AND c.patient_id IN (SELECT patient_id FROM room_matches))
+    )
+    SELECT c.patient_id, c.firstname, c.lastname, c.age, c.gender, c.score, c.location, c.sepsis,
+           s.low_count, s.med_count, s.high_count, s.histogram,
+           (SELECT count(*) FROM matched) AS matched_count,
+           {keys}
+    FROM summary s
+    LEFT JOIN matched c ON {keyset}
+    ORDER BY {order}
+    LIMIT %(limit)s
+"""
+
+CensusPage = namedtuple("CensusPage", "rows counts histogram matched next_after")
+
+
+def search_pattern(text):
+    """
+    ILIKE pattern matching text anywhere, with LIKE wildcards escaped; None for no search.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def census_query(sort="risk", search=None, after=None, page_size=CENSUS_PAGE_SIZE):
+    """
+    (sql, params) for one census page. after is the next_after of the previous
+    page (None for the first page).
+    """
+    keys = CENSUS_SORTS[sort]
+    params = {"pattern": search_pattern(search), "limit": page_size + 1}
+    if after is None:
+        keyset = "TRUE"
+    else:
+        params.update({f"after_{i}": value for i, value in enumerate(after)})
+        keyset = "({}) > ({})".format(", ".join(keys), ", ".join(f"%(after_{i})s" for i in range(len(keys))))
+    sql = CENSUS_SQL.format(
+        keys=", ".join(f"{key} AS sort_key_{i}" for i, key in enumerate(keys)),
+        keyset=keyset,
+        order=", ".join(keys),
+    )
+    return sql, params
+
+
+def fetch_census(cur, sort="risk", search=None, after=None, page_size=CENSUS_PAGE_SIZE):
+    """
+    Run the census query for one page on cur.
+
+    Returns a CensusPage: rows are
+    (patient_id, firstname, lastname, age, gender, score, location, sepsis) in
+    the requested sort order, counts is {"low": .., "medium": .., "high": ..}
+    over the whole ward, histogram the patient count per 0.1 score bucket,
+    matched the number of patients matching search, and next_after the cursor
+    for the following page (None on the last page).
+    """
+    sql, params = census_query(sort, search, after, page_size)
+    cur.execute(sql, params)
+    result = cur.fetchall()
+    first = result[0]
+    counts = {"low": first[8], "medium": first[9], "high": first[10]}
+    histogram, matched = list(first[11]), first[12]
+    # One all-NULL row when the page is empty (the LEFT JOIN keeps the summary)
+    result = [row for row in result if row[0] is not None]
+    rows = [row[:8] for row in result[:page_size]]
+    next_after = tuple(result[page_size - 1][13:]) if len(result) > page_size else None
+    return CensusPage(rows, counts, histogram, matched, next_after)
@@ -0,0 +1,113 @@
+# scheduler.py - background process that keeps RiskScores fresh
+#
+# Usage (run alongside, not inside, the Streamlit app):
+#   python scheduler.py                 # rescore every 5 minutes until stopped
+#   python scheduler.py --once          # single pass, e.g. from cron
+#
+# Each pass rescores only admitted visits whose latest score is missing, older
+# than their newest vitals/labs, or older than --max-age. Passes take a
+# transaction-scoped Postgres advisory lock, so several replicas can run this
+# without scoring the same visits twice. Every pass also pre-creates upcoming
+# Vitals/Labs/RiskScores partitions (see partitions.py) and delivers pending
+# alerts (see alerts.py), including ones raised by ingest.py and retries.
+
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from alerts import dispatch
+from db import db_session
+from model_registry import get_model
+from partitions import create_future_partitions
+from queries import STALE_VISITS_SQL
+from scoring import calculate_risk_batch
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.environ.get("SEPSIS_RESCORE_INTERVAL", "300"))
+MAX_AGE = float(os.environ.get("SEPSIS_RESCORE_MAX_AGE", "3600"))
+BATCH_SIZE = int(os.environ.get("SEPSIS_RESCORE_BATCH_SIZE", "2000"))
+
+# Arbitrary application-wide key for pg_try_advisory_xact_lock
+RESCORE_LOCK_KEY = 7_370_001
+
+
+def rescore_stale(max_age=MAX_AGE, batch_size=BATCH_SIZE):
+    """
+    Run one rescoring pass. Returns the number of visits scored, or None if
+    another process holds the rescoring lock.
+    """
+    with db_session() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (RESCORE_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                return None
+            cur.execute(STALE_VISITS_SQL, (max_age,))
+            visit_ids = [row[0] for row in cur.fetchall()]
+
+        generated_at = datetime.now()
+        scored = 0
+        for i in range(0, len(visit_ids), batch_size):
+            scores = calculate_risk_batch(visit_ids[i:i + batch_size], conn, generated_at=generated_at)
+            scored += len(scores)
+        # Commit (and release the lock) when the session exits
+    return scored
+
+
+def run(interval=INTERVAL, max_age=MAX_AGE, batch_size=BATCH_SIZE, stop=None):
+    stop = stop or threading.Event()
+    get_model()
+    while not stop.is_set():
+        try:
+            created = create_future_partitions()
+            if any(created.values()):
+                logger.info("Created partitions: %s", created)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        start = time.perf_counter()
+        try:
+            scored = rescore_stale(max_age, batch_size)
+        except Exception:
+            logger.exception("Rescoring pass failed")
+        else:
+            if scored is None:
+                logger.info("Another scheduler holds the rescoring lock; skipping this pass")
+            else:
+                logger.info("Rescored %d visits in %.3fs", scored, time.perf_counter() - start)
+        try:
+            delivered, failed = dispatch()
+            if delivered or failed:
+                logger.info("Delivered %d alerts, %d failed", delivered, failed)
+        except Exception:
+            logger.exception("Alert delivery failed")
+        stop.wait(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Periodically rescore admitted visits")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds between passes")
+    parser.add_argument("--max-age", type=float, default=MAX_AGE,
+                        help="rescore visits whose latest score is older than this many seconds")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.once:
+        logger.info("Created partitions: %s", create_future_partitions())
+        logger.info("Rescored %s visits", rescore_stale(args.max_age, args.batch_size))
+        logger.info("Delivered %d alerts, %d failed", *dispatch())
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run(args.interval, args.max_age, args.batch_size, stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# scoring.py - sepsis risk scoring for single visits and whole wards
+#
+# Usage (batch rescoring from the command line):
+#   python scoring.py                  # every admitted patient's latest visit
+#   python scoring.py --visit-ids 3 7  # specific visits
+#   python scoring.py --dry-run        # score without writing RiskScores
+
+import argparse
+import logging
+import time
+from datetime import datetime, time as dtime
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from alerts import evaluate as evaluate_alerts
+from db import db_session
+from fast_inference import get_scorer
+from model_registry import get_model
+from queries import ADMITTED_VISITS_SQL, BATCH_FEATURES_SQL, FEATURES, SUBMIT_OBSERVATIONS_SQL
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# Vitals/Labs columns and the features they feed (bilirubin_direct is stored but not used by the model)
+VITALS_FEATURES = {
+    "hr": "HeartRate", "map": "MeanArterialPressure", "o2sat": "OxygenSaturation",
+    "resp": "RespiratoryRate", "sbp": "SystolicBloodPressure", "dbp": "DiastolicBloodPressure",
+    "temp": "Temperature",
+}
+LABS_FEATURES = {
+    "wbc": "WhiteBloodCellCount", "creatinine": "CreatinineLevel",
+    "bilirubin_total": "TotalBilirubin", "platelets": "PlateletCount", "lactate": "LactateLevel",
+}
+VITALS_COLUMNS = ["temp", "hr", "sbp", "dbp", "map", "resp", "o2sat"]
+LABS_COLUMNS = ["wbc", "creatinine", "bilirubin_total", "bilirubin_direct", "platelets", "lactate"]
+
+
+def build_features(observed_at, age, gender, visit_date, hosp_adm_time, vitals, labs):
+    """
+    Feature mapping for a new observation, computed the way FEATURES_SQL derives
+    it from the stored rows (hours since the visit date, ICU days since midnight
+    of the visit date, see icu_length_of_stay()).
+    """
+    features = {
+        "HourOfObservation": round((observed_at - visit_date).total_seconds() / 3600),
+        "PatientAge": age,
+        "ICULengthOfStay": (observed_at - datetime.combine(visit_date.date(), dtime.min)).total_seconds() / 86400,
+        "PatientGender": gender,
+        "TimeSinceHospitalAdmission": hosp_adm_time,
+    }
+    for column, name in VITALS_FEATURES.items():
+        features[name] = vitals.get(column)
+    for column, name in LABS_FEATURES.items():
+        features[name] = labs.get(column)
+    return features
+
+
+def predict_with_contributions(X):
+    """
+    (scores, contributions) for rows of X (a list of feature mappings or a DataFrame),
+    from a single booster call: contributions[i] holds row i's TreeSHAP
+    log-odds contribution per FEATURES entry followed by the bias, as stored
+    in RiskScores.contributions. Scores go through fast_inference.CompiledScorer;
+    for a pipeline it can't compile, they come from the pipeline's
+    predict_proba and contributions is None (stored as NULL).
+    """
+    try:
+        scorer = get_scorer(FEATURES)
+    except ValueError as e:
+        # A pipeline CompiledScorer can't replay: score it as is, without explanations
+        logger.warning("Scoring without contributions: %s", e)
+        X = X if hasattr(X, "to_numpy") else pd.DataFrame(list(X), columns=FEATURES)
+        with span("model.predict_proba", rows=len(X)):
+            return get_model().predict_proba(X[FEATURES])[:, 1], None
+    with span("model.predict_proba", rows=len(X), contributions=True):
+        return scorer.predict_with_contributions(X)
+
+
+def submit_observations(conn, visit_id, entered_by, vitals, labs, patient, visit, observed_at=None):
+    """
+    Score a vitals + labs submission from the submitted values and write the
+    Vitals, Labs and RiskScores rows in one statement on conn.
+
+    patient is (age, gender) and visit is (visit_date, hosp_adm_time), typically
+    from the lookup cache, so the only database work is a single round trip
+    (plus the alert rules on the new score, see alerts.evaluate, and the
+    caller's commit). Returns the score.
+    """
+    observed_at = observed_at or datetime.now()
+    age, gender = patient
+    visit_date, hosp_adm_time = visit
+    features = build_features(observed_at, age, gender, visit_date, hosp_adm_time, vitals, labs)
+    scores, contributions = predict_with_contributions([features])
+    score = float(scores[0])
+
+    params = {
+        "visit_id": visit_id, "entered_by": entered_by, "ts": observed_at, "score": score,
+        "contributions": None if contributions is None else contributions[0].tolist(),
+    }
+    params.update({f"v_{c}": vitals.get(c) for c in VITALS_COLUMNS})
+    params.update({f"l_{c}": labs.get(c) for c in LABS_COLUMNS})
+    with conn.cursor() as cur:
+        cur.execute(SUBMIT_OBSERVATIONS_SQL, params)
+    evaluate_alerts(conn, [(visit_id, score, observed_at)])
+    return score
+
+
+def admitted_visit_ids(cur):
+    cur.execute(ADMITTED_VISITS_SQL)
+    return [row[0] for row in cur.fetchall()]
+
+
+def calculate_risk_batch(visit_ids, conn, generated_at=None, write=True):
+    """
+    Score many visits with one feature query and one booster call, which also
+    yields the per-feature contributions stored with each score.
+
+    Features come from VisitFeatures, i.e. the latest value of each vitals/labs
+    feature carried forward (visits with no observations at all are skipped). When write is True the scores are
+    bulk-inserted into RiskScores with generated_at (default: now), the
+    Visits.iculos snapshot is refreshed and the alert rules run on the new
+    scores, all on conn; committing is left to the caller. Returns {visit_id: score}.
+    """
+    visit_ids = list(visit_ids)
+    if not visit_ids:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(BATCH_FEATURES_SQL, (visit_ids,))
+        columns = [desc[0] for desc in cur.description]
+        rows = cur.fetchall()
+    if not rows:
+        return {}
+
+    df = pd.DataFrame(rows, columns=columns)
+    X = df[FEATURES]
+    probas, contributions = predict_with_contributions(X)
+    scored_ids = df["visit_id"].tolist()
+    scores = dict(zip(scored_ids, probas.tolist()))
+
+    if write:
+        generated_at = generated_at or datetime.now()
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO RiskScores (visit_id, score, generated_at, contributions) VALUES %s",
+                [
+                    (visit_id, score, generated_at, row)
+                    for visit_id, score, row in zip(
+                        scored_ids, probas.tolist(),
+                        [None] * len(scored_ids) if contributions is None else contributions.tolist(),
+                    )
+                ],
+                page_size=1000,
+            )
+            # The batch path is the only writer of the persisted ICU length of stay snapshot
+            cur.execute(
+                "UPDATE Visits SET iculos = icu_length_of_stay(visit_date) WHERE visit_id = ANY(%s)",
+                (list(scores),)
+            )
+        evaluate_alerts(conn, [(visit_id, score, generated_at) for visit_id, score in scores.items()])
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore visits in one batch")
+    parser.add_argument("--visit-ids", type=int, nargs="+",
+                        help="visits to score (default: latest visit of every admitted patient)")
+    parser.add_argument("--dry-run", action="store_true", help="don't write RiskScores")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    get_model()  # keep the one-off model load out of the scoring timings
+    start = time.perf_counter()
+    with db_session() as conn:
+        if args.visit_ids:
+            visit_ids = args.visit_ids
+        else:
+            with conn.cursor() as cur:
+                visit_ids = admitted_visit_ids(cur)
+        scores = calculate_risk_batch(visit_ids, conn, write=not args.dry_run)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Scored %d of %d visits in %.3fs (%.0f visits/s)%s",
+        len(scores), len(visit_ids), elapsed, len(scores) / elapsed if elapsed else 0,
+        " [dry run]" if args.dry_run else "",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -72,3 +72,16 @@ CREATE TABLE Diagnosis (
 INSERT INTO Users (username, password_hash, role) VALUES
   ('nurse1',  'ea560944f08cca0c2ab2cb4ce3e59a6558c852759ea4054ec886809ad6a3b3a1', 'nurse'),
   ('physician1','ea560944f08cca0c2ab2cb4ce3e59a6558c852759ea4054ec886809ad6a3b3a1', 'physician');
+
+-- 5) Indexes and later schema changes (also runnable on their own against an existing database)
+\ir migrations/001_indexes.sql
+\ir migrations/002_icu_length_of_stay.sql
+\ir migrations/003_ward_census.sql
+\ir migrations/004_partitioning.sql
+\ir migrations/005_visit_features.sql
+\ir migrations/006_notifications.sql
+\ir migrations/007_census_search.sql
+\ir migrations/008_score_contributions.sql
+\ir migrations/009_alerts.sql
+\ir migrations/010_observation_window.sql
+\ir migrations/011_notify_visit_changes.sql
@@ -0,0 +1,405 @@
+# telemetry.py - per-rerun spans, Prometheus metrics and the slow-query log
+#
+# Every Streamlit rerun (or fragment rerun) is one trace, tagged with the page
+# it rendered (login, census, lookup, submit). Database statements on pooled
+# connections (db.py installs TracingCursor), scoring calls, predict_proba and
+# model loads record spans into the active trace. When the trace ends it is
+# written as one JSON log line, and its spans feed in-process Prometheus
+# histograms exposed over HTTP and/or as a textfile-collector file.
+#
+# Statements slower than SEPSIS_SLOW_QUERY_MS go to the slow-query log with
+# their EXPLAIN plan.
+#
+# Configuration (environment):
+#   SEPSIS_TELEMETRY=0            turn span recording off
+#   SEPSIS_TELEMETRY_LOG=path     JSON trace log (default: stderr)
+#   SEPSIS_SLOW_QUERY_MS=200      slow-query threshold in milliseconds
+#   SEPSIS_SLOW_QUERY_LOG=path    slow-query log (default: stderr)
+#   SEPSIS_METRICS_PORT=9108      serve /metrics on this port
+#   SEPSIS_METRICS_FILE=path      rewrite Prometheus text here after each trace
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+import psycopg2.extensions
+
+ENABLED = os.environ.get("SEPSIS_TELEMETRY", "1") != "0"
+TRACE_LOG = os.environ.get("SEPSIS_TELEMETRY_LOG")
+SLOW_QUERY_MS = float(os.environ.get("SEPSIS_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.environ.get("SEPSIS_SLOW_QUERY_LOG")
+METRICS_PORT = int(os.environ.get("SEPSIS_METRICS_PORT", "0"))
+METRICS_FILE = os.environ.get("SEPSIS_METRICS_FILE")
+# Minimum seconds between rewrites of METRICS_FILE
+METRICS_FILE_INTERVAL = 10
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar("sepsis_trace", default=None)
+_sinks = []
+
+
+def _json_logger(name, path):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.FileHandler(path) if path else logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+trace_log = _json_logger("sepsis.telemetry", TRACE_LOG)
+slow_query_log = _json_logger("sepsis.slow_query", SLOW_QUERY_LOG)
+
+
+# ------------------------------
+# Metrics
+# ------------------------------
+class Metrics:
+    """
+    Minimal Prometheus registry: histograms and counters keyed by label tuples.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def observe(self, name, labels, value, help=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def inc(self, name, labels, amount=1, help=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for (metric, labels), (counts, total, count) in sorted(self._histograms.items()):
+                        if metric != name:
+                            continue
+                        for bound, n in zip(self.buckets, counts):
+                            lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {n}")
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+                        lines.append(f"{name}_sum{fmt(labels)} {total}")
+                        lines.append(f"{name}_count{fmt(labels)} {count}")
+                else:
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_metrics_file_written = 0.0
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serve /metrics on port from a daemon thread (once per process).
+    """
+    global _server
+    if not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="sepsis-metrics", daemon=True).start()
+
+
+def write_metrics_file(path=METRICS_FILE, force=False):
+    global _metrics_file_written
+    if not path or (not force and time.monotonic() - _metrics_file_written < METRICS_FILE_INTERVAL):
+        return
+    _metrics_file_written = time.monotonic()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+
+
+# ------------------------------
+# Traces and spans
+# ------------------------------
+class Trace:
+    def __init__(self, page, fragment=False):
+        self.page = page
+        self.fragment = fragment
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.last_activity = self.started
+        self.spans = []
+        self.finished = False
+
+
+def current_trace():
+    trace = _current.get()
+    return trace if trace is not None and not trace.finished else None
+
+
+def set_page(page):
+    """
+    Re-tag the active trace, e.g. when a lookup rerun turns out to be a submission.
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.page = page
+
+
+def begin_trace(page, holder=None):
+    """
+    Start the trace for a full script rerun. holder (st.session_state) keeps it
+    between reruns: a trace the previous rerun never ended, because it stopped
+    early through st.rerun() or st.stop(), is finished first with its last
+    recorded activity as the end time.
+    """
+    start_metrics_server()
+    if holder is not None:
+        previous = holder.get("_telemetry_trace")
+        if previous is not None and not previous.finished:
+            end_trace(previous, status="interrupted", ended=previous.last_activity)
+    trace = Trace(page)
+    _current.set(trace)
+    if holder is not None:
+        holder["_telemetry_trace"] = trace
+    return trace
+
+
+def end_trace(trace=None, status="ok", ended=None):
+    trace = trace or current_trace()
+    if trace is None or trace.finished:
+        return
+    trace.finished = True
+    duration = (ended or time.perf_counter()) - trace.started
+    if not ENABLED:
+        return
+    metrics.observe("sepsis_rerun_duration_seconds", {"page": trace.page, "status": status}, duration,
+                    "Wall time of one Streamlit (fragment) rerun")
+    write_metrics_file()
+    entry = {
+        "ts": trace.started_at,
+        "page": trace.page,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "spans": trace.spans,
+    }
+    for sink in list(_sinks):
+        sink(entry)
+    if trace.fragment and not trace.spans and status == "ok":
+        # Live fragments tick every few seconds; only log the ticks that did work
+        return
+    trace_log.info(json.dumps(entry, default=str))
+
+
+def add_sink(fn):
+    """
+    Also hand every finished trace (the logged dict) to fn, e.g. a load-test collector.
+    """
+    _sinks.append(fn)
+
+
+def remove_sink(fn):
+    _sinks.remove(fn)
+
+
+@contextmanager
+def fragment_trace(page):
+    """
+    Trace for a fragment rerun; inside a full rerun the spans join that trace
+    instead. Also usable as a decorator on the fragment function.
+    """
+    if current_trace() is not None:
+        yield
+        return
+    trace = Trace(page, fragment=True)
+    token = _current.set(trace)
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        end_trace(trace, status=status)
+        _current.reset(token)
+
+
+def record(name, seconds, **attrs):
+    """
+    Add a finished span to the active trace and the span histogram.
+    """
+    if not ENABLED:
+        return
+    trace = current_trace()
+    page = trace.page if trace is not None else "background"
+    metrics.observe("sepsis_span_duration_seconds", {"span": name, "page": page}, seconds,
+                    "Duration of database, scoring and model spans")
+    if trace is not None:
+        trace.last_activity = time.perf_counter()
+        trace.spans.append({
+            "name": name,
+            "offset_ms": round((trace.last_activity - seconds - trace.started) * 1000, 3),
+            "duration_ms": round(seconds * 1000, 3),
+            **attrs,
+        })
+
+
+@contextmanager
+def span(name, **attrs):
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - start, **attrs)
+
+
+def traced(name):
+    """
+    Decorator recording a span around every call.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------
+# Database statements
+# ------------------------------
+_WHITESPACE = re.compile(r"\s+")
+EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def statement_text(query):
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    return _WHITESPACE.sub(" ", str(query)).strip()
+
+
+def explain(conn, query):
+    """
+    EXPLAIN plan (JSON) of an already-interpolated statement, or None. Runs in a
+    savepoint so a statement that cannot be explained leaves the caller's
+    transaction intact; nothing is executed.
+    """
+    text = statement_text(query)
+    if conn.autocommit or not text.lower().startswith(EXPLAINABLE):
+        return None
+    cur = psycopg2.extensions.cursor(conn)
+    try:
+        cur.execute("SAVEPOINT telemetry_explain")
+        try:
+            cur.execute("EXPLAIN (FORMAT JSON) " + text)
+            plan = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT telemetry_explain")
+            return {"error": str(e).strip()}
+        cur.execute("RELEASE SAVEPOINT telemetry_explain")
+        return json.loads(plan) if isinstance(plan, str) else plan
+    except psycopg2.Error:
+        return None
+    finally:
+        cur.close()
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor recording a "db.query" span per statement and logging slow ones
+    with their plan. Installed on pooled connections by db.py.
+    """
+
+    def _traced(self, method, query, *args):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return method(query, *args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            text = statement_text(self.query or query)
+            record("db.query", seconds, statement=text[:200], rows=self.rowcount,
+                   **({"error": True} if failed else {}))
+            if ENABLED and seconds * 1000 >= SLOW_QUERY_MS:
+                metrics.inc("sepsis_slow_queries_total", {}, help="Statements over the slow-query threshold")
+                trace = current_trace()
+                slow_query_log.info(json.dumps({
+                    "ts": time.time(),
+                    "page": trace.page if trace is not None else "background",
+                    "duration_ms": round(seconds * 1000, 3),
+                    "statement": text,
+                    "plan": None if failed else explain(self.connection, self.query or query),
+                }, default=str))
+
+    def execute(self, query, vars=None):
+        return self._traced(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._traced(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._traced(super().copy_expert, sql, file, size)
@@ -0,0 +1,377 @@
+# train.py - reproducible training of the sepsis model (replaces OnlySepModel_ToMakePickleFile.ipynb)
+#
+# Usage:
+#   python train.py                                        # default training data, 24 trials on every core
+#   python train.py --data new_rows.csv --trials 48 --workers 8
+#   python train.py --no-activate --report report.json     # export without switching the app to it
+#
+# Steps, each logged with its duration:
+#   1. prepare   stratified train/validation/test split and the fitted
+#                preprocessing (the notebook's ColumnTransformer), cached under
+#                --cache-dir/<key>/ with the transformed matrices. The key hashes
+#                the data file and every setting that affects them, so a rerun on
+#                the same data skips this step and new data never hits a stale cache.
+#   2. search    random hyperparameter search: each trial fits an XGBClassifier
+#                (tree_method="hist") on the training split with early stopping on
+#                the validation split. Trials run in a pool of --workers processes
+#                with the cores split between them (n_jobs), reading the cached
+#                matrices memory-mapped. The notebook's parameters are always
+#                trial 0, as the reference point for the others.
+#   3. fit       the best trial's parameters and number of rounds, refitted on
+#                training + validation rows, as a Pipeline with the cached
+#                preprocessing (the layout fast_inference and export_model expect)
+#   4. evaluate  AUROC, Brier score, calibration and alert rates on the held-out
+#                test rows (backtest.BacktestStats), and scoring latency of the
+#                pipeline and of the exported artifact
+#   5. export    pickle under --models-dir, then export_model.export into a
+#                versioned artifact (made the default unless --no-activate), with
+#                the report saved next to it as report.json
+# Everything is seeded by --seed; the same data and arguments give the same model.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from backtest import BacktestStats
+from export_model import DATA_PATH, export
+from feature_store import fingerprint, read_frame
+from model_registry import ARTIFACT_DIR
+from queries import FEATURES
+
+logger = logging.getLogger(__name__)
+
+TARGET = "SepsisIndicator"
+GROUP = "UniqueID"
+CATEGORICAL_FEATURES = ["PatientGender"]
+NUMERIC_FEATURES = [f for f in FEATURES if f not in CATEGORICAL_FEATURES]
+CACHE_DIR = "ML_model_development/.cache"
+MODELS_DIR = "ML_model_development/trained"
+# Bump when the cached files change meaning, so old cache entries are ignored
+CACHE_FORMAT = 1
+MATRICES = ("X_train", "y_train", "X_val", "y_val", "X_test", "y_test")
+
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 5, 6, 8, 10],
+    "learning_rate": [0.02, 0.05, 0.1, 0.2, 0.3],
+    "min_child_weight": [1, 2, 5, 10],
+    "subsample": [0.6, 0.8, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "reg_lambda": [0.5, 1.0, 2.0, 5.0],
+}
+# XGBoost's defaults, i.e. what the notebook trained
+BASELINE_PARAMS = {
+    "max_depth": 6, "learning_rate": 0.3, "min_child_weight": 1,
+    "subsample": 1.0, "colsample_bytree": 1.0, "reg_lambda": 1.0,
+}
+LATENCY_ROWS = 200
+
+
+def build_preprocessor():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    return ColumnTransformer([
+        ("num", Pipeline([
+            ("imputer", SimpleImputer(strategy="median")),
+            ("scaler", StandardScaler()),
+        ]), NUMERIC_FEATURES),
+        ("cat", Pipeline([
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("encoder", OneHotEncoder(handle_unknown="ignore", sparse_output=False)),
+        ]), CATEGORICAL_FEATURES),
+    ])
+
+
+def split_rows(df, test_size, val_size, seed):
+    """
+    Row indices (train, val, test), stratified by label. Rows of one UniqueID
+    stay in one split (stratified by whether the patient ever became septic),
+    so multi-row histories don't leak between training and evaluation.
+    """
+    from sklearn.model_selection import train_test_split
+
+    if GROUP in df and df[GROUP].duplicated().any():
+        labels = df.groupby(GROUP)[TARGET].max()
+        fit_ids, test_ids = train_test_split(labels.index.to_numpy(), test_size=test_size,
+                                             stratify=labels.to_numpy(), random_state=seed)
+        train_ids, val_ids = train_test_split(fit_ids, test_size=val_size,
+                                              stratify=labels.loc[fit_ids].to_numpy(), random_state=seed)
+        groups = df[GROUP].to_numpy()
+        return tuple(np.flatnonzero(np.isin(groups, ids)) for ids in (train_ids, val_ids, test_ids))
+
+    rows, y = np.arange(len(df)), df[TARGET].to_numpy()
+    fit_rows, test_rows = train_test_split(rows, test_size=test_size, stratify=y, random_state=seed)
+    train_rows, val_rows = train_test_split(fit_rows, test_size=val_size, stratify=y[fit_rows], random_state=seed)
+    return np.sort(train_rows), np.sort(val_rows), np.sort(test_rows)
+
+
+def prepare(data_path, cache_dir, test_size, val_size, seed):
+    """
+    Cache directory holding the split, the fitted preprocessing and the
+    transformed matrices for this data and configuration, and whether it
+    already existed.
+    """
+    import sklearn
+
+    key_source = {
+        "format": CACHE_FORMAT, "data_sha256": fingerprint(data_path), "features": FEATURES,
+        "categorical": CATEGORICAL_FEATURES, "target": TARGET, "test_size": test_size,
+        "val_size": val_size, "seed": seed, "scikit-learn": sklearn.__version__,
+    }
+    key = hashlib.sha256(json.dumps(key_source, sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, "key.json")):
+        return path, True
+
+    df = read_frame(data_path, [GROUP, *FEATURES, TARGET])
+    train_rows, val_rows, test_rows = split_rows(df, test_size, val_size, seed)
+    fit_rows = np.sort(np.concatenate([train_rows, val_rows]))
+    # Fitted on every row the final model trains on, as the pipeline will be
+    preprocess = build_preprocessor().fit(df.iloc[fit_rows][FEATURES])
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    y = df[TARGET].to_numpy(np.int8)
+    for name, rows in (("train", train_rows), ("val", val_rows), ("test", test_rows)):
+        np.save(os.path.join(tmp_path, f"X_{name}.npy"),
+                preprocess.transform(df.iloc[rows][FEATURES]).astype(np.float32))
+        np.save(os.path.join(tmp_path, f"y_{name}.npy"), y[rows])
+    np.savez(os.path.join(tmp_path, "split.npz"), train=train_rows, val=val_rows, test=test_rows)
+    joblib.dump(preprocess, os.path.join(tmp_path, "preprocess.joblib"))
+    # Written last: its presence marks a complete entry
+    with open(os.path.join(tmp_path, "key.json"), "w") as f:
+        json.dump({**key_source, "data_path": data_path, "rows": len(df)}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path, False
+
+
+def sample_trials(n, seed):
+    """
+    n parameter sets: the notebook's first, then distinct random draws from SEARCH_SPACE.
+    """
+    rng = random.Random(seed)
+    trials, seen = [dict(BASELINE_PARAMS)], {tuple(sorted(BASELINE_PARAMS.items()))}
+    space_size = 1
+    for values in SEARCH_SPACE.values():
+        space_size *= len(values)
+    while len(trials) < min(n, space_size + 1):
+        params = {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+        if tuple(sorted(params.items())) not in seen:
+            seen.add(tuple(sorted(params.items())))
+            trials.append(params)
+    return trials[:n]
+
+
+# ------------------------------
+# Search workers
+# ------------------------------
+_data = {}
+
+
+def init_worker(cache_path, n_jobs, seed):
+    """
+    Memory-map the cached matrices once per worker (the OS shares the pages).
+    """
+    _data.update({name: np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode="r") for name in MATRICES})
+    _data["n_jobs"], _data["seed"] = n_jobs, seed
+
+
+def run_trial(trial, params, max_rounds, early_stopping):
+    from sklearn.metrics import roc_auc_score
+    from xgboost import XGBClassifier
+
+    start = time.perf_counter()
+    model = XGBClassifier(
+        tree_method="hist", n_estimators=max_rounds, early_stopping_rounds=early_stopping,
+        eval_metric="logloss", n_jobs=_data["n_jobs"], random_state=_data["seed"], **params,
+    )
+    model.fit(_data["X_train"], _data["y_train"], eval_set=[(_data["X_val"], _data["y_val"])], verbose=False)
+    # predict_proba stops at the best iteration after early stopping
+    val_scores = model.predict_proba(_data["X_val"])[:, 1]
+    return {
+        "trial": trial,
+        "params": params,
+        "rounds": model.best_iteration + 1,
+        "val_logloss": float(model.best_score),
+        "val_auroc": float(roc_auc_score(_data["y_val"], val_scores)),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def search(cache_path, trials, workers, max_rounds, early_stopping, seed):
+    """
+    Run every trial and return the results sorted best first (lowest validation log loss).
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(trials)))
+    n_jobs = max(1, cores // workers)
+    logger.info("Searching %d parameter sets in %d processes x %d threads", len(trials), workers, n_jobs)
+    if workers == 1:
+        init_worker(cache_path, n_jobs, seed)
+        results = [run_trial(i, params, max_rounds, early_stopping) for i, params in enumerate(trials)]
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_path, n_jobs, seed)) as pool:
+            futures = [pool.submit(run_trial, i, params, max_rounds, early_stopping)
+                       for i, params in enumerate(trials)]
+            results = [future.result() for future in futures]
+    for result in results:
+        logger.info("trial %(trial)d: logloss %(val_logloss).4f, AUROC %(val_auroc).4f, "
+                    "%(rounds)d rounds in %(seconds).1fs", result)
+    return sorted(results, key=lambda r: (r["val_logloss"], r["trial"]))
+
+
+def fit_final(cache_path, best, seed):
+    from sklearn.pipeline import Pipeline
+    from xgboost import XGBClassifier
+
+    X = np.concatenate([np.load(os.path.join(cache_path, "X_train.npy")), np.load(os.path.join(cache_path, "X_val.npy"))])
+    y = np.concatenate([np.load(os.path.join(cache_path, "y_train.npy")), np.load(os.path.join(cache_path, "y_val.npy"))])
+    classifier = XGBClassifier(
+        tree_method="hist", n_estimators=best["rounds"], eval_metric="logloss",
+        n_jobs=os.cpu_count() or 1, random_state=seed, **best["params"],
+    ).fit(X, y)
+    return Pipeline([
+        ("preprocess", joblib.load(os.path.join(cache_path, "preprocess.joblib"))),
+        ("classifier", classifier),
+    ])
+
+
+def latency(fn, rows):
+    """p50/p95 milliseconds of fn(row) over rows."""
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(timings, n=20, method="inclusive")
+    return {"p50_ms": round(statistics.median(timings), 3), "p95_ms": round(cuts[18], 3)}
+
+
+def evaluate(pipeline, data_path, cache_path):
+    """
+    Held-out test metrics (see backtest.BacktestStats.report) and pipeline scoring latency.
+    """
+    test_rows = np.load(os.path.join(cache_path, "split.npz"))["test"]
+    df = read_frame(data_path, [GROUP, *FEATURES, TARGET]).iloc[test_rows]
+    X = df[FEATURES]
+
+    start = time.perf_counter()
+    scores = pipeline.predict_proba(X)[:, 1]
+    batch_seconds = time.perf_counter() - start
+
+    frame = X.copy()
+    frame["label"] = df[TARGET].astype(np.int8)
+    frame["group"] = df[GROUP] if GROUP in df else np.arange(len(df))
+    frame["hour"] = df["HourOfObservation"].astype(float)
+    frame["onset"] = np.where(frame["label"] == 1, frame["hour"], np.nan)
+    report = BacktestStats.from_chunk(frame, scores).report()
+
+    single_rows = [X.iloc[[i]] for i in range(min(LATENCY_ROWS, len(X)))]
+    report["latency"] = {
+        "pipeline_single_row": latency(lambda row: pipeline.predict_proba(row), single_rows),
+        "pipeline_batch_rows_per_s": round(len(X) / batch_seconds) if batch_seconds else None,
+    }
+    return report, [row.iloc[0].to_dict() for row in single_rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train, evaluate and export the sepsis model")
+    parser.add_argument("--data", default=DATA_PATH,
+                        help="CSV or feature store dataset with model features, SepsisIndicator (and UniqueID)")
+    parser.add_argument("--trials", type=int, default=24, help="parameter sets to try, the notebook's included")
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: one per core)")
+    parser.add_argument("--max-rounds", type=int, default=2000)
+    parser.add_argument("--early-stopping", type=int, default=50,
+                        help="stop a trial after this many rounds without validation improvement")
+    parser.add_argument("--test-size", type=float, default=0.25)
+    parser.add_argument("--val-size", type=float, default=0.2, help="share of the non-test rows used for early stopping")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--no-activate", action="store_true", help="don't make the new artifact the default model")
+    parser.add_argument("--report", help="also write the JSON report here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    timings = {}
+    start = time.perf_counter()
+    cache_path, cached = prepare(args.data, args.cache_dir, args.test_size, args.val_size, args.seed)
+    timings["prepare_s"] = round(time.perf_counter() - start, 3)
+    logger.info("%s %s", "Reusing cached split and preprocessing in" if cached else "Prepared", cache_path)
+
+    start = time.perf_counter()
+    results = search(cache_path, sample_trials(args.trials, args.seed), args.workers,
+                     args.max_rounds, args.early_stopping, args.seed)
+    timings["search_s"] = round(time.perf_counter() - start, 3)
+    best = results[0]
+    logger.info("Best: trial %d %s, %d rounds", best["trial"], best["params"], best["rounds"])
+
+    start = time.perf_counter()
+    pipeline = fit_final(cache_path, best, args.seed)
+    timings["fit_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    test_report, latency_rows = evaluate(pipeline, args.data, cache_path)
+    timings["evaluate_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    os.makedirs(args.models_dir, exist_ok=True)
+    pickle_path = os.path.join(args.models_dir, f"sepsis_model-{os.path.basename(cache_path)}-t{best['trial']}.pkl")
+    joblib.dump(pipeline, pickle_path)
+    with open(os.path.join(cache_path, "key.json")) as f:
+        data_key = json.load(f)
+    training = {
+        "data": data_key,
+        "cache": {"path": cache_path, "hit": cached},
+        "best": best,
+        "trials": results,
+        "search": {"trials": len(results), "max_rounds": args.max_rounds, "early_stopping": args.early_stopping},
+    }
+    manifest = export(pickle_path, args.artifact_dir, args.data, activate=not args.no_activate,
+                      training={k: training[k] for k in ("data", "best")})
+    timings["export_s"] = round(time.perf_counter() - start, 3)
+
+    from fast_inference import CompiledScorer
+    artifact_path = os.path.join(args.artifact_dir, manifest["version"])
+    scorer = CompiledScorer.load(artifact_path)
+    test_report["latency"]["artifact_single_row"] = latency(scorer.score_one, latency_rows)
+
+    report = {
+        "version": manifest["version"],
+        "pickle": pickle_path,
+        "artifact": artifact_path,
+        "activated": not args.no_activate,
+        "timings": timings,
+        "test": test_report,
+        **training,
+    }
+    with open(os.path.join(artifact_path, "report.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    logger.info("Test AUROC %.4f, Brier %.4f; single-row latency p50 %.2fms (pipeline) / %.2fms (artifact)",
+                test_report["auroc"], test_report["brier"],
+                test_report["latency"]["pipeline_single_row"]["p50_ms"],
+                test_report["latency"]["artifact_single_row"]["p50_ms"])
+    logger.info("Exported %s in %.1fs total%s", artifact_path, sum(timings.values()),
+                "" if args.no_activate else ", now the default model")
+
+
+if __name__ == "__main__":
+    main()
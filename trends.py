@@ -0,0 +1,88 @@
+# trends.py - downsampled vitals, labs and score history of one visit for charting
+#
+# Postgres averages each series per time bucket (queries.TREND_SQL, BUCKETS_PER_POINT
+# buckets per point of the budget), then Largest-Triangle-Three-Buckets picks
+# the points that keep the curve's shape (spikes and drops survive, flat
+# stretches thin out). Whatever the length of stay, a series transfers at most
+# points * BUCKETS_PER_POINT rows and charts at most points points, as
+# column-oriented NumPy arrays.
+
+import numpy as np
+
+from queries import TREND_SQL
+
+# Series accepted by fetch_trends: Vitals/Labs column or 'score', with chart labels
+TREND_SERIES = {
+    "score": "Risk score",
+    "hr": "Heart rate (bpm)",
+    "map": "MAP (mm Hg)",
+    "sbp": "Systolic BP (mm Hg)",
+    "dbp": "Diastolic BP (mm Hg)",
+    "resp": "Respiration rate (breaths/min)",
+    "o2sat": "O2 saturation (%)",
+    "temp": "Temperature (°C)",
+    "wbc": "WBC",
+    "creatinine": "Creatinine",
+    "bilirubin_total": "Total bilirubin",
+    "platelets": "Platelets",
+    "lactate": "Lactate",
+}
+DEFAULT_POINTS = 200
+BUCKETS_PER_POINT = 4
+
+
+def lttb(x, y, n):
+    """
+    Indices of the n points of (x, y) chosen by Largest-Triangle-Three-Buckets.
+    x must be increasing. The first and last points are always kept; every
+    index is returned if there are no more than n points.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n - 2 buckets between the fixed end points, one point chosen from each
+    edges = np.linspace(1, size - 1, n - 1).astype(np.intp)
+    chosen = np.empty(n, dtype=np.intp)
+    chosen[0], chosen[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 3 < n else (size - 1, size)
+        cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        # Twice the area of the triangle (previous point, candidate, next bucket's mean)
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        chosen[i + 1] = a
+    return chosen
+
+
+def fetch_trends(cur, visit_id, series, points=DEFAULT_POINTS):
+    """
+    Trend of each of series (TREND_SERIES keys) for visit_id, as
+    {series: (times, values)} with times a datetime64[us] array and values a
+    float64 array of at most points elements. Series without observations are
+    left out.
+    """
+    unknown = set(series) - TREND_SERIES.keys()
+    if unknown:
+        raise ValueError(f"Unknown trend series: {', '.join(sorted(unknown))}")
+    cur.execute(TREND_SQL, {
+        "visit_id": visit_id, "series": list(series), "buckets": points * BUCKETS_PER_POINT,
+    })
+    rows = cur.fetchall()
+    if not rows:
+        return {}
+    names = np.array([row[0] for row in rows])
+    times = np.array([row[1] for row in rows], dtype="datetime64[us]")
+    values = np.array([row[2] for row in rows], dtype=np.float64)
+    # Rows come ordered by series, so each series is one contiguous slice
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+    trends = {}
+    for start, end in zip(starts, ends):
+        t, y = times[start:end], values[start:end]
+        keep = lttb(t.astype(np.int64), y, points)
+        trends[str(names[start])] = (t[keep], y[keep])
+    return trends